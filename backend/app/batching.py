@@ -0,0 +1,135 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.executor import ClassificationExecutor, ExecutorSaturated
+from app.pipeline import classify_messages
+
+class MicroBatcher:
+    """Collects concurrent single-message requests into vectorized batches.
+    
+    Messages are buffered until max_batch_size are waiting or the oldest one
+    has waited max_wait_ms, then scored with one classify_messages call on
+    the executor and the results are fanned back out to the callers. In
+    adaptive mode a message that arrives while no batch is running is sent
+    right away, so batches only form while the workers are busy and an idle
+    server adds no waiting time.
+    
+    At most max_waiting messages (by default the executor's max_queue, or
+    one full batch if that is larger) wait for a batch; more are rejected
+    with ExecutorSaturated at submit. While the executor is full, batches
+    are held back rather than sent to be rejected as a whole, and a batch
+    the executor turns away goes back to the front of the queue.
+    """
+    
+    def __init__(self, executor: ClassificationExecutor, max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, adaptive: bool = True, max_waiting: Optional[int] = None):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.adaptive = adaptive
+        self.max_waiting = max_waiting if max_waiting is not None else max(executor.max_queue, max_batch_size)
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer = None
+        self._in_flight = 0
+        
+        # Metrics
+        self._batches = 0
+        self._messages = 0
+        self._queue_delay_total = 0.0
+        self._queue_delay_max = 0.0
+        self._rejected = 0
+    
+    async def submit(self, message: str) -> Tuple[Dict, Dict]:
+        """Classify one message as part of a batch, returning (rule_result, ml_result)"""
+        if len(self._pending) >= self.max_waiting:
+            self._rejected += 1
+            raise ExecutorSaturated(f"Batch queue is full ({len(self._pending)} waiting)")
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future, time.perf_counter()))
+        
+        if len(self._pending) >= self.max_batch_size or (self.adaptive and self._in_flight == 0):
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """Dispatch everything that is waiting as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        
+        # Hold the batch until the executor has room for it
+        if self.executor.saturated or self._in_flight >= self.executor.capacity:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_ms / 1000, self._flush)
+            return
+        
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+        
+        # Record how long messages waited and how full the batch was
+        now = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            delay = now - enqueued_at
+            self._queue_delay_total += delay
+            self._queue_delay_max = max(self._queue_delay_max, delay)
+        self._batches += 1
+        self._messages += len(batch)
+        
+        self._in_flight += 1
+        asyncio.ensure_future(self._run_batch(batch))
+        
+        # Leftovers beyond one full batch go out with the next flush
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_ms / 1000, self._flush)
+    
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        """Score a batch on the executor and resolve the waiting futures"""
+        try:
+            results = await self.executor.run(classify_messages, [message for message, _, _ in batch])
+        except ExecutorSaturated:
+            # Other callers filled the executor first: wait for room again
+            self._pending[:0] = batch
+            self._batches -= 1
+            self._messages -= len(batch)
+            if self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait_ms / 1000, self._flush)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            # Messages that gathered while this batch ran can go now
+            if self.adaptive and self._pending and self._in_flight == 0:
+                self._flush()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batch fill rate and queueing delay statistics"""
+        batches = max(self._batches, 1)
+        messages = max(self._messages, 1)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "adaptive": self.adaptive,
+            "batches": self._batches,
+            "messages": self._messages,
+            "waiting": len(self._pending),
+            "max_waiting": self.max_waiting,
+            "rejected": self._rejected,
+            "in_flight_batches": self._in_flight,
+            "avg_batch_size": self._messages / batches,
+            "batch_fill_rate": self._messages / batches / self.max_batch_size,
+            "avg_queue_delay_ms": self._queue_delay_total / messages * 1000,
+            "max_queue_delay_ms": self._queue_delay_max * 1000
+        }
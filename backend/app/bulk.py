@@ -0,0 +1,359 @@
+import argparse
+import csv
+import email
+import email.policy
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.pipeline import classify_messages, final_verdict, init_worker
+
+INPUT_FORMATS = ('jsonl', 'csv', 'mbox')
+OUTPUT_FORMATS = ('jsonl', 'parquet')
+
+# A record is (id, message text); readers yield it with the input byte
+# offset just past the record, or None where offsets are not tracked (CSV)
+Record = Tuple[Any, str]
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+
+# Skipped records reported one by one before only their count is
+_MAX_REPORTED_SKIPS = 10
+
+def _infer_format(path: str, formats: Tuple[str, ...], default: str) -> str:
+    """Format named by the file extension, if it is one of formats"""
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    extension = {'ndjson': 'jsonl', 'json': 'jsonl', 'mbx': 'mbox', 'pq': 'parquet'}.get(extension, extension)
+    return extension if extension in formats else default
+
+def read_jsonl(path: str, field: str, id_field: Optional[str], offset: int = 0,
+               on_error: Optional[Callable[[int, str], None]] = None) -> Iterator[Tuple[Record, int]]:
+    """One JSON object per line; the message is in field.
+    
+    Lines that are not a JSON object are passed to on_error(byte offset,
+    reason) and skipped, or raise ValueError without it.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                error = f"invalid JSON ({e})"
+            else:
+                if isinstance(record, dict):
+                    yield (record.get(id_field) if id_field else None, str(record.get(field) or '')), offset
+                    continue
+                error = f"expected a JSON object, got {type(record).__name__}"
+            if on_error is None:
+                raise ValueError(f"Line at byte offset {line_offset} of {path}: {error}")
+            on_error(line_offset, error)
+
+def read_csv(path: str, field: str, id_field: Optional[str]) -> Iterator[Tuple[Record, None]]:
+    """CSV with a header row; the message is in the field column"""
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield (row.get(id_field) if id_field else None, row.get(field) or ''), None
+
+def _mbox_text(raw: bytes) -> Record:
+    """Message-ID and subject plus text body of one mbox message"""
+    message = email.message_from_bytes(raw, policy=email.policy.default)
+    body = ''
+    try:
+        part = message.get_body(preferencelist=('plain', 'html'))
+        if part is not None:
+            body = part.get_content()
+            if part.get_content_type() == 'text/html':
+                body = _HTML_TAG.sub(' ', body)
+    except (LookupError, ValueError, KeyError):
+        # Unknown charsets and broken MIME structure: keep the subject only
+        body = ''
+    subject = str(message.get('subject', '') or '')
+    return message.get('message-id'), f"{subject}\n{body}" if subject else body
+
+def read_mbox(path: str, offset: int = 0) -> Iterator[Tuple[Record, int]]:
+    """Messages of an mbox file, parsed one at a time as the file is read"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        lines: List[bytes] = []
+        for line in f:
+            # A "From " line starts the next message; resume would seek here
+            if line.startswith(b'From ') and lines:
+                yield _mbox_text(b''.join(lines[1:])), offset
+                lines = []
+            lines.append(line)
+            offset += len(line)
+        if lines:
+            yield _mbox_text(b''.join(lines[1:])), offset
+
+def _chunks(records: Iterator[Tuple[Record, Optional[int]]], chunk_size: int,
+            first_record: int) -> Iterator[Tuple[int, List[Record], Optional[int]]]:
+    """Group records into (first record number, records, input offset after them)"""
+    chunk: List[Record] = []
+    offset = None
+    number = first_record
+    for record, offset in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield number, chunk, offset
+            number += len(chunk)
+            chunk = []
+    if chunk:
+        yield number, chunk, offset
+
+def score_chunk(first_record: int, records: List[Record]) -> List[Dict[str, Any]]:
+    """Classify one chunk (in a worker process) and build its output rows"""
+    results = classify_messages([message for _, message in records])
+    rows = []
+    for number, ((record_id, _), (rule_result, ml_result)) in enumerate(zip(records, results), first_record):
+        classification, confidence = final_verdict(rule_result, ml_result)
+        rows.append({
+            'record': number,
+            'id': None if record_id is None else str(record_id),
+            'classification': classification,
+            'confidence': round(confidence, 3),
+            'rule_confidence': rule_result['confidence'],
+            'ml_confidence': float(ml_result['confidence']),
+            'triggered_rules': [detail['rule_name'] for detail in rule_result.get('rule_details', [])],
+            'campaign_id': ml_result.get('campaign_id')
+        })
+    return rows
+
+class JsonlWriter:
+    """Append rows to a JSONL file; its byte size is the resume position"""
+    
+    def __init__(self, path: str, position: Optional[Dict] = None):
+        self.file = open(path, 'ab')
+        # Drop whatever was written after the last checkpoint
+        self.file.truncate(position['output_bytes'] if position else 0)
+        self.file.seek(0, os.SEEK_END)
+    
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        self.file.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode('utf-8'))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return True
+    
+    def position(self) -> Dict:
+        return {'output_bytes': self.file.tell()}
+    
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Rows as numbered Parquet part files, rotated every rows_per_file rows.
+    
+    A part file is only readable once closed, so a part is the unit of
+    resumption: write() returns True when rows up to this point are durable.
+    """
+    
+    def __init__(self, directory: str, position: Optional[Dict] = None, rows_per_file: int = 100000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet output requires the pyarrow package")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        # Fixed rather than inferred: a chunk may have no triggered rules or campaigns at all
+        self._schema = pyarrow.schema([
+            ('record', pyarrow.int64()),
+            ('id', pyarrow.string()),
+            ('classification', pyarrow.string()),
+            ('confidence', pyarrow.float64()),
+            ('rule_confidence', pyarrow.float64()),
+            ('ml_confidence', pyarrow.float64()),
+            ('triggered_rules', pyarrow.list_(pyarrow.string())),
+            ('campaign_id', pyarrow.string())
+        ])
+        
+        self.directory = directory
+        self.rows_per_file = rows_per_file
+        self.parts = position['parts'] if position else 0
+        os.makedirs(directory, exist_ok=True)
+        
+        # Parts past the checkpoint are incomplete or will be rewritten
+        for name in os.listdir(directory):
+            if name.startswith('part-') and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(directory, name))
+        
+        self._writer = None
+        self._rows = 0
+    
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        table = self._pa.Table.from_pylist(rows, schema=self._schema)
+        if self._writer is None:
+            path = os.path.join(self.directory, f"part-{self.parts:05d}.parquet")
+            self._writer = self._pq.ParquetWriter(path, self._schema)
+        self._writer.write_table(table)
+        self._rows += len(rows)
+        if self._rows < self.rows_per_file:
+            return False
+        self._close_part()
+        return True
+    
+    def _close_part(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._rows = 0
+            self.parts += 1
+    
+    def position(self) -> Dict:
+        return {'parts': self.parts}
+    
+    def close(self) -> bool:
+        self._close_part()
+        return True
+
+def _load_checkpoint(path: str, input_path: str) -> Dict:
+    """Checkpoint left by an earlier run over the same input"""
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['input'] != os.path.abspath(input_path):
+        raise ValueError(f"Checkpoint {path} belongs to {checkpoint['input']}")
+    return checkpoint
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    """Write the checkpoint atomically"""
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+def _scored_chunks(chunks, workers: int) -> Iterator[Tuple[List[Dict[str, Any]], int, Optional[int]]]:
+    """Score chunks in input order, with at most 2 * workers chunks in flight"""
+    # One model for the whole run: workers do not follow registry updates
+    if workers <= 1:
+        init_worker(watch_registry=False)
+        for first_record, records, offset in chunks:
+            yield score_chunk(first_record, records), len(records), offset
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(False,)) as pool:
+        pending = deque()
+        try:
+            for first_record, records, offset in chunks:
+                pending.append((pool.submit(score_chunk, first_record, records), len(records), offset))
+                if len(pending) >= 2 * workers:
+                    future, count, chunk_offset = pending.popleft()
+                    yield future.result(), count, chunk_offset
+            while pending:
+                future, count, chunk_offset = pending.popleft()
+                yield future.result(), count, chunk_offset
+        finally:
+            for future, _, _ in pending:
+                future.cancel()
+
+def run(args) -> int:
+    """Score the input archive, returning the number of records scored in this run"""
+    input_format = args.input_format or _infer_format(args.input, INPUT_FORMATS, 'jsonl')
+    output_format = args.output_format or _infer_format(args.output, OUTPUT_FORMATS, 'jsonl')
+    checkpoint_path = args.checkpoint or args.output.rstrip('/') + '.checkpoint'
+    
+    checkpoint = None
+    if args.resume and os.path.exists(checkpoint_path):
+        checkpoint = _load_checkpoint(checkpoint_path, args.input)
+        print(f"Resuming after record {checkpoint['records']}", file=sys.stderr)
+    records_done = checkpoint['records'] if checkpoint else 0
+    input_offset = checkpoint.get('input_offset') if checkpoint else None
+    skipped = 0
+    
+    def skip(offset: int, reason: str):
+        """Report a malformed record and go on with the next one"""
+        nonlocal skipped
+        skipped += 1
+        if skipped <= _MAX_REPORTED_SKIPS:
+            print(f"Skipping record at byte offset {offset}: {reason}", file=sys.stderr)
+        if skipped == _MAX_REPORTED_SKIPS:
+            print("Not reporting further skipped records", file=sys.stderr)
+    
+    # Line-based inputs seek straight to the checkpoint; CSV skips records
+    if input_format == 'jsonl':
+        records = read_jsonl(args.input, args.field, args.id_field, input_offset or 0, on_error=skip)
+    elif input_format == 'mbox':
+        records = read_mbox(args.input, input_offset or 0)
+    else:
+        records = read_csv(args.input, args.field, args.id_field)
+        for _ in range(records_done):
+            next(records, None)
+    
+    if output_format == 'parquet':
+        writer = ParquetWriter(args.output, checkpoint and checkpoint['output'], args.rows_per_file)
+    else:
+        writer = JsonlWriter(args.output, checkpoint and checkpoint['output'])
+    
+    start = time.perf_counter()
+    last_report = start
+    scored = 0
+    # Input position of the rows written but not yet durable (Parquet parts)
+    pending_records, pending_offset = records_done, input_offset
+    
+    def save(durable_records, durable_offset):
+        _save_checkpoint(checkpoint_path, {
+            'input': os.path.abspath(args.input),
+            'input_format': input_format,
+            'records': durable_records,
+            'input_offset': durable_offset,
+            'output': writer.position()
+        })
+    
+    try:
+        for rows, count, offset in _scored_chunks(_chunks(records, args.chunk_size, records_done), args.workers):
+            pending_records += count
+            pending_offset = offset
+            scored += count
+            if writer.write(rows):
+                save(pending_records, pending_offset)
+            
+            now = time.perf_counter()
+            if now - last_report >= args.progress_interval:
+                print(f"{pending_records} records, {scored / (now - start):.0f} msg/s", file=sys.stderr)
+                last_report = now
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun with --resume to continue from {checkpoint_path}", file=sys.stderr)
+        raise
+    finally:
+        if writer.close():
+            save(pending_records, pending_offset)
+    
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} records in {elapsed:.1f} s ({scored / max(elapsed, 1e-9):.0f} msg/s), "
+          f"{pending_records} in total" + (f", {skipped} malformed records skipped" if skipped else ""),
+          file=sys.stderr)
+    return scored
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a message archive with the rules engine and ML model")
+    parser.add_argument('input', help="JSONL, CSV or mbox file")
+    parser.add_argument('output', help="JSONL file or Parquet directory")
+    parser.add_argument('--input-format', choices=INPUT_FORMATS, help="default: from the file extension")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, help="default: from the file extension")
+    parser.add_argument('--field', default='message', help="message field of JSONL/CSV records")
+    parser.add_argument('--id-field', help="record id field of JSONL/CSV records")
+    parser.add_argument('--chunk-size', type=int, default=500, help="messages per scoring task")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="scoring processes")
+    parser.add_argument('--rows-per-file', type=int, default=100000, help="rows per Parquet part file")
+    parser.add_argument('--checkpoint', help="default: <output>.checkpoint")
+    parser.add_argument('--resume', action='store_true', help="continue after the last checkpoint")
+    parser.add_argument('--progress-interval', type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+    
+    try:
+        run(args)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
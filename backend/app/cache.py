@@ -0,0 +1,177 @@
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app import config
+
+def content_key(namespace: str, version: str, text: str) -> str:
+    """Cache key for a normalized text under a given model or rule set version"""
+    digest = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+    return f"{namespace}:{version}:{digest}"
+
+class MemoryCacheStore:
+    """In-process LRU store with per-entry expiry"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str, now: float) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: Any, expires_at: float) -> int:
+        """Store a value, returning the number of evicted entries"""
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SqliteCacheStore:
+    """On-disk LRU store shared by every worker process on the machine"""
+    
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets = 0
+        
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, expires_at REAL, accessed_at REAL, value BLOB)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+        connection.commit()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL mode lets processes read concurrently"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+    
+    def get(self, key: str, now: float) -> Optional[Any]:
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT expires_at, value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[0] <= now:
+            connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[1])
+    
+    def set(self, key: str, value: Any, expires_at: float) -> int:
+        """Store a value, returning the number of evicted entries"""
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO results (key, expires_at, accessed_at, value) VALUES (?, ?, ?, ?)",
+            (key, expires_at, time.time(), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        )
+        
+        # Trimming needs a COUNT, so only do it every so often
+        self._sets += 1
+        if self._sets % 100:
+            return 0
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return 0
+        connection.execute(
+            "DELETE FROM results WHERE key IN "
+            "(SELECT key FROM results ORDER BY accessed_at LIMIT ?)", (excess,)
+        )
+        return excess
+    
+    def clear(self):
+        self._connection().execute("DELETE FROM results")
+    
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+class ResultCache:
+    """Size-bounded LRU cache of classification results with TTL expiry.
+    
+    Keys are built with content_key from the normalized message text plus
+    the version of whatever produced the result, so retraining or reloading
+    the model, or changing the rule set, makes old entries unreachable and
+    they age out on their own.
+    """
+    
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.store = SqliteCacheStore(path, max_entries) if path else MemoryCacheStore(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a cached result, or None on a miss"""
+        value = self.store.get(key, time.time())
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+    
+    def set(self, key: str, value: Any):
+        """Store a result until it expires or is evicted"""
+        self.evictions += self.store.set(key, value, time.time() + self.ttl_seconds)
+    
+    def clear(self):
+        """Drop every cached result"""
+        self.store.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and size"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.store).__name__,
+            "entries": len(self.store),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+def cache_from_config() -> Optional[ResultCache]:
+    """Build the result cache described by the SPAMGUARD_CACHE_* settings"""
+    if config.CACHE_MAX_ENTRIES <= 0:
+        return None
+    return ResultCache(
+        max_entries=config.CACHE_MAX_ENTRIES,
+        ttl_seconds=config.CACHE_TTL_SECONDS,
+        path=config.CACHE_PATH
+    )
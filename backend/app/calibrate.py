@@ -0,0 +1,150 @@
+import argparse
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app import config
+from app.ml.cascade import Cascade, calibrate_band
+from app.ml.classifier import SpamClassifier
+from app.ml.rules import RulesEngine
+from app.ml.text import normalize_message
+from app.pipeline import classifier_from_config, final_verdict, rule_engine_from_config
+from app.train import is_holdout, read_examples
+
+# Agreement targets swept for the accuracy/latency report
+SWEEP_TARGETS = (1.0, 0.999, 0.995, 0.99, 0.98, 0.95)
+
+# Messages per model call, as the API's micro-batches and streams score them
+BATCH_SIZE = 256
+
+def _batches(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def score_stages(classifier: SpamClassifier, rule_engine: RulesEngine,
+                 messages: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, float]]:
+    """Rule confidence, Naive Bayes and forest probability of every message, and each stage's ms/message"""
+    normalized = [normalize_message(message) for message in messages]
+    processed = [text.processed for text in normalized]
+    seconds = {'rules': 0.0, 'nb': 0.0, 'forest': 0.0}
+    nb_probs, rf_probs = [], []
+    
+    start = time.perf_counter()
+    rule_confidences = [rule_engine.analyze_cleaned(text.cleaned)['confidence'] for text in normalized]
+    seconds['rules'] = time.perf_counter() - start
+    
+    for batch in _batches(processed, BATCH_SIZE):
+        # Features are part of the cheap stage; only the forest needs them stacked
+        start = time.perf_counter()
+        X_text, X_additional = classifier._build_feature_blocks(batch)
+        nb_probs.append(classifier.predict_nb_proba(X_text, X_additional)[:, 1])
+        seconds['nb'] += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        rf_probs.append(classifier.predict_forest_proba(classifier._stack_features(X_text, X_additional))[:, 1])
+        seconds['forest'] += time.perf_counter() - start
+    
+    stage_ms = {stage: total * 1000 / len(messages) for stage, total in seconds.items()}
+    return np.array(rule_confidences), np.concatenate(nb_probs), np.concatenate(rf_probs), stage_ms
+
+def _verdicts(rule_confidences: np.ndarray, ml_confidences: np.ndarray) -> np.ndarray:
+    return np.array([final_verdict({'confidence': rule}, {'confidence': ml})[0]
+                     for rule, ml in zip(rule_confidences, ml_confidences)])
+
+def calibrate(classifier: SpamClassifier, rule_engine: RulesEngine, messages: List[str], labels: List[int],
+              target_agreement: float = 0.995) -> Cascade:
+    """Calibrate the cascade band on labeled validation messages.
+    
+    The band is the narrowest one for which the cascade's final verdicts
+    agree with the full ensemble's on at least target_agreement of the
+    messages. The report records the accuracy/latency trade-off at a sweep
+    of agreement targets.
+    """
+    if not messages:
+        raise ValueError("Calibration needs validation messages")
+    if not 0 < target_agreement <= 1:
+        raise ValueError("The agreement target must be in (0, 1]")
+    
+    rule_confidences, nb_probs, rf_probs, stage_ms = score_stages(classifier, rule_engine, messages)
+    truth = np.where(np.array(labels) == 1, 'spam', 'ham')
+    full = _verdicts(rule_confidences, (nb_probs + rf_probs) / 2)
+    on_exit = _verdicts(rule_confidences, nb_probs)
+    disagrees = on_exit != full
+    
+    def tradeoff(target: float) -> Dict[str, Any]:
+        max_disagreements = int(np.floor((1 - target) * len(messages) + 1e-9))
+        nb_low, nb_high = calibrate_band(nb_probs, disagrees, max_disagreements)
+        exits = (nb_probs <= nb_low) | (nb_probs >= nb_high)
+        verdicts = np.where(exits, on_exit, full)
+        forest_fraction = 1 - exits.mean()
+        return {
+            'target_agreement': target,
+            'nb_band': [nb_low, nb_high],
+            'nb_exit_rate': round(float(exits.mean()), 4),
+            'agreement': round(float((verdicts == full).mean()), 4),
+            'accuracy': round(float((verdicts == truth).mean()), 4),
+            'ms_per_message': round(stage_ms['rules'] + stage_ms['nb'] + forest_fraction * stage_ms['forest'], 4)
+        }
+    
+    chosen = tradeoff(target_agreement)
+    report = {
+        'messages': len(messages),
+        'stage_ms': {stage: round(ms, 4) for stage, ms in stage_ms.items()},
+        'full_ensemble': {
+            'accuracy': round(float((full == truth).mean()), 4),
+            'ms_per_message': round(sum(stage_ms.values()), 4)
+        },
+        'chosen': chosen,
+        'tradeoff': [tradeoff(target) for target in sorted(set(SWEEP_TARGETS) | {target_agreement}, reverse=True)]
+    }
+    return Cascade(chosen['nb_band'][0], chosen['nb_band'][1], classifier.model_version, report)
+
+def print_report(report: Dict[str, Any]):
+    """Print the stage costs and accuracy/latency trade-off of a calibration"""
+    stage_ms = report['stage_ms']
+    print(f"Validation messages: {report['messages']}")
+    print(f"Stage cost (ms/message): rules {stage_ms['rules']:.4f}, features + naive bayes {stage_ms['nb']:.4f}, "
+          f"forest {stage_ms['forest']:.4f}")
+    full = report['full_ensemble']
+    print(f"Full ensemble: accuracy {full['accuracy']:.4f}, {full['ms_per_message']:.4f} ms/message")
+    print(f"{'target':>8} {'nb band':>23} {'nb exits':>9} {'agreement':>10} {'accuracy':>9} {'ms/msg':>8}")
+    for row in report['tradeoff']:
+        band = f"({row['nb_band'][0]:.4f}, {row['nb_band'][1]:.4f})"
+        marker = ' *' if row == report['chosen'] else ''
+        print(f"{row['target_agreement']:>8} {band:>23} {row['nb_exit_rate']:>9.2%} {row['agreement']:>10.4f} "
+              f"{row['accuracy']:>9.4f} {row['ms_per_message']:>8.4f}{marker}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the early-exit cascade on a labeled validation set")
+    parser.add_argument('validation', help="JSONL or CSV file of labeled messages the model was not trained on")
+    parser.add_argument('--field', default='message', help="message field")
+    parser.add_argument('--label-field', default='label', help="label field: spam/ham, 1/0 or true/false")
+    parser.add_argument('--holdout', type=float,
+                        help="only use this held-out fraction (the training corpus split of python -m app.train)")
+    parser.add_argument('--target-agreement', type=float, default=0.995,
+                        help="fraction of final verdicts that must match the full ensemble's")
+    parser.add_argument('--output', default=config.CASCADE_PATH or os.path.join(config.BASE_DIR, "models", "cascade.json"),
+                        help="where to write the thresholds (serve them with SPAMGUARD_CASCADE)")
+    args = parser.parse_args()
+    
+    examples = read_examples(args.validation, args.field, args.label_field)
+    if args.holdout is not None:
+        examples = ((label, message) for label, message in examples if is_holdout(message, args.holdout))
+    labels, messages = [], []
+    for label, message in examples:
+        labels.append(label)
+        messages.append(message)
+    
+    try:
+        cascade = calibrate(classifier_from_config(), rule_engine_from_config(), messages, labels,
+                            args.target_agreement)
+    except ValueError as e:
+        parser.error(str(e))
+    print_report(cascade.report)
+    cascade.save(args.output)
+    print(f"Saved cascade band ({cascade.nb_low:.4f}, {cascade.nb_high:.4f}) to {args.output}")
+
+if __name__ == "__main__":
+    main()
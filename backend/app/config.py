@@ -0,0 +1,113 @@
+import os
+
+# backend/ directory, so model paths do not depend on the working directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment"""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+def _env_str(name: str, default: str) -> str:
+    """Read a string setting from the environment"""
+    return os.getenv(name) or default
+
+# Maximum number of messages accepted by /api/classify/batch
+MAX_BATCH_SIZE = _env_int("SPAMGUARD_MAX_BATCH_SIZE", 1000)
+
+# /api/classify/stream: messages per internal batch, batches classified at
+# once (so at most (in flight + 1) * batch size messages are held), and the
+# longest accepted NDJSON line
+STREAM_BATCH_SIZE = _env_int("SPAMGUARD_STREAM_BATCH_SIZE", 256)
+STREAM_MAX_IN_FLIGHT = _env_int("SPAMGUARD_STREAM_IN_FLIGHT", 2)
+STREAM_MAX_LINE_BYTES = _env_int("SPAMGUARD_STREAM_MAX_LINE", 1024 * 1024)
+
+# Where classification runs: "inline" (on the event loop), "thread" or "process"
+EXECUTOR_BACKEND = _env_str("SPAMGUARD_EXECUTOR", "thread")
+
+# Number of pool workers and how many extra calls may wait before returning 503
+EXECUTOR_WORKERS = _env_int("SPAMGUARD_WORKERS", os.cpu_count() or 1)
+EXECUTOR_MAX_QUEUE = _env_int("SPAMGUARD_MAX_QUEUE", 64)
+
+# Micro-batching of single-message /api/classify requests (size 1 disables it)
+MICROBATCH_MAX_SIZE = _env_int("SPAMGUARD_MICROBATCH_SIZE", 32)
+MICROBATCH_MAX_WAIT_MS = _env_int("SPAMGUARD_MICROBATCH_WAIT_MS", 2)
+
+# Result cache for repeated message bodies (size 0 disables it). Setting a
+# path stores entries in a SQLite file shared by all worker processes.
+CACHE_MAX_ENTRIES = _env_int("SPAMGUARD_CACHE_SIZE", 10000)
+CACHE_TTL_SECONDS = _env_int("SPAMGUARD_CACHE_TTL", 300)
+CACHE_PATH = os.getenv("SPAMGUARD_CACHE_PATH")
+
+# Near-duplicate (MinHash/LSH) reuse of confident verdicts (size 0 disables it)
+LSH_MAX_ENTRIES = _env_int("SPAMGUARD_LSH_SIZE", 50000)
+LSH_TTL_SECONDS = _env_int("SPAMGUARD_LSH_TTL", 3600)
+LSH_THRESHOLD = _env_float("SPAMGUARD_LSH_THRESHOLD", 0.8)
+LSH_MIN_CONFIDENCE = _env_float("SPAMGUARD_LSH_MIN_CONFIDENCE", 0.9)
+
+# User spam/ham reports (/api/feedback): recent reports kept (0 disables
+# feedback), seconds between Naive Bayes updates, and how many new reports
+# trigger replacing the forest's oldest trees with trees grown on them
+FEEDBACK_BUFFER_SIZE = _env_int("SPAMGUARD_FEEDBACK_BUFFER", 5000)
+FEEDBACK_INTERVAL_SECONDS = _env_float("SPAMGUARD_FEEDBACK_INTERVAL", 5.0)
+FEEDBACK_REFRESH_AFTER = _env_int("SPAMGUARD_FEEDBACK_REFRESH_AFTER", 500)
+FEEDBACK_REFRESH_TREES = _env_int("SPAMGUARD_FEEDBACK_TREES", 10)
+
+# With a model registry, each feedback update is published to it as a new
+# version (so every process picks it up and it survives restarts); this many
+# of those versions are kept. Publishing writes the whole model, so raise
+# SPAMGUARD_FEEDBACK_INTERVAL for large models.
+FEEDBACK_KEEP_VERSIONS = _env_int("SPAMGUARD_FEEDBACK_KEEP_VERSIONS", 5)
+
+# Pickled model, served unless a model registry has a current version
+MODEL_PATH = _env_str("SPAMGUARD_MODEL_PATH", os.path.join(BASE_DIR, "models", "spam_classifier.pkl"))
+
+# Directory of a memory-mapped model (python -m app.ml.artifact) to serve
+# instead of the pickle
+MODEL_ARRAYS_DIR = os.getenv("SPAMGUARD_MODEL_ARRAYS")
+
+# Versioned model registry (python -m app.ml.registry), off unless set; its
+# current version is served when there is one. Processes poll it every
+# MODEL_WATCH_SECONDS (0 turns the watch off; /api/admin/models/reload still
+# works) and swap in newly activated versions.
+MODEL_REGISTRY_DIR = os.getenv("SPAMGUARD_MODEL_REGISTRY")
+MODEL_WATCH_SECONDS = _env_float("SPAMGUARD_MODEL_WATCH", 2.0)
+
+# Random forest batches are scored by the flat node-array engine while
+# rows x mean leaf depth stays within this budget, and by sklearn's
+# compiled trees beyond it (pickled models only; same probabilities)
+FLAT_FOREST_MAX_WORK = _env_int("SPAMGUARD_FLAT_FOREST_MAX_WORK", 4000)
+
+# Calibrated cascade thresholds (python -m app.calibrate): when set, the
+# random forest only scores messages Naive Bayes is unsure about
+CASCADE_PATH = os.getenv("SPAMGUARD_CASCADE")
+
+# Prefork serving (python -m app.serve): worker processes forked from the
+# parent holding the loaded model, whether each is pinned to one CPU, and
+# seconds between per-worker memory reports (0 turns them off)
+SERVE_WORKERS = _env_int("SPAMGUARD_SERVE_WORKERS", os.cpu_count() or 1)
+SERVE_PIN_CPUS = bool(_env_int("SPAMGUARD_SERVE_PIN_CPUS", 1))
+SERVE_MEMORY_REPORT_SECONDS = _env_float("SPAMGUARD_SERVE_MEMORY_REPORT", 60.0)
+
+# Rules engine limits for untrusted text: characters of a message scanned
+# at all, chunk size of longer scans, the time one rule may spend on one
+# message, and after how many overruns a rule is disabled (0 only flags it)
+RULES_MAX_SCAN_CHARS = _env_int("SPAMGUARD_RULES_MAX_SCAN", 100_000)
+RULES_CHUNK_CHARS = _env_int("SPAMGUARD_RULES_CHUNK", 8192)
+RULES_MATCH_BUDGET_MS = _env_float("SPAMGUARD_RULES_BUDGET_MS", 5.0)
+RULES_DISABLE_AFTER = _env_int("SPAMGUARD_RULES_DISABLE_AFTER", 0)
+
+# Longest session accepted by /api/admin/profile, in seconds
+PROFILE_MAX_SECONDS = _env_float("SPAMGUARD_PROFILE_MAX_SECONDS", 60.0)
+
+# Token expected in the X-Admin-Token header of /api/admin endpoints (unset disables them)
+ADMIN_TOKEN = os.getenv("SPAMGUARD_ADMIN_TOKEN")
+
+# Text featurizer used when a model is trained from scratch: "tfidf" (fitted
+# vocabulary) or "hashing" (fixed-size hashed terms, no vocabulary)
+FEATURIZER = _env_str("SPAMGUARD_FEATURIZER", "tfidf")
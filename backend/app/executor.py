@@ -0,0 +1,91 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.pipeline import get_metrics, get_profiler, init_worker, run_instrumented
+
+BACKENDS = ("inline", "thread", "process")
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor has no room left for more work"""
+
+class ClassificationExecutor:
+    """Runs CPU-bound classification work away from the event loop.
+    
+    Work goes to a thread pool or to a process pool whose workers each hold
+    pre-loaded models. At most max_workers + max_queue calls are admitted at
+    once; anything beyond that is rejected with ExecutorSaturated instead of
+    queueing without bound, so callers can shed load early.
+    """
+    
+    def __init__(self, backend: str = "thread", max_workers: int = 4, max_queue: int = 64):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown executor backend '{backend}', expected one of {BACKENDS}")
+        
+        self.backend = backend
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool: Optional[Executor] = None
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        
+        if backend == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="classify")
+        elif backend == "process":
+            self._pool = ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker)
+    
+    @property
+    def capacity(self) -> int:
+        """Maximum number of calls admitted at the same time"""
+        return self.max_workers + self.max_queue
+    
+    @property
+    def saturated(self) -> bool:
+        """Whether a call made now would be rejected"""
+        return self._pool is not None and self._pending >= self.capacity
+    
+    async def run(self, func: Callable, *args) -> Any:
+        """Run func(*args) on the pool, or raise ExecutorSaturated when full"""
+        if self._pool is None:
+            return func(*args)
+        
+        # Only touched from the event loop thread, so a plain counter is enough
+        if self.saturated:
+            self._rejected += 1
+            raise ExecutorSaturated(
+                f"Classification queue is full ({self._pending} pending)"
+            )
+        
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if self.backend != "process":
+                return await loop.run_in_executor(self._pool, func, *args)
+            
+            # Workers record metrics and profile samples in their own process; bring them back with the result
+            profiler = get_profiler()
+            result, metrics, samples = await loop.run_in_executor(self._pool, run_instrumented, profiler.session(),
+                                                                  func, *args)
+            get_metrics().merge(metrics)
+            profiler.merge(samples)
+            return result
+        finally:
+            self._pending -= 1
+            self._completed += 1
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue and throughput statistics"""
+        return {
+            "backend": self.backend,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected
+        }
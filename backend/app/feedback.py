@@ -0,0 +1,207 @@
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app.ml.classifier import SpamClassifier
+from app.ml.registry import ModelReloader
+from app.pipeline import get_classifier, set_classifier
+
+# Failed updates in a row after which the queued reports are dropped
+MAX_UPDATE_ATTEMPTS = 3
+
+class FeedbackLearner:
+    """Learns from user spam/ham reports while the current model keeps serving.
+    
+    Reports are queued and applied by a background thread every
+    interval_seconds: Naive Bayes is updated online with each batch of
+    reports, and once refresh_after reports have arrived since the last
+    refresh the forest's trees_per_refresh oldest trees are replaced by new
+    ones trained on the buffer of recent reports. Every update is built on
+    a copy of the model and swapped in with one assignment, so requests
+    never wait for training and each one sees a single consistent model.
+    
+    With a registry reloader, every update is built on the registry's
+    current version and published as a new version: the watchers of all
+    processes serving the registry load it, and it survives restarts.
+    Only the newest keep_versions of these versions are kept.
+    """
+    
+    def __init__(self, buffer_size: int = 5000, interval_seconds: float = 5.0,
+                 refresh_after: int = 500, trees_per_refresh: int = 10,
+                 reloader: Optional[ModelReloader] = None, keep_versions: int = 5):
+        self.buffer_size = buffer_size
+        self.interval_seconds = interval_seconds
+        self.refresh_after = refresh_after
+        self.trees_per_refresh = trees_per_refresh
+        self.reloader = reloader
+        self.keep_versions = keep_versions
+        
+        # Reports not applied yet; the oldest are dropped (and counted) if updates fall behind
+        self._pending = deque(maxlen=buffer_size)
+        # Recent applied reports: the training set of new trees
+        self._recent = deque(maxlen=buffer_size)
+        self._since_refresh = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        
+        # Metrics
+        self._received = 0
+        self._applied = 0
+        self._dropped = 0
+        self._nb_updates = 0
+        self._forest_refreshes = 0
+        self._published = 0
+        self._publish_conflicts = 0
+        self._last_error = None
+        self._failed_updates = 0
+        self._failures_in_row = 0
+        self._last_update_seconds = 0.0
+    
+    def submit(self, messages: List[str], labels: List[int]) -> int:
+        """Queue labeled reports (1 for spam, 0 for ham), returning how many are pending"""
+        if len(messages) != len(labels):
+            raise ValueError("Got a different number of messages and labels")
+        if any(label not in (0, 1) for label in labels):
+            raise ValueError("Labels must be 1 (spam) or 0 (ham)")
+        
+        with self._lock:
+            self._dropped += max(len(self._pending) + len(messages) - self.buffer_size, 0)
+            self._pending.extend(zip(messages, labels))
+            self._received += len(messages)
+            pending = len(self._pending)
+        
+        if pending >= self.refresh_after:
+            self._wakeup.set()
+        return pending
+    
+    def start(self):
+        """Start the background update thread"""
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="feedback", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the background thread after its current update"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval_seconds)
+            self._wakeup.clear()
+            self.apply_pending()
+    
+    def apply_pending(self) -> bool:
+        """Apply queued reports to a copy of the model and swap it in; True if there were any"""
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+        if not batch:
+            return False
+        
+        messages = [message for message, _ in batch]
+        labels = [label for _, label in batch]
+        start = time.perf_counter()
+        try:
+            current = get_classifier()
+            # Another process may have published a newer version; learn on top of it
+            base = self.reloader.registry.current_version() if self.reloader is not None else None
+            if base is not None and base != current.model_version:
+                self.reloader.reload(base)
+                current = get_classifier()
+            model = current.updated(messages, labels)
+            
+            recent = (list(self._recent) + batch)[-self.buffer_size:]
+            since_refresh = self._since_refresh + len(batch)
+            refreshed = False
+            if since_refresh >= self.refresh_after and len({label for _, label in recent}) > 1:
+                model.rf_classifier = model.refreshed_forest(
+                    [message for message, _ in recent], [label for _, label in recent], self.trees_per_refresh
+                )
+                refreshed = True
+            
+            # A model swapped in by someone else meanwhile wins; reapply the reports to it next time
+            if get_classifier() is not current:
+                self._requeue(batch)
+                return True
+            
+            if self.reloader is None:
+                set_classifier(model)
+            elif self._publish(model, current.model_version, base):
+                self.reloader.install(model)
+            else:
+                # Another process published first; reapply the reports to its version next time
+                self._publish_conflicts += 1
+                self._requeue(batch)
+                return True
+            
+            self._recent.extend(batch)
+            self._since_refresh = 0 if refreshed else since_refresh
+            self._applied += len(batch)
+            self._nb_updates += 1
+            self._forest_refreshes += int(refreshed)
+            self._last_error = None
+            self._failures_in_row = 0
+        except Exception as e:
+            # Retried with the next update, in case the failure was transient (e.g. a registry write)
+            self._last_error = str(e)
+            self._failed_updates += 1
+            self._failures_in_row += 1
+            if self._failures_in_row < MAX_UPDATE_ATTEMPTS:
+                self._requeue(batch)
+            else:
+                print(f"Error applying feedback, dropping {len(batch)} reports after "
+                      f"{self._failures_in_row} failed updates: {e}")
+                self._failures_in_row = 0
+                with self._lock:
+                    self._dropped += len(batch)
+        
+        self._last_update_seconds = time.perf_counter() - start
+        return True
+    
+    def _publish(self, model: SpamClassifier, parent: str, base: Optional[str]) -> bool:
+        """Publish an updated model and activate it if base is still the registry's current version"""
+        registry = self.reloader.registry
+        model.model_version = uuid.uuid4().hex
+        version = registry.publish(model.model_data(), parent=parent)
+        if not registry.activate_if_current(version, base):
+            registry.remove(version)
+            return False
+        
+        self._published += 1
+        registry.prune_derived(self.keep_versions)
+        return True
+    
+    def _requeue(self, batch: List):
+        """Put reports back in front of the queue, dropping the oldest of them if it is full"""
+        with self._lock:
+            room = self.buffer_size - len(self._pending)
+            kept = batch[len(batch) - room:] if room > 0 else []
+            self._dropped += len(batch) - len(kept)
+            self._pending.extendleft(reversed(kept))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get report and update statistics"""
+        return {
+            "received": self._received,
+            "pending": len(self._pending),
+            "applied": self._applied,
+            "dropped": self._dropped,
+            "buffered": len(self._recent),
+            "nb_updates": self._nb_updates,
+            "forest_refreshes": self._forest_refreshes,
+            "published": self._published,
+            "publish_conflicts": self._publish_conflicts,
+            "reports_until_refresh": max(self.refresh_after - self._since_refresh, 0),
+            "last_update_ms": round(self._last_update_seconds * 1000, 2),
+            "failed_updates": self._failed_updates,
+            "last_error": self._last_error
+        }
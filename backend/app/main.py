@@ -1,14 +1,38 @@
-from fastapi import FastAPI, HTTPException
+if __name__ == "__main__":
+    # python -m app.main serves through app.serve (python -m app.serve for options).
+    # Replace this process before anything below is loaded: app.serve imports this
+    # module as app.main, and a second copy here would stay resident in every worker.
+    # For development with auto-reload run: uvicorn app.main:app --reload
+    import os
+    import sys
+    os.execv(sys.executable, [sys.executable, "-m", "app.serve", *sys.argv[1:]])
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Dict, Optional, List, Any
-import uvicorn
+from typing import Dict, Optional, List, Any, AsyncIterator, Tuple
+import asyncio
+import hmac
+import json
+import os
+import time
+from collections import deque
 from datetime import datetime
 
 # Import our modules
-from app.ml.classifier import SpamClassifier
-from app.ml.rules import RulesEngine
+from app import config
+from app.batching import MicroBatcher
+from app.cache import cache_from_config
+from app.executor import ClassificationExecutor, ExecutorSaturated
+from app.feedback import FeedbackLearner
+from app.metrics import process_memory, render_stats
+from app.profiler import format_collapsed
+from app.pipeline import (cascade_from_config, classifier_from_config, classify_messages, final_verdict, get_cache,
+                          get_cascade, get_classifier, get_lsh, get_metrics, get_profiler,
+                          lsh_from_config, reloader_from_config, rule_engine_from_config, set_components)
+from app.streaming import BodyStreamingResponse, LineTooLong, ndjson_lines, parse_stream_line
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -27,8 +51,38 @@ app.add_middleware(
 )
 
 # Initialize components
-spam_classifier = SpamClassifier()
-rule_engine = RulesEngine()
+spam_classifier = classifier_from_config()
+rule_engine = rule_engine_from_config()
+set_components(spam_classifier, rule_engine, cache_from_config(), lsh_from_config(),
+               cascade_from_config(spam_classifier))
+
+# New registry versions are loaded in the background and swapped in
+reloader = reloader_from_config()
+
+# CPU-bound classification runs on a worker pool, not on the event loop
+executor = ClassificationExecutor(
+    backend=config.EXECUTOR_BACKEND,
+    max_workers=config.EXECUTOR_WORKERS,
+    max_queue=config.EXECUTOR_MAX_QUEUE
+)
+
+# Concurrent single-message requests are scored together in small batches
+batcher = MicroBatcher(
+    executor,
+    max_batch_size=config.MICROBATCH_MAX_SIZE,
+    max_wait_ms=config.MICROBATCH_MAX_WAIT_MS
+) if config.MICROBATCH_MAX_SIZE > 1 else None
+
+# User reports update the model in the background and swap it in (publishing
+# it to the registry, when there is one, for every process to load)
+learner = FeedbackLearner(
+    buffer_size=config.FEEDBACK_BUFFER_SIZE,
+    interval_seconds=config.FEEDBACK_INTERVAL_SECONDS,
+    refresh_after=config.FEEDBACK_REFRESH_AFTER,
+    trees_per_refresh=config.FEEDBACK_REFRESH_TREES,
+    reloader=reloader,
+    keep_versions=config.FEEDBACK_KEEP_VERSIONS
+) if config.FEEDBACK_BUFFER_SIZE > 0 else None
 
 # Pydantic models
 class MessageRequest(BaseModel):
@@ -41,6 +95,88 @@ class ClassificationResponse(BaseModel):
     processing_time: int
     details: Optional[Dict[str, Any]] = {}
 
+class BatchMessageRequest(BaseModel):
+    messages: List[str]
+    options: Optional[Dict[str, Any]] = {}
+
+class BatchClassificationResponse(BaseModel):
+    results: List[ClassificationResponse]
+    processing_time: int
+
+class FeedbackRequest(BaseModel):
+    messages: List[str]
+    labels: List[int]  # 1 for spam, 0 for ham
+
+class ReloadRequest(BaseModel):
+    version: Optional[str] = None  # default: the registry's current version
+
+class ProfileRequest(BaseModel):
+    seconds: float = 10.0
+    request_fraction: float = 1.0  # share of classification calls sampled
+    interval_ms: float = 5.0
+
+def build_response(rule_result: Dict, ml_result: Dict, processing_time: int,
+                   include_details: bool) -> ClassificationResponse:
+    """Combine rule and ML results into a classification response"""
+    classification, final_confidence = final_verdict(rule_result, ml_result)
+    
+    # Extract triggered rules for the response
+    triggered_rules = [detail["rule_name"] for detail in rule_result.get('rule_details', [])]
+    
+    return ClassificationResponse(
+        classification=classification,
+        confidence=round(final_confidence, 3),
+        processing_time=processing_time,
+        details={
+            "rule_details": rule_result.get('rule_details', []),
+            "ml_confidence": ml_result['confidence'],
+            "triggered_rules": triggered_rules,
+            "campaign_id": ml_result.get('campaign_id'),
+            "ml_stage": ml_result.get('stage')
+        } if include_details else {}
+    )
+
+def build_responses(batch_results: List[Tuple[Dict, Dict]], processing_time: int,
+                    include_details: bool) -> List[ClassificationResponse]:
+    """Build the responses of a classified batch, timing the 'response' stage"""
+    start = time.perf_counter()
+    responses = [
+        build_response(rule_result, ml_result, processing_time, include_details)
+        for rule_result, ml_result in batch_results
+    ]
+    get_metrics().observe_stage('response', time.perf_counter() - start)
+    return responses
+
+def elapsed_ms(start: float) -> int:
+    """Whole milliseconds since a time.perf_counter() reading"""
+    return int((time.perf_counter() - start) * 1000)
+
+def saturated_error(error: ExecutorSaturated) -> HTTPException:
+    """503 response telling the client to back off and retry"""
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": "1"})
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only with the configured admin token"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set SPAMGUARD_ADMIN_TOKEN)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.on_event("startup")
+async def start_learner():
+    if learner is not None:
+        learner.start()
+    if reloader is not None:
+        reloader.start()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    executor.shutdown(wait=False)
+    if learner is not None:
+        learner.stop()
+    if reloader is not None:
+        reloader.stop()
+
 @app.get("/")
 async def root():
     return {"message": "SpamGuard API is running", "version": "1.0.0"}
@@ -49,51 +185,254 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/api/stats")
+async def get_stats():
+    """Runtime statistics of the serving components"""
+    return {
+        "executor": executor.get_stats(),
+        "batcher": batcher.get_stats() if batcher is not None else None,
+        "cache": get_cache().get_stats() if get_cache() is not None else None,
+        "near_duplicates": get_lsh().get_stats() if get_lsh() is not None else None,
+        "cascade": get_cascade().get_stats() if get_cascade() is not None else None,
+        "rules": rule_engine.get_statistics(),
+        "process": {"pid": os.getpid(), **process_memory()},
+        "feedback": learner.get_stats() if learner is not None else None,
+        "model": {
+            "version": get_classifier().model_version,
+            **(reloader.get_stats() if reloader is not None else {})
+        }
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latency histograms, rule hits and component statistics in Prometheus text format"""
+    lines = get_metrics().render()
+    lines += render_stats("executor", executor.get_stats())
+    lines += render_stats("batcher", batcher.get_stats() if batcher is not None else None)
+    lines += render_stats("cache", get_cache().get_stats() if get_cache() is not None else None)
+    lines += render_stats("near_duplicates", get_lsh().get_stats() if get_lsh() is not None else None)
+    lines += render_stats("cascade", get_cascade().get_stats() if get_cascade() is not None else None)
+    lines += render_stats("feedback", learner.get_stats() if learner is not None else None)
+    lines += render_stats("process", process_memory())
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/api/classify", response_model=ClassificationResponse)
 async def classify_message(request: MessageRequest):
     """Main endpoint for message classification"""
     try:
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
-        # Rule-based classification
-        rule_result = rule_engine.analyze_message(request.message)
-        
-        # ML classification
-        ml_result = spam_classifier.predict(request.message)
+        # Rule-based and ML classification on the worker pool
+        if batcher is not None:
+            result = await batcher.submit(request.message)
+        else:
+            [result] = await executor.run(classify_messages, [request.message])
         
-        # Combine results
-        final_confidence = (rule_result['confidence'] + ml_result['confidence']) / 2
+        [response] = build_responses([result], elapsed_ms(start_time), request.options.get("include_details", False))
+        get_metrics().observe_request("classify", time.perf_counter() - start_time)
+        return response
+    
+    except ExecutorSaturated as e:
+        raise saturated_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Classification error: {str(e)}")
+
+@app.post("/api/classify/batch", response_model=BatchClassificationResponse)
+async def classify_batch(request: BatchMessageRequest):
+    """Classify many messages in one request, results in input order"""
+    if len(request.messages) > config.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.messages)} messages (max {config.MAX_BATCH_SIZE})"
+        )
+    
+    try:
+        start_time = time.perf_counter()
         
-        if final_confidence > 0.7:
-            classification = "spam"
-        elif final_confidence < 0.3:
-            classification = "ham"
-        else:
-            classification = "uncertain"
+        # Rule-based and ML classification of the whole batch on the worker pool
+        batch_results = await executor.run(classify_messages, request.messages)
         
         # Calculate processing time
-        processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
-        
-        # Extract triggered rules for the response
-        triggered_rules = [detail["rule_name"] for detail in rule_result.get('rule_details', [])]
+        processing_time = elapsed_ms(start_time)
         
-        # Prepare response
-        response = ClassificationResponse(
-            classification=classification,
-            confidence=round(final_confidence, 3),
-            processing_time=processing_time,
-            details={
-                "rule_details": rule_result.get('rule_details', []),
-                "ml_confidence": ml_result['confidence'],
-                "triggered_rules": triggered_rules
-            } if request.options.get("include_details", False) else {}
+        results = build_responses(batch_results, processing_time, request.options.get("include_details", False))
+        get_metrics().observe_request("classify_batch", time.perf_counter() - start_time)
+        return BatchClassificationResponse(results=results, processing_time=processing_time)
+    
+    except ExecutorSaturated as e:
+        raise saturated_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Classification error: {str(e)}")
+
+@app.post("/api/feedback", status_code=202)
+async def submit_feedback(request: FeedbackRequest):
+    """Report messages as spam (1) or ham (0); the model learns from them in the background"""
+    if learner is None:
+        raise HTTPException(status_code=404, detail="Feedback is disabled")
+    if len(request.messages) > config.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.messages)} messages (max {config.MAX_BATCH_SIZE})"
         )
+    
+    try:
+        pending = learner.submit(request.messages, request.labels)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"accepted": len(request.messages), "pending": pending}
+
+@app.get("/api/admin/models", dependencies=[Depends(require_admin)])
+async def list_models():
+    """Published registry versions and the one being served"""
+    if reloader is None:
+        raise HTTPException(status_code=404, detail="No model registry configured")
+    return {"versions": reloader.registry.versions(), **reloader.get_stats()}
+
+@app.post("/api/admin/models/reload", dependencies=[Depends(require_admin)])
+async def reload_model(request: ReloadRequest):
+    """Activate a registry version (default: reload the current one) and swap it in without downtime"""
+    if reloader is None:
+        raise HTTPException(status_code=404, detail="No model registry configured")
+    
+    previous = get_classifier().model_version
+    try:
+        # Process pool workers follow the registry's current version on their own
+        if request.version is not None:
+            await asyncio.to_thread(reloader.registry.verify, request.version)
+            reloader.registry.activate(request.version)
         
-        return response
+        # Loaded on a thread; requests keep being served by the old model meanwhile
+        version = await asyncio.to_thread(reloader.reload, request.version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"version": version, "previous_version": previous, "load_ms": reloader.get_stats()["last_load_ms"]}
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(request: ProfileRequest):
+    """Sample classification stacks for a while and return them as a collapsed-stack file.
+    
+    The file feeds flamegraph.pl, speedscope or inferno directly. Calls on
+    process pool workers are sampled in the workers and merged in.
+    """
+    if not 0 < request.seconds <= config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400,
+                            detail=f"seconds must be in (0, {config.PROFILE_MAX_SECONDS:g}], got {request.seconds:g}")
+    
+    profiler = get_profiler()
+    try:
+        if not profiler.start(request.seconds, request.request_fraction, request.interval_ms / 1000):
+            raise HTTPException(status_code=409, detail="A profile is already running")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        await asyncio.sleep(request.seconds)
+    finally:
+        await asyncio.to_thread(profiler.stop)
+    
+    samples = profiler.drain()
+    filename = f"spamguard-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return Response(format_collapsed(samples), media_type="text/plain; charset=utf-8", headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Profile-Samples": str(sum(samples.values()))
+    })
+
+async def classify_stream_batch(entries: List[Tuple[int, Any, Optional[str], Optional[str]]],
+                                include_details: bool) -> bytes:
+    """Classify one batch of a stream, returning its NDJSON result lines in input order.
+    
+    Entries are (line number, id, message, error); lines that failed to parse
+    carry an error instead of a message and are reported as such.
+    """
+    messages = [message for _, _, message, error in entries if error is None]
+    start_time = time.perf_counter()
+    
+    batch_results = []
+    batch_error = None
+    if messages:
+        try:
+            # A stream cannot be answered with 503 midway: wait for room instead,
+            # which also stops reading the request body until the workers catch up
+            while True:
+                try:
+                    batch_results = await executor.run(classify_messages, messages)
+                    break
+                except ExecutorSaturated:
+                    await asyncio.sleep(0.01)
+        except Exception as e:
+            batch_error = f"Classification error: {str(e)}"
+    
+    processing_time = elapsed_ms(start_time)
+    
+    lines = []
+    results = iter(build_responses(batch_results, processing_time, include_details))
+    for line_number, message_id, message, error in entries:
+        result = {"line": line_number}
+        if message_id is not None:
+            result["id"] = message_id
+        if error is None:
+            error = batch_error
+        if error is not None:
+            result["error"] = error
+        else:
+            result.update(next(results).model_dump())
+        lines.append(json.dumps(result) + "\n")
+    get_metrics().observe_request("classify_stream_batch", time.perf_counter() - start_time)
+    return "".join(lines).encode("utf-8")
+
+async def classify_stream_results(request: Request, include_details: bool) -> AsyncIterator[bytes]:
+    """Read NDJSON messages from the request body, yielding result lines batch by batch.
+    
+    At most STREAM_MAX_IN_FLIGHT batches are being classified while the next
+    one is read, so the server holds a bounded window of messages however
+    long the stream is.
+    """
+    in_flight = deque()
+    entries = []
+    line_number = 0
+    try:
+        try:
+            async for line in ndjson_lines(request.stream(), config.STREAM_MAX_LINE_BYTES):
+                line_number += 1
+                if not line.strip():
+                    continue
+                try:
+                    message_id, message = parse_stream_line(line)
+                    entries.append((line_number, message_id, message, None))
+                except ValueError as e:
+                    entries.append((line_number, None, None, f"Invalid line: {str(e)}"))
+                
+                if len(entries) >= config.STREAM_BATCH_SIZE:
+                    in_flight.append(asyncio.ensure_future(classify_stream_batch(entries, include_details)))
+                    entries = []
+                    if len(in_flight) >= config.STREAM_MAX_IN_FLIGHT:
+                        yield await in_flight.popleft()
+            stream_error = None
+        except LineTooLong as e:
+            # No way to resynchronize on a line we did not keep: report and stop
+            stream_error = json.dumps({"line": line_number + 1, "error": str(e)}) + "\n"
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Classification error: {str(e)}")
+        if entries:
+            in_flight.append(asyncio.ensure_future(classify_stream_batch(entries, include_details)))
+        while in_flight:
+            yield await in_flight.popleft()
+        if stream_error is not None:
+            yield stream_error.encode("utf-8")
+    finally:
+        # Client went away: drop work nobody will read
+        for task in in_flight:
+            task.cancel()
 
-if __name__ == "__main__":
-    # Run the server
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+@app.post("/api/classify/stream")
+async def classify_stream(request: Request, include_details: bool = False):
+    """Classify a stream of NDJSON messages, streaming back one NDJSON result per line.
+    
+    Each request line is {"message": "...", "id": ...} (id optional) or a
+    bare JSON string. Each result line carries the request line number and
+    id plus the classification, or an error for lines that could not be
+    processed. Results are written as soon as their batch is classified.
+    """
+    return BodyStreamingResponse(classify_stream_results(request, include_details),
+                                 media_type="application/x-ndjson")
@@ -0,0 +1,183 @@
+import bisect
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets: tens of
+# microseconds for a cached rule lookup up to seconds for a large batch
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Timed stages, in the order a message goes through them
+STAGES = ('preprocess', 'rules', 'near_duplicates', 'vectorize', 'nb', 'rf', 'response')
+
+class Histogram:
+    """Fixed-bucket histogram: observing is one bisect and two additions"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+    
+    def merge(self, counts: List[int], total: float):
+        """Add the observations of another histogram with the same buckets"""
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+        self.sum += total
+    
+    def render(self, name: str, labels: str) -> List[str]:
+        """Prometheus text samples: cumulative buckets, sum and count"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum!r}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+class ServingMetrics:
+    """Stage and request latency histograms and rule hit counters of one process.
+    
+    Timings are taken with time.perf_counter by the code being measured and
+    handed in as seconds. Process pool workers keep their own instance and
+    ship it to the API process with drain(), which merges it into its own.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._requests: Dict[str, Histogram] = {}
+        self._rule_hits: Dict[str, int] = {}
+        self._messages = 0
+    
+    def observe_stage(self, stage: str, seconds: float):
+        """Record the time one call spent in a pipeline stage"""
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram()
+            histogram.observe(seconds)
+    
+    def observe_stages(self, timings: Dict[str, float]):
+        """Record several stage timings of one call"""
+        for stage, seconds in timings.items():
+            self.observe_stage(stage, seconds)
+    
+    def observe_request(self, endpoint: str, seconds: float):
+        """Record the end-to-end time of one API request"""
+        with self._lock:
+            histogram = self._requests.get(endpoint)
+            if histogram is None:
+                histogram = self._requests[endpoint] = Histogram()
+            histogram.observe(seconds)
+    
+    def count_rule_hits(self, rule_results: Iterable[Dict]):
+        """Count classified messages and the rules each of them matched"""
+        with self._lock:
+            for result in rule_results:
+                self._messages += 1
+                for name in result['matched_rules']:
+                    self._rule_hits[name] = self._rule_hits.get(name, 0) + 1
+    
+    def drain(self) -> Dict[str, Any]:
+        """Everything recorded since the last drain, as plain data, and start over"""
+        with self._lock:
+            snapshot = {
+                'stages': {stage: (h.counts, h.sum) for stage, h in self._stages.items()},
+                'requests': {endpoint: (h.counts, h.sum) for endpoint, h in self._requests.items()},
+                'rule_hits': self._rule_hits,
+                'messages': self._messages
+            }
+            self._stages, self._requests, self._rule_hits, self._messages = {}, {}, {}, 0
+        return snapshot
+    
+    def merge(self, snapshot: Dict[str, Any]):
+        """Add a snapshot taken with drain() in another process"""
+        with self._lock:
+            for target, histograms in ((self._stages, snapshot['stages']), (self._requests, snapshot['requests'])):
+                for key, (counts, total) in histograms.items():
+                    if key not in target:
+                        target[key] = Histogram()
+                    target[key].merge(counts, total)
+            for name, hits in snapshot['rule_hits'].items():
+                self._rule_hits[name] = self._rule_hits.get(name, 0) + hits
+            self._messages += snapshot['messages']
+    
+    def render(self) -> List[str]:
+        """Prometheus text exposition of the histograms and counters"""
+        with self._lock:
+            lines = [
+                "# HELP spamguard_stage_seconds Time one classification call spent in each stage",
+                "# TYPE spamguard_stage_seconds histogram"
+            ]
+            # Pipeline stages first, in order, then anything else that was timed
+            for stage in sorted(self._stages, key=lambda s: (STAGES.index(s) if s in STAGES else len(STAGES), s)):
+                lines += self._stages[stage].render("spamguard_stage_seconds", f'stage="{stage}"')
+            
+            lines += [
+                "# HELP spamguard_request_seconds End-to-end time of classification requests",
+                "# TYPE spamguard_request_seconds histogram"
+            ]
+            for endpoint in sorted(self._requests):
+                lines += self._requests[endpoint].render("spamguard_request_seconds", f'endpoint="{endpoint}"')
+            
+            lines += [
+                "# HELP spamguard_messages_total Messages run through the rules engine",
+                "# TYPE spamguard_messages_total counter",
+                f"spamguard_messages_total {self._messages}",
+                "# HELP spamguard_rule_hits_total Messages matched by each rule",
+                "# TYPE spamguard_rule_hits_total counter"
+            ]
+            lines += [f'spamguard_rule_hits_total{{rule="{_escape(name)}"}} {hits}'
+                      for name, hits in sorted(self._rule_hits.items())]
+        return lines
+
+def render_stats(component: str, stats: Optional[Dict[str, Any]]) -> List[str]:
+    """Numeric fields of a get_stats() dict as Prometheus gauges.
+    
+    Nested dicts of numbers (e.g. cascade exits per stage) become one gauge
+    labelled by key; strings and lists are left out.
+    """
+    lines = []
+    for field, value in (stats or {}).items():
+        name = f"spamguard_{component}_{field}"
+        if isinstance(value, dict):
+            samples = [(f'{{key="{_escape(str(key))}"}}', item) for key, item in value.items()
+                       if isinstance(item, (int, float))]
+        elif isinstance(value, (int, float)):
+            samples = [('', value)]
+        else:
+            continue
+        if samples:
+            lines.append(f"# TYPE {name} gauge")
+            lines += [f"{name}{labels} {float(sample)!r}" for labels, sample in samples]
+    return lines
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """Resident, proportional, shared and private memory of a process in MB (Linux; empty elsewhere).
+    
+    PSS splits every shared page between the processes mapping it, so the
+    PSS of forked workers adds up to what they really use together.
+    """
+    fields = {'Rss': 'rss_mb', 'Pss': 'pss_mb', 'Shared_Clean': 'shared_mb', 'Shared_Dirty': 'shared_mb',
+              'Private_Clean': 'private_mb', 'Private_Dirty': 'private_mb'}
+    memory = {}
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    key = fields[name]
+                    memory[key] = memory.get(key, 0.0) + int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        return {}
+    return {key: round(value, 1) for key, value in memory.items()}
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,320 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from collections.abc import Mapping
+from itertools import chain
+from typing import Dict, Iterator, List
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+from app.ml.forest import FlatForest
+from app.ml.hashing import HashingTfidfVectorizer
+from app.ml.text import weight_counts
+
+# A model directory holds meta.json plus one .npy file per array: vocabulary
+# (or hashed document frequencies), IDF vector, Naive Bayes counts and
+# log-probabilities and the forest node arrays and traversal tables. Arrays
+# are opened with np.load(mmap_mode='r'), so loading is a few file opens and
+# every process serving the directory shares the pages through the OS page
+# cache. A saved model directory is a symlink to a hidden sibling holding the
+# files, switched in one step when the model is replaced (save_model_arrays).
+# Convert an existing pickle with:
+#
+#     python -m app.ml.artifact models/spam_classifier.pkl models/spam_classifier
+FORMAT_VERSION = 1
+
+# Seconds a replaced model directory is kept before save_model_arrays deletes it
+RETIRED_GRACE_SECONDS = 60.0
+
+# Vectorizer settings that only matter while fitting the vocabulary
+_FIT_ONLY_PARAMS = ('vocabulary', 'max_features', 'min_df', 'max_df', 'dtype')
+
+# MultinomialNB attributes stored as arrays
+_NB_ARRAYS = ('classes_', 'class_count_', 'feature_count_', 'feature_log_prob_', 'class_log_prior_')
+
+class MappedVocabulary(Mapping):
+    """Read-only term -> column mapping backed by sorted term arrays"""
+    
+    def __init__(self, terms: np.ndarray, columns: np.ndarray):
+        self.terms = terms
+        self.columns = columns
+    
+    def __getitem__(self, term: str) -> int:
+        position = int(np.searchsorted(self.terms, term))
+        if position < len(self.terms) and self.terms[position] == term:
+            return int(self.columns[position])
+        raise KeyError(term)
+    
+    def __iter__(self) -> Iterator[str]:
+        return (str(term) for term in self.terms)
+    
+    def __len__(self) -> int:
+        return len(self.terms)
+
+class MappedTfidfVectorizer:
+    """TF-IDF transform over memory-mapped vocabulary and IDF arrays.
+    
+    Produces exactly what the fitted TfidfVectorizer it was exported from
+    returns, but looks tokens up with a vectorized binary search over the
+    sorted terms instead of a Python dict holding every term.
+    """
+    
+    def __init__(self, params: Dict, dtype: str, terms: np.ndarray, columns: np.ndarray,
+                 feature_names: np.ndarray, idf: np.ndarray):
+        self.params = params
+        self.dtype = np.dtype(dtype)
+        self.terms = terms
+        self.columns = columns
+        self.feature_names = feature_names
+        self.idf_ = idf
+        self.vocabulary_ = MappedVocabulary(terms, columns)
+        self._template = TfidfVectorizer(**params)
+        self._analyze = self._template.build_analyzer()
+    
+    def get_params(self) -> Dict:
+        return dict(self.params)
+    
+    def build_analyzer(self):
+        return self._analyze
+    
+    def analyzer_template(self) -> TfidfVectorizer:
+        """Unfitted vectorizer with the same analyzer settings"""
+        return self._template
+    
+    def get_feature_names_out(self) -> np.ndarray:
+        return self.feature_names
+    
+    def transform(self, raw_documents: List[str]) -> sparse.csr_matrix:
+        """Transform documents to the TF-IDF matrix"""
+        return self.transform_tokens([self._analyze(doc) for doc in raw_documents])
+    
+    def transform_tokens(self, tokens: List[List[str]]) -> sparse.csr_matrix:
+        """Transform already-analyzed documents to the TF-IDF matrix"""
+        n_documents = len(tokens)
+        n_features = len(self.feature_names)
+        
+        # Look every token up in one searchsorted call
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=n_documents)
+        rows = np.repeat(np.arange(n_documents, dtype=np.int64), lengths)
+        flat = list(chain.from_iterable(tokens))
+        
+        # Terms are fixed-width: longer tokens cannot be in the vocabulary
+        fits = np.fromiter(map(len, flat), dtype=np.int64, count=len(flat)) <= self.terms.dtype.itemsize // 4
+        query = np.array([token for token, ok in zip(flat, fits) if ok], dtype=self.terms.dtype)
+        rows = rows[fits]
+        
+        if len(self.terms) and len(query):
+            positions = np.minimum(np.searchsorted(self.terms, query), len(self.terms) - 1)
+            known = self.terms[positions] == query
+            columns = self.columns[positions[known]].astype(np.int64)
+            rows = rows[known]
+        else:
+            columns = np.zeros(0, dtype=np.int64)
+            rows = np.zeros(0, dtype=np.int64)
+        
+        # Term counts per (document, column), already in sorted CSR order
+        cells, counts = np.unique(rows * n_features + columns, return_counts=True)
+        indptr = np.zeros(n_documents + 1, dtype=np.int32)
+        np.cumsum(np.bincount(cells // n_features, minlength=n_documents), out=indptr[1:])
+        X = sparse.csr_matrix(
+            (counts.astype(self.dtype), (cells % n_features).astype(np.int32), indptr),
+            shape=(n_documents, n_features)
+        )
+        
+        return weight_counts(X, self.idf_, self.params.get('binary', False), self.params.get('sublinear_tf', False),
+                             self.params.get('use_idf', True), self.params.get('norm', 'l2'))
+
+def _vectorizer_params(vectorizer) -> Dict:
+    """JSON-serializable analyzer settings of a fitted vectorizer"""
+    params = {
+        name: list(value) if isinstance(value, tuple) else value
+        for name, value in vectorizer.get_params().items()
+        if name not in _FIT_ONLY_PARAMS
+    }
+    try:
+        json.dumps(params)
+    except TypeError:
+        raise ValueError("Vectorizers with callable analyzers, tokenizers or preprocessors cannot be exported")
+    return params
+
+def _save(directory: str, name: str, array: np.ndarray):
+    """Write one array next to its final name and move it into place, so no file is ever left half written"""
+    path = os.path.join(directory, name + '.npy')
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(path + '.tmp', path)
+
+def export_model(model_data: Dict, directory: str):
+    """Write the model components (as stored in the pickle) as flat arrays into a new or empty directory.
+    
+    Use save_model_arrays to replace a model that processes may be loading.
+    """
+    vectorizer = model_data['vectorizer']
+    nb_classifier = model_data['nb_classifier']
+    rf_classifier = model_data['rf_classifier']
+    if not model_data.get('is_trained'):
+        raise ValueError("Only trained models can be exported")
+    if os.path.isdir(directory) and os.listdir(directory):
+        raise ValueError(f"Model directory {directory} is not empty")
+    
+    os.makedirs(directory, exist_ok=True)
+    
+    if isinstance(vectorizer, HashingTfidfVectorizer):
+        # Hashed features need only the document frequencies, no vocabulary
+        featurizer = 'hashing'
+        vectorizer_params = {
+            name: list(value) if isinstance(value, tuple) else value
+            for name, value in vectorizer.get_params().items()
+        }
+        _save(directory, 'df', vectorizer.df_)
+        _save(directory, 'idf', vectorizer.idf_)
+    else:
+        # Vocabulary as sorted terms plus column indexes, and terms in column order
+        featurizer = 'tfidf'
+        vectorizer_params = _vectorizer_params(vectorizer)
+        feature_names = np.asarray(vectorizer.get_feature_names_out(), dtype=str)
+        order = np.argsort(feature_names, kind='stable')
+        _save(directory, 'feature_names', feature_names)
+        _save(directory, 'terms', feature_names[order])
+        _save(directory, 'term_columns', order.astype(np.int32))
+        _save(directory, 'idf', vectorizer.idf_)
+    
+    for name in _NB_ARRAYS:
+        _save(directory, 'nb_' + name.rstrip('_'), getattr(nb_classifier, name))
+    
+    forest = rf_classifier if isinstance(rf_classifier, FlatForest) else FlatForest.from_sklearn(rf_classifier)
+    for name, array in forest.to_arrays().items():
+        _save(directory, 'forest_' + name, array)
+    
+    # meta.json goes last so a directory is only usable once it is complete
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'model_version': model_data.get('model_version'),
+        'featurizer': featurizer,
+        'vectorizer': vectorizer_params,
+        'vectorizer_dtype': np.dtype(getattr(vectorizer, 'dtype', np.float64)).name,
+        'nb_params': nb_classifier.get_params(),
+        'n_features': int(forest.n_features_in_),
+        'n_documents': int(getattr(vectorizer, 'n_documents_', 0))
+    }
+    meta_path = os.path.join(directory, 'meta.json')
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + '.tmp', meta_path)
+
+def save_model_arrays(model_data: Dict, path: str):
+    """Save a model as the array directory path, replacing the model there in one step.
+    
+    path is a symlink to a hidden sibling directory. The model is exported
+    to a fresh sibling and the link replaced with one rename, so readers see
+    the old or the new model, never a mix of their files. The previous
+    directory is kept for readers still loading it; older ones are deleted
+    once they have been out of use for RETIRED_GRACE_SECONDS.
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        if os.listdir(path):
+            raise ValueError(f"{path} is a model directory saved in place; move it aside to save a new model there")
+        os.rmdir(path)
+    
+    parent, name = os.path.split(path)
+    prefix = f'.{name}-'
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=prefix, dir=parent)
+    try:
+        export_model(model_data, staging)
+        os.chmod(staging, 0o755)
+        os.symlink(os.path.basename(staging), staging + '.link')
+        os.replace(staging + '.link', path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        if os.path.lexists(staging + '.link'):
+            os.remove(staging + '.link')
+        raise
+    
+    # Older directories were replaced when previous was written; give readers time to finish with them
+    if previous is not None and time.time() - os.path.getmtime(previous) < RETIRED_GRACE_SECONDS:
+        return
+    for entry in os.listdir(parent):
+        directory = os.path.join(parent, entry)
+        if entry.startswith(prefix) and directory not in (staging, previous) and not os.path.islink(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+
+def load_model_arrays(directory: str) -> Dict:
+    """Memory-map a model directory into the same components as the pickle"""
+    # Resolved once, so a model saved meanwhile cannot mix into this one
+    directory = os.path.realpath(directory)
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format version: {meta.get('format_version')}")
+    
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(directory, name + '.npy'), mmap_mode='r', allow_pickle=False)
+    
+    params = dict(meta['vectorizer'])
+    params['ngram_range'] = tuple(params['ngram_range'])
+    if meta.get('featurizer') == 'hashing':
+        vectorizer = HashingTfidfVectorizer(**params)
+        vectorizer.df_ = load('df')
+        vectorizer.idf_ = load('idf')
+        vectorizer.n_documents_ = meta['n_documents']
+        feature_names = []
+    else:
+        feature_names = load('feature_names')
+        vectorizer = MappedTfidfVectorizer(
+            params, meta['vectorizer_dtype'], load('terms'), load('term_columns'), feature_names, load('idf')
+        )
+    
+    # A regular MultinomialNB whose fitted arrays are memory-mapped
+    nb_classifier = MultinomialNB(**meta['nb_params'])
+    for name in _NB_ARRAYS:
+        setattr(nb_classifier, name, load('nb_' + name.rstrip('_')))
+    nb_classifier.n_features_in_ = meta['n_features']
+    
+    # Traversal tables are missing from directories exported before they were saved
+    forest_arrays = {name: load('forest_' + name) for name in FlatForest.ARRAY_NAMES}
+    forest_arrays.update((name, load('forest_' + name)) for name in FlatForest.TABLE_NAMES
+                         if os.path.exists(os.path.join(directory, f'forest_{name}.npy')))
+    rf_classifier = FlatForest.from_arrays(forest_arrays, meta['n_features'])
+    
+    return {
+        'vectorizer': vectorizer,
+        'nb_classifier': nb_classifier,
+        'rf_classifier': rf_classifier,
+        'feature_names': feature_names,
+        'is_trained': True,
+        'model_version': meta['model_version']
+    }
+
+def convert_pickle(pickle_path: str, directory: str) -> str:
+    """Convert a pickled model to an array directory, returning its model version"""
+    with open(pickle_path, 'rb') as f:
+        raw_data = f.read()
+    model_data = pickle.loads(raw_data)
+    
+    # Keep the version load_model derives for older pickles so cached results stay valid
+    model_data['model_version'] = model_data.get('model_version') or hashlib.sha256(raw_data).hexdigest()[:32]
+    save_model_arrays(model_data, directory)
+    return model_data['model_version']
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a pickled spam model to memory-mappable arrays")
+    parser.add_argument('pickle_path', help="pickled model, e.g. models/spam_classifier.pkl")
+    parser.add_argument('directory', help="output directory for meta.json and the .npy arrays")
+    args = parser.parse_args()
+    
+    version = convert_pickle(args.pickle_path, args.directory)
+    print(f"Wrote model {version} to {args.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+STAGES = ('nb', 'forest')
+
+class Cascade:
+    """Early exit from the ensemble for messages Naive Bayes is sure about.
+    
+    The rules engine and Naive Bayes always run. The random forest only
+    scores messages whose Naive Bayes spam probability lies strictly inside
+    (nb_low, nb_high); the others exit with the Naive Bayes probability as
+    their model confidence. The band is calibrated on labeled validation
+    data (python -m app.calibrate) for the model version it names.
+    """
+    
+    def __init__(self, nb_low: float, nb_high: float, model_version: Optional[str] = None,
+                 report: Optional[Dict[str, Any]] = None):
+        if nb_low >= nb_high:
+            raise ValueError(f"Empty uncertain band: ({nb_low}, {nb_high})")
+        self.nb_low = nb_low
+        self.nb_high = nb_high
+        self.model_version = model_version
+        self.report = report or {}
+        self._lock = threading.Lock()
+        self._counts = {stage: 0 for stage in STAGES}
+    
+    @property
+    def key(self) -> str:
+        """Identifies the thresholds in cache keys: results depend on them"""
+        return f"cascade:{self.nb_low!r}:{self.nb_high!r}"
+    
+    def exits(self, nb_probs: np.ndarray) -> np.ndarray:
+        """Mask of messages decided by Naive Bayes alone"""
+        return (nb_probs <= self.nb_low) | (nb_probs >= self.nb_high)
+    
+    def record(self, stages: List[str]):
+        """Count the stage at which each scored message exited"""
+        with self._lock:
+            for stage in stages:
+                self._counts[stage] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-stage exit counts and rates"""
+        total = sum(self._counts.values())
+        return {
+            "nb_band": [self.nb_low, self.nb_high],
+            "model_version": self.model_version,
+            "messages": total,
+            "exits": dict(self._counts),
+            "exit_rates": {stage: round(count / total, 4) if total else 0.0 for stage, count in self._counts.items()}
+        }
+    
+    def save(self, path: str):
+        """Write the thresholds and calibration report as JSON"""
+        data = {'nb_low': self.nb_low, 'nb_high': self.nb_high,
+                'model_version': self.model_version, 'report': self.report}
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(path + '.tmp', path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'Cascade':
+        """Read thresholds written by save"""
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['nb_low'], data['nb_high'], data.get('model_version'), data.get('report'))
+
+def calibrate_band(nb_probs: np.ndarray, disagrees_on_exit: np.ndarray, max_disagreements: int) -> Tuple[float, float]:
+    """Widest exit region that changes at most max_disagreements final verdicts.
+    
+    disagrees_on_exit marks the messages whose verdict would differ from the
+    full ensemble's if they exited after Naive Bayes. Exits are taken from
+    both ends of the sorted probabilities (never splitting tied values), and
+    for every lower cut the largest upper cut within budget is found by
+    binary search over cumulative disagreement counts.
+    """
+    n = len(nb_probs)
+    order = np.argsort(nb_probs, kind='stable')
+    probs = nb_probs[order]
+    disagree = disagrees_on_exit[order].astype(np.int64)
+    
+    # Exiting the k lowest costs below[k]; the m highest costs above[m]
+    below = np.concatenate([[0], np.cumsum(disagree)])
+    above = np.concatenate([[0], np.cumsum(disagree[::-1])])
+    
+    # Cuts may only fall between distinct probabilities
+    boundary = np.concatenate([[True], probs[1:] != probs[:-1], [True]])
+    valid_k = np.where(boundary)[0]
+    valid_m = n - valid_k[::-1]
+    above_cost = above[valid_m]
+    
+    best = (0, 0)
+    for k in valid_k:
+        budget = max_disagreements - below[k]
+        if budget < 0:
+            break
+        # Largest valid m whose cost fits, without overlapping the lower exits
+        index = min(np.searchsorted(above_cost, budget, side='right'),
+                    np.searchsorted(valid_m, n - k, side='right')) - 1
+        m = int(valid_m[index])
+        if k + m > sum(best):
+            best = (int(k), m)
+    
+    k, m = best
+    nb_low = float(probs[k - 1]) if k else -1.0
+    nb_high = float(probs[n - m]) if m else 2.0
+    if nb_low >= nb_high:
+        # Everything exits; any band between the two sides will do
+        nb_high = np.nextafter(nb_low, 2.0)
+    return nb_low, float(nb_high)
@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.ensemble import RandomForestClassifier
@@ -8,56 +9,92 @@ from sklearn.metrics import accuracy_score, classification_report
 import pickle
 import re
 import string
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import os
+import copy
+import hashlib
+import time
+import uuid
+
+from app import config
+from app.ml.artifact import load_model_arrays, save_model_arrays
+from app.ml.cascade import Cascade
+from app.ml.features import FEATURE_COLUMNS, extract_features_batch
+from app.ml.forest import FlatForest
+from app.ml.hashing import HashingTfidfVectorizer
+from app.ml.keywords import KeywordIndex
+from app.ml.linear import LinearNB
+from app.ml.text import build_token_analyzer, clean_text, preprocess_cleaned, transform_tokens
+
+# Keyword lists scored by extract_features (substring matches on lowercased text)
+URGENCY_WORDS = ['urgent', 'hurry', 'act now', 'limited time', 'expires']
+PROMO_WORDS = ['free', 'win', 'winner', 'prize', 'offer', 'deal', 'discount']
+
+# Text featurizers: a fitted vocabulary, or hashed terms with updatable IDF weights
+FEATURIZERS = ('tfidf', 'hashing')
+
+def _lap(timings: Optional[Dict[str, float]], stage: str, start: float) -> float:
+    """Add the seconds since start to timings[stage] (if timing) and return the current time"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
 
 class SpamClassifier:
     """Machine Learning based spam classifier"""
     
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            max_features=5000,
-            stop_words='english',
-            lowercase=True,
-            ngram_range=(1, 2)
-        )
+    # One automaton scores every feature keyword list in a single pass
+    keyword_index = KeywordIndex()
+    keyword_index.add_list('urgency', URGENCY_WORDS)
+    keyword_index.add_list('promo', PROMO_WORDS)
+    
+    def __init__(self, load: bool = True, arrays_dir: Optional[str] = None, featurizer: str = 'tfidf',
+                 model_path: Optional[str] = None, train_if_missing: bool = True):
+        if featurizer not in FEATURIZERS:
+            raise ValueError(f"Unknown featurizer: {featurizer}")
+        
+        # Used when training from scratch; a loaded model brings its own
+        if featurizer == 'hashing':
+            self.vectorizer = HashingTfidfVectorizer(
+                stop_words='english',
+                lowercase=True,
+                ngram_range=(1, 2)
+            )
+        else:
+            self.vectorizer = TfidfVectorizer(
+                max_features=5000,
+                stop_words='english',
+                lowercase=True,
+                ngram_range=(1, 2)
+            )
         self.nb_classifier = MultinomialNB()
         self.rf_classifier = RandomForestClassifier(n_estimators=100, random_state=42)
         self.is_trained = False
         self.feature_names = []
+        # Identifies the fitted model; changes whenever it is trained, retrained or reloaded
+        self.model_version = None
+        # Memory-mapped array directory (see app.ml.artifact) used instead of the pickle
+        self.arrays_dir = arrays_dir
+        self.model_path = model_path or config.MODEL_PATH
+        
+        # load=False gives an untrained instance, e.g. to call fit() on
+        if not load:
+            return
         
         # Try to load pre-trained model
-        self.load_model()
+        if self.arrays_dir:
+            self.load_arrays(self.arrays_dir)
+        else:
+            self.load_model()
         
-        # If no model exists, train with sample data
-        if not self.is_trained:
+        # If no model exists, train with sample data (never done by the API server)
+        if not self.is_trained and train_if_missing:
             self.train_with_sample_data()
     
     def preprocess_text(self, text: str) -> str:
         """Preprocess text for classification"""
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove URLs
-        text = re.sub(r'http\S+|www\S+', '', text)
-        
-        # Remove email addresses
-        text = re.sub(r'\S+@\S+', '', text)
-        
-        # Remove phone numbers
-        text = re.sub(r'\d{3}-\d{3}-\d{4}|\d{10}', '', text)
-        
-        # Remove excessive punctuation
-        text = re.sub(r'[!]{2,}', '!', text)
-        text = re.sub(r'[?]{2,}', '?', text)
-        
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove leading/trailing whitespace
-        text = text.strip()
-        
-        return text
+        # Lowercase, drop URLs, emails and phone numbers, collapse punctuation and whitespace
+        return preprocess_cleaned(clean_text(text))
     
     def extract_features(self, text: str) -> Dict[str, float]:
         """Extract additional features from text"""
@@ -78,16 +115,17 @@ class SpamClassifier:
         features['dollar_count'] = text.count('$')
         features['url_count'] = len(re.findall(r'http\S+|www\S+', text))
         
-        # Urgency indicators
-        urgency_words = ['urgent', 'hurry', 'act now', 'limited time', 'expires']
-        features['urgency_score'] = sum(1 for word in urgency_words if word in text.lower())
-        
-        # Promotional words
-        promo_words = ['free', 'win', 'winner', 'prize', 'offer', 'deal', 'discount']
-        features['promo_score'] = sum(1 for word in promo_words if word in text.lower())
+        # Keyword indicators: number of listed words occurring in the lowercased text
+        keyword_hits = self.keyword_index.search(text)
+        features['urgency_score'] = keyword_hits.count('urgency')
+        features['promo_score'] = keyword_hits.count('promo')
         
         return features
     
+    def extract_features_batch(self, texts: List[str], dtype=np.float32) -> np.ndarray:
+        """extract_features for many texts at once, as a matrix with FEATURE_COLUMNS columns"""
+        return extract_features_batch(texts, self.keyword_index, ('urgency', 'promo'), dtype=dtype)
+    
     def train_with_sample_data(self):
         """Train the classifier with sample spam/ham data"""
         # Sample training data
@@ -131,21 +169,19 @@ class SpamClassifier:
         messages = spam_messages + ham_messages
         labels = [1] * len(spam_messages) + [0] * len(ham_messages)  # 1 for spam, 0 for ham
         
+        self.fit(messages, labels)
+        
+        # Save the model
+        self.save_model()
+    
+    def fit(self, messages: List[str], labels: List[int]) -> Dict[str, float]:
+        """Fit the vectorizer and both classifiers on labeled messages (1 for spam, 0 for ham)"""
         # Preprocess messages
         processed_messages = [self.preprocess_text(msg) for msg in messages]
         
-        # Fit vectorizer and transform texts
-        X_text = self.vectorizer.fit_transform(processed_messages)
-        
-        # Extract additional features
-        additional_features = []
-        for msg in processed_messages:
-            features = self.extract_features(msg)
-            additional_features.append(list(features.values()))
-        
-        # Combine text features with additional features
-        X_additional = np.array(additional_features)
-        X = np.hstack([X_text.toarray(), X_additional])
+        # Fit vectorizer, then build the sparse text + additional feature matrix
+        self.vectorizer.fit(processed_messages)
+        X = self._build_features(processed_messages)
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(
@@ -167,42 +203,183 @@ class SpamClassifier:
         print(f"Random Forest Accuracy: {rf_accuracy:.3f}")
         
         self.is_trained = True
-        self.feature_names = self.vectorizer.get_feature_names_out().tolist()
+        # Hashed columns have no names up front (see get_feature_importance)
+        self.feature_names = [] if self.uses_hashing else self.vectorizer.get_feature_names_out().tolist()
+        self.model_version = uuid.uuid4().hex
         
-        # Save the model
-        self.save_model()
+        return {'nb_accuracy': nb_accuracy, 'rf_accuracy': rf_accuracy}
+    
+    @property
+    def uses_hashing(self) -> bool:
+        """Whether text features are hashed rather than looked up in a vocabulary"""
+        return isinstance(self.vectorizer, HashingTfidfVectorizer)
     
     def predict(self, message: str) -> Dict[str, float]:
         """Predict if a message is spam or ham"""
+        return self.predict_batch([message])[0]
+    
+    def predict_batch(self, messages: List[str]) -> List[Dict[str, float]]:
+        """Predict a batch of messages in one vectorized pass.
+        
+        Results are returned in the same order as the input messages.
+        """
         if not self.is_trained:
             raise ValueError("Model is not trained yet")
         
-        # Preprocess the message
-        processed_message = self.preprocess_text(message)
+        if not messages:
+            return []
         
-        # Transform text
-        X_text = self.vectorizer.transform([processed_message])
+        # Preprocess the messages
+        processed_messages = [self.preprocess_text(msg) for msg in messages]
         
-        # Extract additional features
-        additional_features = self.extract_features(processed_message)
-        X_additional = np.array([list(additional_features.values())])
+        return self.predict_preprocessed(processed_messages)
+    
+    def predict_preprocessed(self, processed_messages: List[str], cascade: Optional[Cascade] = None,
+                             timings: Optional[Dict[str, float]] = None) -> List[Dict[str, float]]:
+        """Predict a batch of messages that already went through preprocess_text.
+        
+        With a cascade, the random forest only scores the messages inside its
+        uncertain Naive Bayes band; the rest get the Naive Bayes probability as
+        confidence, no rf_probability, and a 'stage' saying where they exited.
+        A timings dict, if given, receives the seconds spent building features
+        ('vectorize') and in each model ('nb', 'rf').
+        """
+        if not self.is_trained:
+            raise ValueError("Model is not trained yet")
+        
+        if not processed_messages:
+            return []
         
-        # Combine features
-        X = np.hstack([X_text.toarray(), X_additional])
+        # Build the text and handcrafted features for the whole batch
+        start = time.perf_counter()
+        X_text, X_additional = self._build_feature_blocks(processed_messages)
+        start = _lap(timings, 'vectorize', start)
         
-        # Get predictions from both classifiers
-        nb_prob = self.nb_classifier.predict_proba(X)[0][1]  # Probability of spam
-        rf_prob = self.rf_classifier.predict_proba(X)[0][1]  # Probability of spam
+        # Get predictions from both classifiers; Naive Bayes needs no stacked matrix
+        nb_probs = self.predict_nb_proba(X_text, X_additional)[:, 1]  # Probability of spam
+        start = _lap(timings, 'nb', start)
+        if cascade is not None:
+            return self._predict_cascade(X_text, X_additional, nb_probs, cascade, timings)
+        X = self._stack_features(X_text, X_additional)
+        rf_probs = self.predict_forest_proba(X)[:, 1]  # Probability of spam
+        _lap(timings, 'rf', start)
         
         # Combine probabilities (ensemble)
-        combined_prob = (nb_prob + rf_prob) / 2
+        combined_probs = (nb_probs + rf_probs) / 2
+        
+        return [
+            {
+                'confidence': combined_prob,
+                'nb_probability': nb_prob,
+                'rf_probability': rf_prob,
+                'prediction': 'spam' if combined_prob > 0.5 else 'ham'
+            }
+            for nb_prob, rf_prob, combined_prob in zip(nb_probs, rf_probs, combined_probs)
+        ]
+    
+    def _predict_cascade(self, X_text: sparse.csr_matrix, X_additional: np.ndarray, nb_probs: np.ndarray,
+                         cascade: Cascade, timings: Optional[Dict[str, float]] = None) -> List[Dict[str, float]]:
+        """Finish a cascaded prediction: the forest only scores (and only needs features of) the uncertain rows"""
+        uncertain = np.flatnonzero(~cascade.exits(nb_probs))
+        rf_probs = {}
+        if len(uncertain):
+            start = time.perf_counter()
+            X = self._stack_features(X_text[uncertain], X_additional[uncertain])
+            rf_probs = dict(zip(uncertain.tolist(), self.predict_forest_proba(X)[:, 1]))
+            _lap(timings, 'rf', start)
+        
+        results = []
+        for i, nb_prob in enumerate(nb_probs):
+            rf_prob = rf_probs.get(i)
+            combined_prob = nb_prob if rf_prob is None else (nb_prob + rf_prob) / 2
+            results.append({
+                'confidence': combined_prob,
+                'nb_probability': nb_prob,
+                'rf_probability': rf_prob,
+                'prediction': 'spam' if combined_prob > 0.5 else 'ham',
+                'stage': 'nb' if rf_prob is None else 'forest'
+            })
+        return results
+    
+    def _build_features(self, processed_messages: List[str]) -> sparse.csr_matrix:
+        """Build the combined text + handcrafted feature matrix.
         
-        return {
-            'confidence': combined_prob,
-            'nb_probability': nb_prob,
-            'rf_probability': rf_prob,
-            'prediction': 'spam' if combined_prob > 0.5 else 'ham'
-        }
+        The TF-IDF output stays in CSR form and the handcrafted columns are
+        appended with a sparse hstack, so no dense vocabulary-wide rows are built.
+        """
+        return self._stack_features(*self._build_feature_blocks(processed_messages))
+    
+    def _build_feature_blocks(self, processed_messages: List[str]) -> Tuple[sparse.csr_matrix, np.ndarray]:
+        """The sparse TF-IDF columns and dense handcrafted columns of the feature matrix"""
+        # Tokenize once; the vectorizer counts the tokens directly
+        analyze = self._get_token_analyzer()
+        X_text = transform_tokens(self.vectorizer, [analyze(msg) for msg in processed_messages])
+        
+        # Extract additional features (float64, as the models were trained on)
+        X_additional = self.extract_features_batch(processed_messages, dtype=np.float64)
+        return X_text, X_additional
+    
+    @staticmethod
+    def _stack_features(X_text: sparse.csr_matrix, X_additional: np.ndarray) -> sparse.csr_matrix:
+        """Combine feature blocks into the matrix the models were trained on"""
+        return sparse.hstack([X_text, sparse.csr_matrix(X_additional)], format='csr')
+    
+    def predict_nb_proba(self, *feature_blocks) -> np.ndarray:
+        """Naive Bayes class probabilities of a feature matrix, or of its column blocks.
+        
+        Scored as a sparse dot product with precomputed log-odds weights, so
+        the cost follows the number of non-zero features of each message
+        rather than the vocabulary size, without sklearn's per-call overhead.
+        """
+        return self._get_nb_scorer().predict_proba(*feature_blocks)
+    
+    def _get_nb_scorer(self) -> LinearNB:
+        """Naive Bayes as log-odds weights, rebuilt when the model is refit or updated"""
+        # fit and partial_fit assign a new feature_log_prob_, so it identifies the fitted state
+        if getattr(self, '_nb_source', None) is not self.nb_classifier.feature_log_prob_:
+            self._nb_scorer = LinearNB.from_sklearn(self.nb_classifier)
+            self._nb_source = self.nb_classifier.feature_log_prob_
+        return self._nb_scorer
+    
+    def predict_forest_proba(self, X: sparse.csr_matrix) -> np.ndarray:
+        """Random forest class probabilities of a feature matrix.
+        
+        Small batches (single messages, micro-batches) are scored by the flat
+        node-array engine, which has none of sklearn's per-call overhead.
+        Large batches of deep trees are cheaper in sklearn's compiled
+        traversal, when the sklearn forest is at hand. Both give bit-identical
+        probabilities.
+        """
+        engine = self._get_forest_engine()
+        if (isinstance(self.rf_classifier, FlatForest) or
+                X.shape[0] * engine.mean_leaf_depth <= config.FLAT_FOREST_MAX_WORK):
+            return engine.predict_proba(X)
+        return self.rf_classifier.predict_proba(X)
+    
+    def _get_forest_engine(self) -> FlatForest:
+        """The random forest as flat node arrays, rebuilt when the forest is replaced"""
+        if getattr(self, '_forest_source', None) is not self.rf_classifier:
+            forest = self.rf_classifier
+            self._forest_engine = forest if isinstance(forest, FlatForest) else FlatForest.from_sklearn(forest)
+            self._forest_source = forest
+        return self._forest_engine
+    
+    def _get_token_analyzer(self):
+        """Token analyzer of the current vectorizer, rebuilt when the vectorizer is replaced"""
+        if getattr(self, '_analyzer_source', None) is not self.vectorizer:
+            self._token_analyzer = build_token_analyzer(self.vectorizer)
+            self._analyzer_source = self.vectorizer
+        return self._token_analyzer
+    
+    def prepare(self):
+        """Build the scoring structures derived from the model now rather than on first use.
+        
+        Called before forking workers, so that they share one copy.
+        """
+        if self.is_trained:
+            self._get_nb_scorer()
+            self._get_forest_engine().mean_leaf_depth
+            self._get_token_analyzer()
     
     def get_feature_importance(self, message: str, top_n: int = 10) -> List[Tuple[str, float]]:
         """Get the most important features for a prediction"""
@@ -212,85 +389,170 @@ class SpamClassifier:
         processed_message = self.preprocess_text(message)
         X_text = self.vectorizer.transform([processed_message])
         
-        # Get feature weights
+        # Hashed columns are named after the terms of this message that map to them
+        if self.uses_hashing:
+            column_names = self.vectorizer.column_terms(processed_message)
+        else:
+            column_names = {i: self.feature_names[i] for i in X_text.indices if i < len(self.feature_names)}
+        
+        # Get feature weights from the non-zero entries only
         feature_weights = []
-        text_features = X_text.toarray()[0]
         
-        for i, weight in enumerate(text_features):
-            if weight > 0 and i < len(self.feature_names):
-                feature_weights.append((self.feature_names[i], weight))
+        for i, weight in zip(X_text.indices, X_text.data):
+            if weight > 0 and i in column_names:
+                feature_weights.append((column_names[i], weight))
         
         # Sort by weight and return top N
         feature_weights.sort(key=lambda x: x[1], reverse=True)
         return feature_weights[:top_n]
     
+    def model_data(self) -> Dict:
+        """The model components, as stored in the pickle"""
+        return {
+            'vectorizer': self.vectorizer,
+            'nb_classifier': self.nb_classifier,
+            'rf_classifier': self.rf_classifier,
+            'feature_names': self.feature_names,
+            'is_trained': self.is_trained,
+            'model_version': self.model_version
+        }
+    
+    def set_model_data(self, model_data: Dict):
+        """Use loaded model components"""
+        self.vectorizer = model_data['vectorizer']
+        self.nb_classifier = model_data['nb_classifier']
+        self.rf_classifier = model_data['rf_classifier']
+        self.feature_names = model_data['feature_names']
+        self.is_trained = model_data['is_trained']
+        self.model_version = model_data['model_version']
+    
     def save_model(self):
         """Save the trained model to disk"""
         try:
-            os.makedirs('models', exist_ok=True)
-            
-            model_data = {
-                'vectorizer': self.vectorizer,
-                'nb_classifier': self.nb_classifier,
-                'rf_classifier': self.rf_classifier,
-                'feature_names': self.feature_names,
-                'is_trained': self.is_trained
-            }
+            model_data = self.model_data()
             
-            with open('models/spam_classifier.pkl', 'wb') as f:
-                pickle.dump(model_data, f)
+            # Models loaded from arrays are saved back in the same format
+            if self.arrays_dir:
+                save_model_arrays(model_data, self.arrays_dir)
+            else:
+                # Written aside and moved into place: readers never see a partial pickle
+                os.makedirs(os.path.dirname(self.model_path) or '.', exist_ok=True)
+                with open(self.model_path + '.tmp', 'wb') as f:
+                    pickle.dump(model_data, f)
+                os.replace(self.model_path + '.tmp', self.model_path)
             
             print("Model saved successfully")
-            
+        
         except Exception as e:
             print(f"Error saving model: {e}")
     
     def load_model(self):
         """Load a pre-trained model from disk"""
         try:
-            with open('models/spam_classifier.pkl', 'rb') as f:
-                model_data = pickle.load(f)
+            with open(self.model_path, 'rb') as f:
+                raw_data = f.read()
+            model_data = pickle.loads(raw_data)
             
-            self.vectorizer = model_data['vectorizer']
-            self.nb_classifier = model_data['nb_classifier']
-            self.rf_classifier = model_data['rf_classifier']
-            self.feature_names = model_data['feature_names']
-            self.is_trained = model_data['is_trained']
+            # Older artifacts carry no version id; fall back to their content hash
+            model_data['model_version'] = model_data.get('model_version') or hashlib.sha256(raw_data).hexdigest()[:32]
+            self.set_model_data(model_data)
             
             print("Model loaded successfully")
-            
+        
         except FileNotFoundError:
-            print("No pre-trained model found. Will train new model.")
+            print(f"No pre-trained model found at {self.model_path}")
         except Exception as e:
             print(f"Error loading model: {e}")
     
-    def retrain(self, new_messages: List[str], new_labels: List[int]):
-        """Retrain the model with new data"""
+    def load_arrays(self, directory: str):
+        """Load a model exported with app.ml.artifact, memory-mapping its arrays"""
+        try:
+            self.set_model_data(load_model_arrays(directory))
+            
+            print("Model arrays loaded successfully")
+        
+        except FileNotFoundError:
+            print(f"No model arrays found in {directory}")
+        except Exception as e:
+            print(f"Error loading model arrays: {e}")
+    
+    def partial_fit(self, new_messages: List[str], new_labels: List[int]):
+        """Update the Naive Bayes model incrementally with labeled messages"""
         if not self.is_trained:
             raise ValueError("Initial model must be trained first")
         
         # Preprocess new messages
         processed_messages = [self.preprocess_text(msg) for msg in new_messages]
         
-        # Transform texts
-        X_text = self.vectorizer.transform(processed_messages)
+        # A fitted vocabulary drops unseen tokens; hashed features take them into the IDF weights
+        if self.uses_hashing:
+            self.vectorizer.partial_fit(processed_messages)
         
-        # Extract additional features
-        additional_features = []
-        for msg in processed_messages:
-            features = self.extract_features(msg)
-            additional_features.append(list(features.values()))
+        # Build sparse features
+        X = self._build_features(processed_messages)
         
-        # Combine features
-        X_additional = np.array(additional_features)
-        X = np.hstack([X_text.toarray(), X_additional])
+        # Memory-mapped counts are read-only; update a private copy
+        if isinstance(self.nb_classifier.feature_count_, np.memmap):
+            self.nb_classifier.feature_count_ = np.array(self.nb_classifier.feature_count_)
+            self.nb_classifier.class_count_ = np.array(self.nb_classifier.class_count_)
         
         # Partial fit for incremental learning
         self.nb_classifier.partial_fit(X, new_labels)
+        self.model_version = uuid.uuid4().hex
+    
+    def updated(self, new_messages: List[str], new_labels: List[int]) -> 'SpamClassifier':
+        """A copy with Naive Bayes updated on labeled messages, leaving this instance untouched.
+        
+        Only the state partial_fit changes is copied (the Naive Bayes counts
+        and, for hashed features, the IDF weights), so the copy is cheap and
+        this instance can keep serving while it is built.
+        """
+        model = copy.copy(self)
+        model.nb_classifier = copy.copy(self.nb_classifier)
+        # partial_fit adds to the counts in place
+        model.nb_classifier.feature_count_ = np.array(self.nb_classifier.feature_count_)
+        model.nb_classifier.class_count_ = np.array(self.nb_classifier.class_count_)
+        if self.uses_hashing:
+            model.vectorizer = copy.copy(self.vectorizer)
+        
+        model.partial_fit(new_messages, new_labels)
+        return model
+    
+    def refreshed_forest(self, messages: List[str], labels: List[int], n_trees: int):
+        """The random forest with its n_trees oldest trees replaced by new ones trained on messages.
+        
+        A new forest object is returned; the current one is not modified.
+        """
+        if len(set(labels)) < 2:
+            raise ValueError("Refreshing the forest needs both spam and ham messages")
+        
+        X = self._build_features([self.preprocess_text(msg) for msg in messages])
+        forest = self.rf_classifier
+        
+        # New trees with the forest's settings (single-threaded: serving goes on meanwhile)
+        params = forest.get_params() if hasattr(forest, 'get_params') else {}
+        params.update(n_estimators=n_trees, warm_start=False, n_jobs=1, random_state=None)
+        new_trees = RandomForestClassifier(**params).fit(X, labels)
+        
+        # Trees are kept oldest first
+        if isinstance(forest, FlatForest):
+            retired = min(n_trees, forest.n_trees)
+            return FlatForest.concatenate([forest.trees(retired), FlatForest.from_sklearn(new_trees)])
+        
+        refreshed = copy.copy(forest)
+        refreshed.estimators_ = forest.estimators_[min(n_trees, len(forest.estimators_)):] + new_trees.estimators_
+        refreshed.n_estimators = len(refreshed.estimators_)
+        return refreshed
+    
+    def retrain(self, new_messages: List[str], new_labels: List[int], n_trees: int = 10):
+        """Retrain the model with new data"""
+        self.partial_fit(new_messages, new_labels)
         
-        # For Random Forest, we need to retrain completely
-        # This is a limitation of scikit-learn's RandomForest
-        print("Note: Random Forest requires complete retraining with new data")
+        # Random Forest has no partial_fit: replace its oldest trees with ones grown on the new data
+        if len(set(new_labels)) > 1:
+            self.rf_classifier = self.refreshed_forest(new_messages, new_labels, n_trees)
+        else:
+            print("Note: Random Forest trees are only refreshed from data with both spam and ham")
         
         # Save updated model
         self.save_model()
@@ -303,6 +565,7 @@ class SpamClassifier:
         return {
             "is_trained": self.is_trained,
             "feature_count": len(self.feature_names),
-            "vectorizer_vocab_size": len(self.vectorizer.vocabulary_),
+            "featurizer": "hashing" if self.uses_hashing else "tfidf",
+            "vectorizer_vocab_size": self.vectorizer.n_features if self.uses_hashing else len(self.vectorizer.vocabulary_),
             "model_types": ["Naive Bayes", "Random Forest"]
         }
\ No newline at end of file
@@ -0,0 +1,154 @@
+import re
+import string
+import threading
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.ml.keywords import KeywordIndex
+
+# Columns of the handcrafted feature matrix, in SpamClassifier.extract_features order
+FEATURE_COLUMNS = (
+    'length',
+    'word_count',
+    'uppercase_ratio',
+    'digit_ratio',
+    'punctuation_ratio',
+    'exclamation_count',
+    'question_count',
+    'dollar_count',
+    'url_count',
+    'urgency_score',
+    'promo_score'
+)
+
+# Character class bits, as str.isupper/isdigit/isspace and string.punctuation
+# define them, plus the three characters counted individually
+_UPPER = 1
+_DIGIT = 2
+_PUNCTUATION = 4
+_EXCLAMATION = 8
+_QUESTION = 16
+_DOLLAR = 32
+_SPACE = 64
+# Takes the place of the space bit in the per-text histogram codes
+_WORD_START = 64
+
+_PUNCTUATION_CHARS = frozenset(string.punctuation)
+
+# Histogram width: every combination of the counted bits
+_CODES = 128
+_CODE_BITS = np.array([[(code >> bit) & 1 for bit in range(7)] for code in range(_CODES)], dtype=np.int64)
+
+# URLs as extract_features finds them: r'http\S+|www\S+'
+_URL_PREFIXES = ('http', 'www')
+_WHITESPACE = re.compile(r'\s')
+
+_bmp_flags: Optional[np.ndarray] = None
+_bmp_lock = threading.Lock()
+
+def _char_flags(char: str) -> int:
+    """Class bits of one character"""
+    return ((_UPPER if char.isupper() else 0) | (_DIGIT if char.isdigit() else 0) |
+            (_PUNCTUATION if char in _PUNCTUATION_CHARS else 0) | (_EXCLAMATION if char == '!' else 0) |
+            (_QUESTION if char == '?' else 0) | (_DOLLAR if char == '$' else 0) |
+            (_SPACE if char.isspace() else 0))
+
+def _flags(codepoints: np.ndarray) -> np.ndarray:
+    """Class bits of every code point, via a lookup table over the Basic Multilingual Plane"""
+    global _bmp_flags
+    if _bmp_flags is None:
+        with _bmp_lock:
+            if _bmp_flags is None:
+                _bmp_flags = np.fromiter((_char_flags(chr(i)) for i in range(0x10000)), dtype=np.uint8, count=0x10000)
+    
+    flags = _bmp_flags[np.minimum(codepoints, 0xFFFF)]
+    
+    # Emoji and other astral characters are rare; classify the distinct ones in Python
+    astral = codepoints > 0xFFFF
+    if astral.any():
+        values, inverse = np.unique(codepoints[astral], return_inverse=True)
+        flags[astral] = np.array([_char_flags(chr(value)) for value in values], dtype=np.uint8)[inverse]
+    return flags
+
+def _url_counts(joined: str, starts: List[int]) -> np.ndarray:
+    """len(re.findall(r'http\S+|www\S+', text)) for every text of the joined string.
+    
+    A match runs to the end of its whitespace-delimited run, so each run
+    holds at most one match: the one at its leftmost prefix that is
+    followed by a non-space character. Prefixes are located with str.find.
+    """
+    candidates = []
+    for prefix in _URL_PREFIXES:
+        position = joined.find(prefix)
+        while position != -1:
+            after = position + len(prefix)
+            if after < len(joined) and not joined[after].isspace():
+                candidates.append(position)
+            position = joined.find(prefix, position + 1)
+    
+    counts = np.zeros(len(starts), dtype=np.int64)
+    previous = None
+    for position in sorted(candidates):
+        # Same run as the previous match if no whitespace separates them
+        if previous is not None and not _WHITESPACE.search(joined, previous, position):
+            continue
+        counts[bisect_right(starts, position) - 1] += 1
+        previous = position
+    return counts
+
+def extract_features_batch(texts: List[str], keyword_index: KeywordIndex,
+                           keyword_lists: Tuple[str, str] = ('urgency', 'promo'),
+                           dtype=np.float32) -> np.ndarray:
+    """Handcrafted features of many texts as one (n_texts, len(FEATURE_COLUMNS)) matrix.
+    
+    Values are identical to SpamClassifier.extract_features (up to the
+    requested dtype). The texts are joined by newlines and viewed as an
+    array of code points whose character classes come from a lookup table;
+    a single bincount then histograms the class combinations per text.
+    URLs and keywords are located with C-level substring searches over the
+    joined text (no match can cross the newline separators).
+    """
+    n_texts = len(texts)
+    features = np.zeros((n_texts, len(FEATURE_COLUMNS)), dtype=np.float64)
+    if not n_texts:
+        return features.astype(dtype)
+    
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n_texts)
+    
+    # Every text is followed by a newline, which falls in no counted class
+    joined = '\n'.join(texts) + '\n'
+    codepoints = np.frombuffer(joined.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+    flags = _flags(codepoints)
+    
+    # A word starts at a non-space character after a space (the separators are spaces)
+    space = (flags & _SPACE) != 0
+    word_start = ~space
+    word_start[1:] &= space[:-1]
+    codes = flags & (_SPACE - 1)
+    codes[word_start] |= _WORD_START
+    
+    # Histogram of class combinations per text, then per-class totals
+    owner = np.repeat(np.arange(n_texts, dtype=np.int64) * _CODES, lengths + 1)
+    histogram = np.bincount(owner + codes, minlength=n_texts * _CODES).reshape(n_texts, _CODES)
+    totals = histogram @ _CODE_BITS
+    
+    denominator = np.maximum(lengths, 1)
+    features[:, 0] = lengths
+    features[:, 1] = totals[:, 6]
+    features[:, 2] = totals[:, 0] / denominator
+    features[:, 3] = totals[:, 1] / denominator
+    features[:, 4] = totals[:, 2] / denominator
+    features[:, 5] = totals[:, 3]
+    features[:, 6] = totals[:, 4]
+    features[:, 7] = totals[:, 5]
+    
+    starts = np.concatenate([[0], np.cumsum(lengths + 1)[:-1]]).tolist()
+    features[:, 8] = _url_counts(joined, starts)
+    
+    keyword_counts = keyword_index.count_batch(texts, list(keyword_lists))
+    features[:, 9] = keyword_counts[keyword_lists[0]]
+    features[:, 10] = keyword_counts[keyword_lists[1]]
+    
+    return features.astype(dtype, copy=False)
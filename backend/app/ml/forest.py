@@ -0,0 +1,256 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import sklearn
+from scipy import sparse
+
+# Since scikit-learn 1.4 classifier trees store class fractions in tree_.value
+# and predict_proba returns them as is; before that it normalized the counts.
+_VALUES_ARE_FRACTIONS = tuple(int(part) for part in sklearn.__version__.split('.')[:2]) >= (1, 4)
+
+class FlatForest:
+    """A fitted random forest flattened into plain node arrays.
+    
+    All trees live in one set of arrays (feature, threshold, left, right and
+    per-node class probabilities) with child indexes pointing into the same
+    arrays, so the forest can be stored with np.save, memory-mapped back and
+    evaluated for a whole batch with vectorized traversal. predict_proba
+    reproduces RandomForestClassifier.predict_proba bit for bit.
+    """
+    
+    ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'proba', 'roots', 'classes')
+    
+    # Traversal tables derived from the node arrays. They are saved too, so
+    # that processes mapping a model share them instead of each building a
+    # private copy larger than the node arrays themselves.
+    TABLE_NAMES = ('split_column', 'children', 'is_leaf', 'class_proba')
+    
+    # Rows traversed at once: bounds the per-(row, tree) cursor arrays of large batches
+    BLOCK_ROWS = 1024
+    
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray,
+                 right: np.ndarray, proba: np.ndarray, roots: np.ndarray, classes: np.ndarray,
+                 n_features: int, tables: Optional[Dict[str, np.ndarray]] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.proba = proba
+        self.roots = roots
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+        
+        # Inputs only matter for features some split uses; map them to dense columns
+        self.used_features = np.unique(feature[feature >= 0])
+        self._column = np.full(n_features, -1, dtype=np.int64)
+        self._column[self.used_features] = np.arange(len(self.used_features))
+        
+        if tables is None:
+            tables = self._build_tables()
+        self._split_column = tables['split_column']
+        self._children = tables['children']
+        self._is_leaf = tables['is_leaf']
+        self._class_proba = tables['class_proba']
+    
+    def _build_tables(self) -> Dict[str, np.ndarray]:
+        """Traversal tables of the node arrays.
+        
+        The dense column each node splits on, and the child taken when the
+        split fails (first half) or holds (second half). Leaves lead back to
+        themselves, so finished cursors can keep stepping.
+        """
+        node_column = np.where(self.feature >= 0, self._column[np.maximum(self.feature, 0)], -1)
+        is_leaf = node_column < 0
+        nodes = np.arange(len(self.feature))
+        return {
+            'split_column': np.maximum(node_column, 0).astype(np.intp),
+            'children': np.concatenate([np.where(is_leaf, nodes, self.right),
+                                        np.where(is_leaf, nodes, self.left)]).astype(np.intp),
+            'is_leaf': is_leaf,
+            # Per-class leaf probabilities, each contiguous for fast gathers
+            'class_proba': np.ascontiguousarray(np.asarray(self.proba).T)
+        }
+    
+    @classmethod
+    def from_sklearn(cls, forest) -> 'FlatForest':
+        """Flatten a fitted RandomForestClassifier"""
+        if forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be flattened")
+        
+        n_classes = len(forest.classes_)
+        features, thresholds, lefts, rights, probas, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left < 0
+            
+            value = tree.value[:, 0, :n_classes].astype(np.float64)
+            if not _VALUES_ARE_FRACTIONS:
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            
+            features.append(np.where(is_leaf, -1, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, -1, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, -1, tree.children_right + offset).astype(np.int32))
+            probas.append(value)
+            roots.append(offset)
+            offset += tree.node_count
+        
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            proba=np.concatenate(probas),
+            roots=np.array(roots, dtype=np.int64),
+            classes=np.asarray(forest.classes_),
+            n_features=forest.n_features_in_
+        )
+    
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], n_features: int) -> 'FlatForest':
+        """Rebuild from arrays produced by to_arrays (possibly memory-mapped).
+        
+        The traversal tables are used as they are when present; they are
+        rebuilt for exports that lack them or were made on another platform.
+        """
+        tables = {name: arrays[name] for name in cls.TABLE_NAMES if name in arrays}
+        if (len(tables) < len(cls.TABLE_NAMES) or tables['split_column'].dtype != np.intp or
+                tables['children'].dtype != np.intp):
+            tables = None
+        return cls(n_features=n_features, tables=tables, **{name: arrays[name] for name in cls.ARRAY_NAMES})
+    
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """The node arrays and traversal tables, ready to be saved"""
+        arrays = {name: getattr(self, name if name != 'classes' else 'classes_') for name in self.ARRAY_NAMES}
+        arrays.update((name, getattr(self, '_' + name)) for name in self.TABLE_NAMES)
+        return arrays
+    
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+    
+    @property
+    def mean_leaf_depth(self) -> float:
+        """Average depth of the leaves, per tree: the cost of a traversal in levels"""
+        if getattr(self, '_mean_leaf_depth', None) is None:
+            depth = np.zeros(len(self.feature), dtype=np.int64)
+            level = np.asarray(self.roots, dtype=np.intp)
+            while level.size:
+                level = level[~self._is_leaf[level]]
+                children = np.concatenate([self.left[level], self.right[level]]).astype(np.intp)
+                depth[children] = np.concatenate([depth[level], depth[level]]) + 1
+                level = children
+            tree = np.searchsorted(self.roots, np.arange(len(self.feature)), side='right') - 1
+            leaf_depth = np.bincount(tree[self._is_leaf], depth[self._is_leaf], minlength=self.n_trees)
+            leaf_count = np.bincount(tree[self._is_leaf], minlength=self.n_trees)
+            self._mean_leaf_depth = float(np.mean(leaf_depth / np.maximum(leaf_count, 1)))
+        return self._mean_leaf_depth
+    
+    def trees(self, start: int, stop: Optional[int] = None) -> 'FlatForest':
+        """Forest made of trees start:stop, in their original order"""
+        stop = self.n_trees if stop is None else min(stop, self.n_trees)
+        first = int(self.roots[start]) if start < stop else 0
+        last = int(self.roots[stop]) if stop < self.n_trees else len(self.feature)
+        
+        # Child indexes are absolute; shift them to the slice
+        left, right = self.left[first:last], self.right[first:last]
+        return FlatForest(
+            feature=np.array(self.feature[first:last]),
+            threshold=np.array(self.threshold[first:last]),
+            left=np.where(left >= 0, left - first, -1).astype(np.int32),
+            right=np.where(right >= 0, right - first, -1).astype(np.int32),
+            proba=np.array(self.proba[first:last]),
+            roots=np.asarray(self.roots[start:stop], dtype=np.int64) - first,
+            classes=np.array(self.classes_),
+            n_features=self.n_features_in_
+        )
+    
+    @classmethod
+    def concatenate(cls, forests: List['FlatForest']) -> 'FlatForest':
+        """One forest holding the trees of all forests, in order"""
+        for forest in forests[1:]:
+            if (forest.n_features_in_ != forests[0].n_features_in_ or
+                    not np.array_equal(forest.classes_, forests[0].classes_)):
+                raise ValueError("Forests over different features or classes cannot be combined")
+        
+        lefts, rights, roots = [], [], []
+        offset = 0
+        for forest in forests:
+            lefts.append(np.where(forest.left >= 0, forest.left + offset, -1).astype(np.int32))
+            rights.append(np.where(forest.right >= 0, forest.right + offset, -1).astype(np.int32))
+            roots.append(np.asarray(forest.roots, dtype=np.int64) + offset)
+            offset += len(forest.feature)
+        
+        return cls(
+            feature=np.concatenate([forest.feature for forest in forests]),
+            threshold=np.concatenate([forest.threshold for forest in forests]),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            proba=np.concatenate([forest.proba for forest in forests]),
+            roots=np.concatenate(roots),
+            classes=np.array(forests[0].classes_),
+            n_features=forests[0].n_features_in_
+        )
+    
+    def _dense_used_columns(self, X) -> np.ndarray:
+        """Dense float32 copy of X restricted to the features the trees split on"""
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X)
+            X.sum_duplicates()
+            rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+            columns = self._column[X.indices]
+            keep = columns >= 0
+            dense = np.zeros((X.shape[0], len(self.used_features)), dtype=np.float32)
+            dense[rows[keep], columns[keep]] = X.data[keep].astype(np.float32)
+            return dense
+        return np.asarray(X, dtype=np.float32)[:, self.used_features]
+    
+    def apply(self, X) -> np.ndarray:
+        """Leaf node reached in every tree, shape (n_samples, n_trees)"""
+        leaves = np.empty((X.shape[0], self.n_trees), dtype=np.intp)
+        for start in range(0, X.shape[0], self.BLOCK_ROWS):
+            leaves[start:start + self.BLOCK_ROWS] = self._apply_block(X[start:start + self.BLOCK_ROWS])
+        return leaves
+    
+    def _apply_block(self, X) -> np.ndarray:
+        X_used = self._dense_used_columns(X)
+        n_samples, n_columns = X_used.shape
+        values = X_used.ravel()
+        n_nodes = len(self.feature)
+        
+        # One cursor per (sample, tree), walked down level by level. Cursors
+        # at a leaf stay put; once most are, the rest are compacted so later
+        # levels only touch the ones still descending.
+        leaves = np.tile(np.asarray(self.roots, dtype=np.intp), n_samples)
+        position = np.arange(leaves.size)
+        node = leaves
+        offset = position // self.n_trees * n_columns
+        
+        while True:
+            # float32 inputs are compared against float64 thresholds, as sklearn does
+            holds = values[offset + self._split_column[node]] <= self.threshold[node]
+            node = self._children[node + holds * n_nodes]
+            
+            descending = ~self._is_leaf[node]
+            n_descending = np.count_nonzero(descending)
+            if n_descending * 2 < node.size:
+                leaves[position] = node
+                if not n_descending:
+                    break
+                node, position, offset = node[descending], position[descending], offset[descending]
+        
+        return leaves.reshape(n_samples, self.n_trees)
+    
+    def predict_proba(self, X) -> np.ndarray:
+        """Average of the per-tree class probabilities"""
+        proba = np.empty((X.shape[0], len(self.classes_)), dtype=np.float64)
+        for start in range(0, X.shape[0], self.BLOCK_ROWS):
+            leaves = self._apply_block(X[start:start + self.BLOCK_ROWS]).T
+            for k, class_proba in enumerate(self._class_proba):
+                # accumulate adds tree by tree in order, matching sklearn's summation order
+                total = np.add.accumulate(class_proba[leaves], axis=0)[-1]
+                proba[start:start + self.BLOCK_ROWS, k] = total / self.n_trees
+        return proba
@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.base import BaseEstimator
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from app.ml.text import weight_counts
+
+def _hash_counts(hashing: HashingVectorizer, documents: List[str]) -> sparse.csr_matrix:
+    """Raw term counts of a chunk of documents (runs in worker processes)"""
+    return hashing.transform(documents)
+
+class HashingTfidfVectorizer(BaseEstimator):
+    """TF-IDF features over hashed terms instead of a vocabulary.
+    
+    Terms (word uni/bigrams by default) are hashed into n_features columns,
+    so memory is fixed whatever the corpus and there is no vocabulary to
+    store or look up. Document frequencies are kept per column and can be
+    updated with partial_fit, so new tokens get weights as they appear.
+    Hashing is stateless, so large batches are split into chunks that are
+    hashed in parallel when n_jobs is set.
+    """
+    
+    def __init__(self, n_features: int = 2 ** 18, stop_words: Optional[str] = 'english',
+                 lowercase: bool = True, ngram_range=(1, 2), use_idf: bool = True,
+                 sublinear_tf: bool = False, norm: Optional[str] = 'l2',
+                 n_jobs: Optional[int] = None, chunk_size: int = 2000):
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.lowercase = lowercase
+        self.ngram_range = ngram_range
+        self.use_idf = use_idf
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+    
+    def _hashing(self) -> HashingVectorizer:
+        """Stateless term counter with the same analyzer settings"""
+        return HashingVectorizer(
+            n_features=self.n_features,
+            stop_words=self.stop_words,
+            lowercase=self.lowercase,
+            ngram_range=tuple(self.ngram_range),
+            alternate_sign=False,
+            norm=None
+        )
+    
+    def build_analyzer(self):
+        return self._hashing().build_analyzer()
+    
+    def analyzer_template(self) -> HashingVectorizer:
+        """Vectorizer with the same analyzer settings"""
+        return self._hashing()
+    
+    def _counts(self, raw_documents: List[str]) -> sparse.csr_matrix:
+        """Hashed term counts, chunked over n_jobs processes for large inputs"""
+        hashing = self._hashing()
+        if not self.n_jobs or self.n_jobs == 1 or len(raw_documents) <= self.chunk_size:
+            return hashing.transform(raw_documents)
+        
+        chunks = [raw_documents[i:i + self.chunk_size] for i in range(0, len(raw_documents), self.chunk_size)]
+        parts = Parallel(n_jobs=self.n_jobs)(delayed(_hash_counts)(hashing, chunk) for chunk in chunks)
+        return sparse.vstack(parts, format='csr')
+    
+    def fit(self, raw_documents: List[str], y=None) -> 'HashingTfidfVectorizer':
+        """Learn document frequencies from scratch"""
+        self.df_ = np.zeros(self.n_features, dtype=np.int64)
+        self.n_documents_ = 0
+        return self.partial_fit(raw_documents)
+    
+    def partial_fit(self, raw_documents: List[str], y=None) -> 'HashingTfidfVectorizer':
+        """Add documents to the document frequencies (and so the IDF weights)"""
+        return self.add_document_frequencies(self.document_frequencies(raw_documents), len(raw_documents))
+    
+    def document_frequencies(self, raw_documents: List[str]) -> np.ndarray:
+        """Per-column document frequencies of a batch, without updating the vectorizer"""
+        counts = self._counts(raw_documents)
+        return np.bincount(counts.indices, minlength=self.n_features)
+    
+    def add_document_frequencies(self, df: np.ndarray, n_documents: int) -> 'HashingTfidfVectorizer':
+        """Merge document frequencies counted elsewhere, e.g. by document_frequencies in another process"""
+        if not hasattr(self, 'df_'):
+            self.df_ = np.zeros(self.n_features, dtype=np.int64)
+            self.n_documents_ = 0
+        
+        # Not in place: df_ may be a read-only memory-mapped array
+        self.df_ = self.df_ + df
+        self.n_documents_ += n_documents
+        
+        # Smoothed IDF, as TfidfTransformer(smooth_idf=True) computes it
+        self.idf_ = np.log((1 + self.n_documents_) / (1 + self.df_)) + 1.0
+        return self
+    
+    def transform(self, raw_documents: List[str]) -> sparse.csr_matrix:
+        """Transform documents to the weighted, normalized feature matrix"""
+        if self.use_idf and not hasattr(self, 'idf_'):
+            raise ValueError("HashingTfidfVectorizer is not fitted yet")
+        
+        return self._weight(self._counts(raw_documents))
+    
+    def transform_tokens(self, tokens: List[List[str]]) -> sparse.csr_matrix:
+        """Transform already-analyzed documents"""
+        if self.use_idf and not hasattr(self, 'idf_'):
+            raise ValueError("HashingTfidfVectorizer is not fitted yet")
+        
+        hasher = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False)
+        return self._weight(hasher.transform(tokens))
+    
+    def _weight(self, X: sparse.csr_matrix) -> sparse.csr_matrix:
+        return weight_counts(X, getattr(self, 'idf_', None), sublinear_tf=self.sublinear_tf,
+                             use_idf=self.use_idf, norm=self.norm)
+    
+    def fit_transform(self, raw_documents: List[str], y=None) -> sparse.csr_matrix:
+        return self.fit(raw_documents).transform(raw_documents)
+    
+    def column_terms(self, raw_document: str) -> Dict[int, str]:
+        """Name the columns of one document by the terms that hashed into them.
+        
+        There is no vocabulary to invert, so names are recovered from the
+        document itself; colliding terms of the document are joined with '|'.
+        """
+        terms = sorted(set(self.build_analyzer()(raw_document)))
+        if not terms:
+            return {}
+        
+        hasher = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False)
+        columns = hasher.transform([[term] for term in terms]).indices
+        names: Dict[int, str] = {}
+        for column, term in zip(columns, terms):
+            names[int(column)] = names[int(column)] + '|' + term if int(column) in names else term
+        return names
@@ -0,0 +1,275 @@
+import re
+from bisect import bisect_right
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+# A rule pattern of the form (?i)\b(word one|word two|...)\b
+_KEYWORD_PATTERN = re.compile(r'^\(\?i\)\\b\((.+)\)\\b$', re.DOTALL)
+
+# Characters that keep a regex meaning when they are not escaped
+_REGEX_METACHARACTERS = set('.^$*+?{}[]()|\\')
+
+# Non-ASCII characters that re.IGNORECASE treats as equal to an ASCII letter
+# but that str.lower() does not map (or maps to more than one character)
+_IGNORECASE_SPECIALS = str.maketrans({'İ': 'i', 'ı': 'i', 'ſ': 's'})
+
+def fold_lower(text: str) -> str:
+    """Fold text the way `word in text.lower()` does"""
+    return text.lower()
+
+def fold_ignorecase(text: str) -> str:
+    """Fold text the way a (?i) pattern compares ASCII keywords.
+    
+    The result always has the same length as the input, so match offsets
+    can be mapped back onto the original text.
+    """
+    if text.isascii():
+        return text.lower()
+    return text.translate(_IGNORECASE_SPECIALS).lower()
+
+def _unescape_literal(alternative: str) -> Optional[str]:
+    """Return the literal text of a regex alternative, or None if it is not literal"""
+    chars = []
+    escaped = False
+    for char in alternative:
+        if escaped:
+            if char.isalnum():
+                return None  # \d, \w, \1 and friends
+            chars.append(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in _REGEX_METACHARACTERS:
+            return None
+        else:
+            chars.append(char)
+    if escaped or not chars:
+        return None
+    return ''.join(chars)
+
+def parse_keyword_pattern(pattern: str) -> Optional[List[str]]:
+    """Extract the keywords from a case-insensitive literal alternation.
+    
+    Returns None for anything that is not exactly (?i)\\b(kw|kw|...)\\b with
+    plain ASCII keywords, so that such rules stay on the regex path.
+    """
+    match = _KEYWORD_PATTERN.match(pattern)
+    if not match:
+        return None
+    
+    keywords = []
+    for alternative in match.group(1).split('|'):
+        keyword = _unescape_literal(alternative)
+        if keyword is None or not keyword.isascii():
+            return None
+        keywords.append(keyword)
+    return keywords
+
+def keyword_pattern(keywords: List[str]) -> str:
+    """Build the rule pattern for a list of literal keywords"""
+    return r'(?i)\b(' + '|'.join(re.escape(keyword) for keyword in keywords) + r')\b'
+
+def _is_word_char(char: str) -> bool:
+    """Same definition of a word character as \\w in a str pattern"""
+    return char.isalnum() or char == '_'
+
+class KeywordHits:
+    """All keyword occurrences found in one text by a KeywordIndex"""
+    
+    def __init__(self, text: str, folded: str, hits: Dict[Hashable, list]):
+        self.text = text
+        self.folded = folded
+        self._hits = hits
+    
+    @property
+    def aligned(self) -> bool:
+        """Whether offsets in the folded text are valid in the original text"""
+        return len(self.folded) == len(self.text)
+    
+    def count(self, name: Hashable) -> int:
+        """Number of list entries that occur anywhere in the text"""
+        present = {entry for _, _, entry in self._hits.get(name, ())}
+        return len(present)
+    
+    def findall(self, name: Hashable) -> List[str]:
+        """Matches as re.findall would return them for the list's keyword_pattern.
+        
+        Occurrences must sit on word boundaries; at each position the entry
+        listed first wins and matching resumes after it (leftmost-first,
+        non-overlapping), which is how the regex alternation behaves.
+        """
+        if not self.aligned:
+            raise ValueError("Text folding changed the text length; offsets are not usable")
+        
+        text = self.text
+        length = len(text)
+        best: Dict[int, Tuple[int, int]] = {}
+        for start, end, entry in self._hits.get(name, ()):
+            # \b at both ends, evaluated on the original characters
+            before = start > 0 and _is_word_char(text[start - 1])
+            if before == _is_word_char(text[start]):
+                continue
+            after = end < length and _is_word_char(text[end])
+            if after == _is_word_char(text[end - 1]):
+                continue
+            if start not in best or entry < best[start][1]:
+                best[start] = (end, entry)
+        
+        matches = []
+        cursor = 0
+        for start in sorted(best):
+            if start < cursor:
+                continue
+            end = best[start][0]
+            matches.append(text[start:end])
+            cursor = end
+        return matches
+
+class KeywordIndex:
+    """Aho-Corasick automaton over several named keyword lists.
+    
+    All lists share one automaton, so a single linear pass over the text
+    finds every occurrence of every keyword however many are indexed. The
+    automaton is (re)built lazily after lists are added or removed.
+    """
+    
+    # count_batch scans once per keyword with str.find up to this many
+    # keywords (about 100x faster per character than a pass in Python)
+    FIND_MAX_KEYWORDS = 64
+    
+    def __init__(self, fold: Callable[[str], str] = fold_lower):
+        self.fold = fold
+        self._lists: Dict[Hashable, List[str]] = {}
+        self._goto: List[Dict[str, int]] = []
+        self._fail: List[int] = []
+        self._delta: List[Dict[str, int]] = []
+        self._alphabet = frozenset()
+        self._output: List[List[Tuple[int, Hashable, int]]] = []
+        self._built = False
+    
+    def add_list(self, name: Hashable, keywords: List[str]):
+        """Add (or replace) a named keyword list"""
+        self._lists[name] = list(keywords)
+        self._built = False
+    
+    def remove_list(self, name: Hashable) -> bool:
+        """Remove a keyword list by name"""
+        if self._lists.pop(name, None) is None:
+            return False
+        self._built = False
+        return True
+    
+    def __len__(self) -> int:
+        return sum(len(keywords) for keywords in self._lists.values())
+    
+    def _build(self):
+        """Build the trie, failure links and merged outputs"""
+        goto = [{}]
+        output = [[]]
+        
+        # Trie of folded keywords; outputs are (length, list name, entry index)
+        for name, keywords in self._lists.items():
+            for entry, keyword in enumerate(keywords):
+                folded = self.fold(keyword)
+                state = 0
+                for char in folded:
+                    next_state = goto[state].get(char)
+                    if next_state is None:
+                        next_state = len(goto)
+                        goto[state][char] = next_state
+                        goto.append({})
+                        output.append([])
+                    state = next_state
+                output[state].append((len(folded), name, entry))
+        
+        # Breadth-first failure links, merging outputs of the fallback state
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, next_state in goto[state].items():
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] = output[next_state] + output[fail[next_state]]
+                queue.append(next_state)
+        
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+        # Transitions including followed failure links, filled in lazily while scanning
+        self._delta = [dict(transitions) for transitions in goto]
+        self._alphabet = frozenset(char for transitions in goto for char in transitions)
+        self._built = True
+    
+    def _transition(self, state: int, char: str) -> int:
+        """Resolve a transition through the failure links and memoize it"""
+        goto = self._goto
+        fallback = state
+        while fallback and char not in goto[fallback]:
+            fallback = self._fail[fallback]
+        next_state = goto[fallback].get(char, 0)
+        self._delta[state][char] = next_state
+        return next_state
+    
+    def search(self, text: str) -> KeywordHits:
+        """Find every keyword occurrence of every list in one pass"""
+        if not self._built:
+            self._build()
+        
+        folded = self.fold(text)
+        delta = self._delta
+        alphabet = self._alphabet
+        output = self._output
+        hits: Dict[Hashable, list] = {}
+        
+        state = 0
+        for position, char in enumerate(folded):
+            next_state = delta[state].get(char)
+            if next_state is None:
+                # Characters outside every keyword always lead back to the root
+                next_state = self._transition(state, char) if char in alphabet else 0
+            state = next_state
+            if output[state]:
+                end = position + 1
+                for length, name, entry in output[state]:
+                    hits.setdefault(name, []).append((end - length, end, entry))
+        
+        return KeywordHits(text, folded, hits)
+    
+    def count_batch(self, texts: List[str], names: List[Hashable]) -> Dict[Hashable, List[int]]:
+        """search(text).count(name) of every text for each name.
+        
+        For short lists the folded texts are joined by newlines and each
+        keyword is located with str.find, skipping to the next text after
+        every hit: one C scan per keyword, with Python work proportional to
+        the hits. That cost grows with the number of keywords, so beyond
+        FIND_MAX_KEYWORDS the texts go through the automaton, one pass each.
+        """
+        keywords = {name: [self.fold(keyword) for keyword in self._lists.get(name, ())] for name in names}
+        if (sum(map(len, keywords.values())) > self.FIND_MAX_KEYWORDS or
+                any(not keyword or '\n' in keyword for folded in keywords.values() for keyword in folded)):
+            hits = [self.search(text) for text in texts]
+            return {name: [text_hits.count(name) for text_hits in hits] for name in names}
+        
+        folded_texts = [self.fold(text) for text in texts]
+        starts = []
+        offset = 0
+        for text in folded_texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        joined = '\n'.join(folded_texts)
+        last = len(starts) - 1
+        
+        counts = {}
+        for name in names:
+            name_counts = [0] * len(texts)
+            for keyword in keywords[name]:
+                position = joined.find(keyword)
+                while position != -1:
+                    i = bisect_right(starts, position) - 1
+                    name_counts[i] += 1
+                    if i == last:
+                        break
+                    position = joined.find(keyword, starts[i + 1])
+            counts[name] = name_counts
+        return counts
@@ -0,0 +1,47 @@
+import numpy as np
+from scipy.special import expit
+
+class LinearNB:
+    """A fitted two-class MultinomialNB scored as the linear model it is.
+    
+    The log-odds of the second class is a dot product of the feature vector
+    with the per-feature difference of the classes' log probabilities, plus
+    the difference of their log priors. Both are precomputed, so scoring a
+    sparse row only touches its non-zero terms. Probabilities match
+    MultinomialNB.predict_proba to within floating point rounding.
+    """
+    
+    def __init__(self, weights: np.ndarray, bias: float, classes: np.ndarray):
+        self.weights = weights
+        self.bias = bias
+        self.classes_ = classes
+    
+    @classmethod
+    def from_sklearn(cls, nb) -> 'LinearNB':
+        """Precompute the weights of a fitted MultinomialNB"""
+        if len(nb.classes_) != 2:
+            raise ValueError("Only two-class Naive Bayes models are linear in log-odds")
+        log_prob = np.asarray(nb.feature_log_prob_)
+        log_prior = np.asarray(nb.class_log_prior_)
+        return cls(log_prob[1] - log_prob[0], float(log_prior[1] - log_prior[0]), np.asarray(nb.classes_))
+    
+    def log_odds(self, *blocks) -> np.ndarray:
+        """Log-odds of the second class for feature columns given as consecutive blocks.
+        
+        The blocks (sparse or dense, same rows) are the feature matrix split
+        by columns, e.g. the TF-IDF terms and the handcrafted features, so
+        they never have to be stacked into one matrix.
+        """
+        scores = np.full(blocks[0].shape[0], self.bias)
+        start = 0
+        for block in blocks:
+            scores += block @ self.weights[start:start + block.shape[1]]
+            start += block.shape[1]
+        if start != len(self.weights):
+            raise ValueError(f"Expected {len(self.weights)} feature columns, got {start}")
+        return scores
+    
+    def predict_proba(self, *blocks) -> np.ndarray:
+        """Class probabilities, in the order of classes_"""
+        log_odds = self.log_odds(*blocks)
+        return np.column_stack([expit(-log_odds), expit(log_odds)])
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Mersenne prime used for the universal hash family (a * x + b) mod p
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+class MinHashLSHIndex:
+    """MinHash signatures with a banded LSH index over recent messages.
+    
+    Messages are shingled into word n-grams and reduced to num_perm MinHash
+    values, whose agreement estimates the Jaccard similarity of the shingle
+    sets. Signatures are split into bands; messages sharing any band bucket
+    are candidate neighbors. Entries expire after ttl_seconds and the oldest
+    are evicted beyond max_entries, so memory stays bounded.
+    """
+    
+    def __init__(self, num_perm: int = 64, bands: int = 16, threshold: float = 0.8,
+                 max_entries: int = 50000, ttl_seconds: float = 3600.0,
+                 shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shingle_size = shingle_size
+        
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, Any, str, float]]" = OrderedDict()
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(bands)]
+        self._next_id = 0
+        self._version = None
+        
+        # Metrics
+        self.queries = 0
+        self.reused = 0
+        self.evicted = 0
+    
+    def _shingles(self, text: str) -> List[str]:
+        """Word n-grams of the text (the whole text if it is shorter)"""
+        words = text.split()
+        k = self.shingle_size
+        if len(words) <= k:
+            return [' '.join(words)]
+        return [' '.join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a (normalized) message"""
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode('utf-8', 'surrogatepass')) for shingle in self._shingles(text)),
+            dtype=np.uint64
+        )
+        permuted = (hashes[:, None] * self._a + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+    
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """Bucket key of each band: the raw bytes of its rows"""
+        band_bytes = signature.tobytes()
+        width = self.rows * signature.itemsize
+        return [band_bytes[i:i + width] for i in range(0, len(band_bytes), width)]
+    
+    def _evict(self, now: float):
+        """Drop expired entries and the oldest ones beyond max_entries"""
+        while self._entries:
+            entry_id, (signature, _, _, inserted_at) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - inserted_at < self.ttl_seconds:
+                break
+            self._remove(entry_id, signature)
+            self.evicted += 1
+    
+    def _remove(self, entry_id: int, signature: np.ndarray):
+        """Remove one entry from the entry table and its band buckets"""
+        del self._entries[entry_id]
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+    
+    def set_version(self, version: str):
+        """Forget every verdict when the model producing them changes"""
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._entries.clear()
+                self._buckets = [{} for _ in range(self.bands)]
+    
+    def query(self, signature: np.ndarray) -> Optional[Tuple[Any, str, float]]:
+        """Find the most similar live neighbor as (result, cluster_id, similarity)"""
+        now = time.time()
+        with self._lock:
+            self.queries += 1
+            self._evict(now)
+            
+            candidates = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(key, ()))
+            
+            if not candidates:
+                return None
+            
+            # Estimated Jaccard similarity against all candidates at once
+            entries = [self._entries[entry_id] for entry_id in candidates]
+            similarities = (np.stack([entry[0] for entry in entries]) == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                return None
+            _, result, cluster_id, _ = entries[best]
+            return result, cluster_id, float(similarities[best])
+    
+    def insert(self, signature: np.ndarray, result: Any, cluster_id: Optional[str] = None) -> str:
+        """Index a classified message, returning its cluster id.
+        
+        A new cluster is named after the signature of its first message, so
+        ids from different processes (or runs) never clash, and processes
+        seeing the same first message name its campaign the same way.
+        """
+        now = time.time()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            if cluster_id is None:
+                cluster_id = "c" + hashlib.blake2b(signature.tobytes(), digest_size=8).hexdigest()
+            
+            self._entries[entry_id] = (signature, result, cluster_id, now)
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(key, set()).add(entry_id)
+            
+            self._evict(now)
+            return cluster_id
+    
+    def mark_reused(self):
+        """Count a model call avoided by reusing a neighbor's verdict"""
+        with self._lock:
+            self.reused += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index size and reuse counters"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "queries": self.queries,
+            "reused": self.reused,
+            "reuse_rate": self.reused / self.queries if self.queries else 0.0,
+            "evicted": self.evicted
+        }
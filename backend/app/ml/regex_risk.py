@@ -0,0 +1,178 @@
+import re
+from itertools import combinations
+from typing import FrozenSet, List, Set, Tuple
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+# Repeats with a larger upper bound than this backtrack like unbounded ones
+_LARGE_REPEAT = 10
+
+# Characters are tracked as ASCII code points, plus one code per class of
+# non-ASCII characters: word characters, whitespace, and everything else
+_NON_ASCII_WORD, _NON_ASCII_SPACE, _NON_ASCII_OTHER = 128, 129, 130
+_NON_ASCII = frozenset({_NON_ASCII_WORD, _NON_ASCII_SPACE, _NON_ASCII_OTHER})
+_ANY = frozenset(range(131))
+
+_CATEGORY_PATTERNS = {
+    sre_parse.CATEGORY_DIGIT: r'\d',
+    sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s',
+    sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w',
+    sre_parse.CATEGORY_NOT_WORD: r'\W'
+}
+_CATEGORY_CHARS = {
+    category: frozenset(c for c in range(128) if re.match(pattern, chr(c))) |
+              {code for code, char in ((_NON_ASCII_WORD, 'é'), (_NON_ASCII_SPACE, '\u2003'), (_NON_ASCII_OTHER, '€'))
+               if re.match(pattern, char)}
+    for category, pattern in _CATEGORY_PATTERNS.items()
+}
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+# Possessive quantifiers and atomic groups are new in Python 3.11
+_POSSESSIVE_REPEAT = getattr(sre_parse, 'POSSESSIVE_REPEAT', None)
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+
+def regex_risks(pattern: str) -> List[str]:
+    """Shapes in a regex that can make re backtrack exponentially (or polynomially) on some inputs.
+    
+    Flags nested unbounded quantifiers like (a+)+, alternations under an
+    unbounded quantifier whose branches can start with the same character
+    like (a|aa)+, and adjacent unbounded quantifiers over overlapping
+    characters like \\d+\\d+. Bounds above _LARGE_REPEAT count as unbounded.
+    The check is static and conservative: a flagged pattern is not
+    necessarily slow on real input. Raises re.error for invalid patterns.
+    """
+    risks = []
+    _check(sre_parse.parse(pattern), False, risks)
+    return list(dict.fromkeys(risks))
+
+def _unbounded(av) -> bool:
+    return av[1] == sre_parse.MAXREPEAT or av[1] > _LARGE_REPEAT
+
+def _check(items, in_unbounded: bool, risks: List[str]):
+    """Walk a parsed pattern, collecting risky shapes"""
+    items = list(items)
+    for index, (op, av) in enumerate(items):
+        if op in _REPEATS:
+            unbounded = _unbounded(av)
+            if unbounded:
+                if in_unbounded:
+                    risks.append("nested unbounded quantifiers (e.g. (a+)+)")
+                if _ambiguous_branch(list(av[2]), _first(av[2])[0]):
+                    risks.append("alternation with overlapping branches under an unbounded quantifier (e.g. (a|aa)+)")
+                if index + 1 < len(items):
+                    next_op, next_av = items[index + 1]
+                    if next_op in _REPEATS and _unbounded(next_av) and _first(av[2])[0] & _first(next_av[2])[0]:
+                        risks.append("adjacent unbounded quantifiers over overlapping characters (e.g. \\d+\\d+)")
+            _check(av[2], in_unbounded or unbounded, risks)
+        elif op == _POSSESSIVE_REPEAT:
+            _check(av[2], False, risks)
+        elif op == sre_parse.SUBPATTERN:
+            _check(av[3], in_unbounded, risks)
+        elif op == _ATOMIC_GROUP:
+            _check(av, False, risks)
+        elif op == sre_parse.BRANCH:
+            for alternative in av[1]:
+                _check(alternative, in_unbounded, risks)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            _check(av[1], in_unbounded, risks)
+        elif op == sre_parse.GROUPREF_EXISTS:
+            for branch in av[1:]:
+                if branch is not None:
+                    _check(branch, in_unbounded, risks)
+
+def _ambiguous_branch(items, follow: FrozenSet[int]) -> bool:
+    """Whether a repeated sequence has an alternation two of whose branches can start alike.
+    
+    follow is what can come after the sequence: an empty branch starts with it.
+    """
+    for index, (op, av) in enumerate(items):
+        rest, rest_nullable = _first(items[index + 1:])
+        after = rest | follow if rest_nullable else rest
+        if op == sre_parse.BRANCH:
+            starts = []
+            for alternative in av[1]:
+                chars, nullable = _first(alternative)
+                starts.append(chars | after if nullable else chars)
+                if _ambiguous_branch(list(alternative), after):
+                    return True
+            if any(a & b for a, b in combinations(starts, 2)):
+                return True
+        elif op == sre_parse.SUBPATTERN and _ambiguous_branch(list(av[3]), after):
+            return True
+    return False
+
+def _first(items) -> Tuple[FrozenSet[int], bool]:
+    """Characters a sequence can start with, and whether it can match the empty string"""
+    chars: Set[int] = set()
+    for op, av in items:
+        item_chars, nullable = _first_item(op, av)
+        chars |= item_chars
+        if not nullable:
+            return frozenset(chars), False
+    return frozenset(chars), True
+
+def _first_item(op, av) -> Tuple[FrozenSet[int], bool]:
+    if op == sre_parse.LITERAL:
+        return _literal(av), False
+    if op in (sre_parse.NOT_LITERAL, sre_parse.ANY):
+        return _ANY, False
+    if op == sre_parse.IN:
+        return _char_set(av), False
+    if op in _REPEATS or op == _POSSESSIVE_REPEAT:
+        chars, nullable = _first(av[2])
+        return chars, nullable or av[0] == 0
+    if op == sre_parse.SUBPATTERN:
+        return _first(av[3])
+    if op == _ATOMIC_GROUP:
+        return _first(av)
+    if op == sre_parse.BRANCH:
+        firsts = [_first(alternative) for alternative in av[1]]
+        return frozenset().union(*(chars for chars, _ in firsts)), any(nullable for _, nullable in firsts)
+    if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return frozenset(), True
+    # Backreferences, conditionals and anything unknown: assume the worst
+    return _ANY, True
+
+def _literal(code: int) -> FrozenSet[int]:
+    """A literal character, in both cases (the pattern may be case-insensitive)"""
+    char = chr(code)
+    if code >= 128:
+        if char.isspace():
+            return frozenset({_NON_ASCII_SPACE})
+        return frozenset({_NON_ASCII_WORD if re.match(r'\w', char) else _NON_ASCII_OTHER})
+    return frozenset({ord(char.lower()), ord(char.upper())})
+
+def _char_set(items) -> FrozenSet[int]:
+    """Characters matched by a [...] set"""
+    chars: Set[int] = set()
+    # Single non-ASCII characters stand for part of their class only, so
+    # negating the set does not rule the whole class out
+    partial: Set[int] = set()
+    negate = False
+    for op, av in items:
+        if op == sre_parse.NEGATE:
+            negate = True
+        elif op == sre_parse.LITERAL:
+            chars |= _literal(av)
+            if av >= 128:
+                partial |= _literal(av)
+        elif op == sre_parse.RANGE:
+            low, high = av
+            chars |= {c for c in range(low, min(high, 127) + 1)}
+            chars |= {ord(chr(c).swapcase()) for c in range(low, min(high, 127) + 1) if chr(c).isalpha()}
+            if high >= 128:
+                chars |= _NON_ASCII
+                partial |= _NON_ASCII
+        elif op == sre_parse.CATEGORY:
+            chars |= _CATEGORY_CHARS.get(av, _ANY)
+        else:
+            chars |= _ANY
+    if negate:
+        return frozenset((_ANY - chars) | partial)
+    return frozenset(chars)
@@ -0,0 +1,321 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app import config
+from app.ml.artifact import export_model, load_model_arrays
+from app.ml.classifier import SpamClassifier
+
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT'
+LOCK = '.lock'
+
+# Versions name directories, so they are restricted to safe characters
+_VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+def _sha256(path: str) -> str:
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ModelRegistry:
+    """Versioned, checksummed model artifacts in a local directory.
+    
+    Every version is an immutable array directory (see app.ml.artifact)
+    under versions/, named by its model version and holding a manifest with
+    the SHA-256 of each file. CURRENT names the version to serve. Versions
+    are written to a temporary directory and renamed into place, and CURRENT
+    is replaced atomically, so no reader ever sees a partial artifact.
+    """
+    
+    def __init__(self, root: str):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+    
+    def _version_dir(self, version: str) -> str:
+        if not _VERSION_PATTERN.match(version or ''):
+            raise ValueError(f"Invalid model version: {version!r}")
+        return os.path.join(self.versions_dir, version)
+    
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the registry's lock file, serializing changes to CURRENT across processes"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def publish(self, model_data: Dict, activate: bool = False, parent: Optional[str] = None) -> str:
+        """Store a trained model as a new version, returning the version.
+        
+        parent names the version the model was derived from, e.g. by feedback.
+        """
+        version = model_data.get('model_version')
+        directory = self._version_dir(version)
+        if os.path.exists(directory):
+            raise ValueError(f"Model version {version} is already published")
+        
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.publish-', dir=self.versions_dir)
+        try:
+            export_model(model_data, staging)
+            manifest = {
+                'version': version,
+                'created': time.time(),
+                'parent': parent,
+                'files': {name: _sha256(os.path.join(staging, name)) for name in sorted(os.listdir(staging))}
+            }
+            with open(os.path.join(staging, MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.chmod(staging, 0o755)
+            os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        
+        if activate:
+            self.activate(version)
+        return version
+    
+    def publish_pickle(self, path: str, activate: bool = False) -> str:
+        """Store a pickled model (e.g. models/spam_classifier.pkl) as a new version"""
+        with open(path, 'rb') as f:
+            raw_data = f.read()
+        model_data = pickle.loads(raw_data)
+        # Same version as SpamClassifier.load_model gives older pickles
+        model_data['model_version'] = model_data.get('model_version') or hashlib.sha256(raw_data).hexdigest()[:32]
+        return self.publish(model_data, activate)
+    
+    def manifest(self, version: str) -> Dict[str, Any]:
+        """Manifest of a published version"""
+        path = os.path.join(self._version_dir(version), MANIFEST)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"Unknown model version: {version}")
+    
+    def versions(self) -> List[Dict[str, Any]]:
+        """Manifests of all published versions, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        manifests = [self.manifest(name) for name in os.listdir(self.versions_dir)
+                     if not name.startswith('.') and os.path.exists(os.path.join(self.versions_dir, name, MANIFEST))]
+        return sorted(manifests, key=lambda manifest: manifest['created'])
+    
+    def current_version(self) -> Optional[str]:
+        """Version to serve, if any is active"""
+        try:
+            with open(os.path.join(self.root, CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def activate(self, version: str):
+        """Make a published version the one to serve"""
+        self.manifest(version)
+        with self._locked():
+            self._write_current(version)
+    
+    def activate_if_current(self, version: str, expected: Optional[str]) -> bool:
+        """Activate a version only if expected is still the current one; True if it was activated"""
+        self.manifest(version)
+        with self._locked():
+            if self.current_version() != expected:
+                return False
+            self._write_current(version)
+        return True
+    
+    def _write_current(self, version: str):
+        path = os.path.join(self.root, CURRENT)
+        with open(path + '.tmp', 'w') as f:
+            f.write(version + '\n')
+        os.replace(path + '.tmp', path)
+    
+    def remove(self, version: str):
+        """Delete a version that is not the current one.
+        
+        Processes still serving it keep their memory-mapped files until they move on.
+        """
+        directory = self._version_dir(version)
+        with self._locked():
+            if self.current_version() == version:
+                raise ValueError(f"Model version {version} is the current version")
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    def prune_derived(self, keep: int) -> List[str]:
+        """Delete all but the newest keep versions derived from another (see publish), returning them"""
+        current = self.current_version()
+        derived = [manifest['version'] for manifest in self.versions()
+                   if manifest.get('parent') and manifest['version'] != current]
+        removed = derived[:max(len(derived) - keep, 0)]
+        for version in removed:
+            self.remove(version)
+        return removed
+    
+    def verify(self, version: str) -> Dict[str, Any]:
+        """Check every file of a version against its manifest, returning the manifest"""
+        manifest = self.manifest(version)
+        directory = self._version_dir(version)
+        for name, checksum in manifest['files'].items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path) or _sha256(path) != checksum:
+                raise ValueError(f"Model version {version} is corrupt: checksum mismatch for {name}")
+        return manifest
+    
+    def load_classifier(self, version: Optional[str] = None) -> SpamClassifier:
+        """Verify and load a version (default: the current one), memory-mapping its arrays"""
+        version = version or self.current_version()
+        if version is None:
+            raise ValueError(f"No active model version in {self.root}")
+        
+        self.verify(version)
+        classifier = SpamClassifier(load=False)
+        classifier.set_model_data(load_model_arrays(self._version_dir(version)))
+        return classifier
+
+class ModelReloader:
+    """Loads registry versions in the background and swaps them in.
+    
+    A watch thread polls the registry's CURRENT pointer every
+    interval_seconds, and reload() loads a version on demand. Reading and
+    verifying a version happens off the request path; the swap is a single
+    reference assignment (on_load), so requests already running finish on
+    the model they started with while new ones get the new version.
+    """
+    
+    def __init__(self, registry: ModelRegistry, on_load: Callable[[SpamClassifier], None],
+                 interval_seconds: float = 2.0, loaded_version: Optional[str] = None):
+        self.registry = registry
+        self.on_load = on_load
+        self.interval_seconds = interval_seconds
+        self.loaded_version = loaded_version
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        
+        # Metrics
+        self._reloads = 0
+        self._last_error = None
+        self._last_load_seconds = 0.0
+    
+    def reload(self, version: Optional[str] = None) -> str:
+        """Load a version (default: the current one) and swap it in, returning the version"""
+        version = version or self.registry.current_version()
+        if version is None:
+            raise ValueError(f"No active model version in {self.registry.root}")
+        
+        # One load at a time; the last one to finish is what serves
+        with self._lock:
+            start = time.perf_counter()
+            classifier = self.registry.load_classifier(version)
+            self.on_load(classifier)
+            self.loaded_version = version
+            self._reloads += 1
+            self._last_load_seconds = time.perf_counter() - start
+        print(f"Loaded model version {version}")
+        return version
+    
+    def install(self, classifier: SpamClassifier):
+        """Swap in a classifier this process published itself, without loading it back"""
+        with self._lock:
+            self.on_load(classifier)
+            self.loaded_version = classifier.model_version
+    
+    def check(self) -> bool:
+        """Reload if the registry's current version changed; True if it did"""
+        current = self.registry.current_version()
+        if current is None or current == self.loaded_version:
+            return False
+        try:
+            self.reload(current)
+            self._last_error = None
+        except Exception as e:
+            # Keep serving the loaded version; retried on the next check
+            print(f"Error loading model version {current}: {e}")
+            self._last_error = str(e)
+            return False
+        return True
+    
+    def start(self):
+        """Start watching the registry"""
+        if self._thread is None and self.interval_seconds > 0:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="model-watch", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop watching the registry"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stopping.wait(self.interval_seconds):
+            self.check()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get registry and reload statistics"""
+        return {
+            "registry": self.registry.root,
+            "current_version": self.registry.current_version(),
+            "loaded_version": self.loaded_version,
+            "reloads": self._reloads,
+            "last_load_ms": round(self._last_load_seconds * 1000, 2),
+            "last_error": self._last_error
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry")
+    parser.add_argument('--registry', default=config.MODEL_REGISTRY_DIR, required=config.MODEL_REGISTRY_DIR is None,
+                        help="registry directory (default: SPAMGUARD_MODEL_REGISTRY)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish = commands.add_parser('publish', help="store a pickled model as a new version")
+    publish.add_argument('pickle_path')
+    publish.add_argument('--activate', action='store_true', help="also make it the version to serve")
+    commands.add_parser('list', help="list published versions")
+    activate = commands.add_parser('activate', help="make a version the one to serve")
+    activate.add_argument('version')
+    verify = commands.add_parser('verify', help="check a version's checksums")
+    verify.add_argument('version')
+    args = parser.parse_args()
+    
+    registry = ModelRegistry(args.registry)
+    try:
+        if args.command == 'publish':
+            version = registry.publish_pickle(args.pickle_path, args.activate)
+            print(f"Published model version {version}" + (" (active)" if args.activate else ""))
+        elif args.command == 'list':
+            current = registry.current_version()
+            for manifest in registry.versions():
+                created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['created']))
+                print(f"{'*' if manifest['version'] == current else ' '} {manifest['version']}  {created}")
+        elif args.command == 'activate':
+            registry.verify(args.version)
+            registry.activate(args.version)
+            print(f"Activated model version {args.version}")
+        else:
+            registry.verify(args.version)
+            print(f"Model version {args.version} is intact")
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
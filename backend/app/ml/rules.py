@@ -1,8 +1,25 @@
 import re
 import string
-from typing import Dict, List, Tuple
+import hashlib
+import time
+from typing import Dict, Iterator, List, Tuple, Optional
 from dataclasses import dataclass
 
+from app.ml.keywords import KeywordIndex, fold_ignorecase, keyword_pattern, parse_keyword_pattern
+from app.ml.regex_risk import regex_risks
+from app.ml.text import clean_text
+
+# Defaults for scanning untrusted text: characters of a message that are
+# scanned at all, size of the chunks longer texts are scanned in, and the
+# time one rule may spend on one message
+MAX_SCAN_CHARS = 100_000
+SCAN_CHUNK_CHARS = 8192
+MATCH_BUDGET_MS = 5.0
+
+# A chunk's regex scan reads this far into the next chunk, so matches
+# starting near the end of a chunk are usually found in one pass
+SCAN_OVERLAP_CHARS = 512
+
 @dataclass
 class Rule:
     """Represents a spam detection rule"""
@@ -12,11 +29,181 @@ class Rule:
     description: str
     rule_type: str
 
+@dataclass
+class RuleCost:
+    """Time a rule has spent matching, and how often it went over its budget.
+    
+    The counters are updated without a lock to keep matching cheap, so with
+    several classification threads a few updates can be lost: the figures
+    are approximate.
+    """
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    overruns: int = 0
+    
+    def record(self, seconds: float, budget: float) -> bool:
+        """Count one call; True if it went over budget"""
+        self.calls += 1
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        if seconds > budget:
+            self.overruns += 1
+            return True
+        return False
+    
+    def as_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'total_ms': round(self.seconds * 1000, 3),
+            'mean_us': round(self.seconds / self.calls * 1e6, 2) if self.calls else 0.0,
+            'max_ms': round(self.max_seconds * 1000, 3),
+            'overruns': self.overruns
+        }
+
+def scan_chunks(text: str, chunk_chars: int) -> Iterator[Tuple[int, int]]:
+    """Split text into (start, end) chunks of at most chunk_chars, cut before a space where possible"""
+    start = 0
+    while len(text) - start > chunk_chars:
+        end = text.rfind(' ', start + 1, start + chunk_chars)
+        if end <= start:
+            end = start + chunk_chars
+        yield start, end
+        start = end
+    yield start, len(text)
+
+def _findall_item(match: re.Match):
+    """What re.findall returns for one match"""
+    groups = match.groups(default='')
+    if not groups:
+        return match.group()
+    return groups[0] if len(groups) == 1 else groups
+
+class CompiledRuleMatcher:
+    """Precompiled matcher for a fixed set of rules.
+    
+    Rules that are plain case-insensitive keyword alternations are served by
+    one shared Aho-Corasick keyword index, so all keyword lists are scored in
+    a single pass over the message. The remaining structural rules are
+    compiled once up front and run back to back.
+    
+    Every rule's matching time is added to its RuleCost. Only the first
+    max_scan_chars characters of a message are scanned, in chunks of
+    chunk_chars, and a regex stops after the chunk where it went over
+    budget_seconds: re cannot be interrupted, so one call is bounded by
+    the chunk size rather than the message size. Each chunk keeps the
+    matches that start in it, read on through the next SCAN_OVERLAP_CHARS
+    characters; a match reaching the end of that window is matched again
+    against the rest of the text. Results match a scan of the whole text
+    unless a lookahead needs text past the window.
+    """
+    
+    def __init__(self, rules: List[Rule], costs: Optional[List[RuleCost]] = None,
+                 keyword_cost: Optional[RuleCost] = None, max_scan_chars: int = MAX_SCAN_CHARS,
+                 chunk_chars: int = SCAN_CHUNK_CHARS, budget_seconds: float = MATCH_BUDGET_MS / 1000):
+        self.rules = list(rules)
+        self.costs = costs if costs is not None else [RuleCost() for _ in self.rules]
+        self.keyword_cost = keyword_cost if keyword_cost is not None else RuleCost()
+        self.max_scan_chars = max_scan_chars
+        self.chunk_chars = chunk_chars
+        self.budget_seconds = budget_seconds
+        self.overran = False  # set once any rule goes over budget
+        self._compiled = [re.compile(rule.pattern) for rule in self.rules]
+        self._findall = [pattern.findall for pattern in self._compiled]
+        
+        # Route literal keyword rules through the shared keyword index
+        self._keyword_index = KeywordIndex(fold=fold_ignorecase)
+        self._keyword_rules = set()
+        for i, rule in enumerate(self.rules):
+            keywords = parse_keyword_pattern(rule.pattern)
+            if keywords is not None:
+                self._keyword_index.add_list(i, keywords)
+                self._keyword_rules.add(i)
+    
+    def find_matches(self, message: str) -> List[list]:
+        """Return the re.findall matches of every rule, in rule order"""
+        if len(message) > self.max_scan_chars:
+            message = message[:self.max_scan_chars]
+        chunks = list(scan_chunks(message, self.chunk_chars)) if len(message) > self.chunk_chars else None
+        length = len(message)
+        
+        hits = None
+        if self._keyword_rules:
+            # One linear pass for every keyword rule, accounted as a whole
+            start = time.perf_counter()
+            hits = self._keyword_index.search(message)
+            self.keyword_cost.record(time.perf_counter() - start, self.budget_seconds)
+            if not hits.aligned:
+                hits = None  # fall back to the compiled regexes
+        
+        # Each rule's end time is the next one's start: one clock read per rule
+        budget = self.budget_seconds
+        matches = []
+        start = time.perf_counter()
+        for i, findall in enumerate(self._findall):
+            if hits is not None and i in self._keyword_rules:
+                matches.append(hits.findall(i))
+                start = time.perf_counter()
+                continue
+            
+            if chunks is None:
+                found = findall(message)
+            else:
+                # Each chunk keeps the matches starting in it
+                pattern = self._compiled[i]
+                found = []
+                last_end = 0
+                for chunk_start, chunk_end in chunks:
+                    # Resume after a match that ran into this chunk
+                    window_end = min(chunk_end + SCAN_OVERLAP_CHARS, length)
+                    for match in pattern.finditer(message, max(chunk_start, last_end), window_end):
+                        if match.start() >= chunk_end and chunk_end < length:
+                            break
+                        if match.end() == window_end < length:
+                            # Cut off by the window: match again without it
+                            match = pattern.match(message, match.start()) or match
+                        found.append(_findall_item(match))
+                        last_end = match.end()
+                    if time.perf_counter() - start > budget:
+                        break
+            end = time.perf_counter()
+            
+            # RuleCost.record, inlined
+            elapsed = end - start
+            cost = self.costs[i]
+            cost.calls += 1
+            cost.seconds += elapsed
+            if elapsed > cost.max_seconds:
+                cost.max_seconds = elapsed
+            if elapsed > budget:
+                cost.overruns += 1
+                self.overran = True
+            matches.append(found)
+            start = end
+        return matches
+
 class RulesEngine:
-    """Rule-based spam detection engine"""
+    """Rule-based spam detection engine.
     
-    def __init__(self):
+    Tracks the matching time of every rule. Rules that go over the per-rule
+    match budget are flagged in get_statistics; with disable_after set, a
+    rule is disabled once it has gone over budget that many times.
+    """
+    
+    def __init__(self, max_scan_chars: int = MAX_SCAN_CHARS, chunk_chars: int = SCAN_CHUNK_CHARS,
+                 match_budget_ms: float = MATCH_BUDGET_MS, disable_after: int = 0):
         self.rules = self._initialize_rules()
+        self.max_scan_chars = max_scan_chars
+        self.chunk_chars = chunk_chars
+        self.match_budget_ms = match_budget_ms
+        self.disable_after = disable_after
+        self.disabled_rules: List[str] = []
+        self._costs: Dict[str, RuleCost] = {}
+        self._keyword_cost = RuleCost()
+        self._matcher: Optional[CompiledRuleMatcher] = None
+        self._fingerprint: Optional[str] = None
+        self.rules_version = 0
     
     def _initialize_rules(self) -> List[Rule]:
         """Initialize predefined spam detection rules"""
@@ -115,6 +302,11 @@ class RulesEngine:
     
     def analyze_message(self, message: str) -> Dict:
         """Analyze a message against all rules"""
+        # Clean message for analysis
+        return self.analyze_cleaned(self.clean_message(message))
+    
+    def analyze_cleaned(self, message: str) -> Dict:
+        """Analyze a message that already went through clean_message"""
         results = {
             'total_score': 0.0,
             'matched_rules': [],
@@ -123,12 +315,12 @@ class RulesEngine:
             'rule_details': []
         }
         
-        # Clean message for analysis
-        clean_message = self._clean_message(message)
-        
-        # Check each rule
-        for rule in self.rules:
-            matches = self._check_rule(clean_message, rule)
+        # Check every rule with the precompiled matcher
+        matcher = self._get_matcher()
+        rule_matches = matcher.find_matches(message)
+        if matcher.overran and self.disable_after > 0:
+            self._disable_overrunning(matcher)
+        for rule, matches in zip(matcher.rules, rule_matches):
             if matches:
                 rule_score = rule.weight * len(matches)
                 results['total_score'] += rule_score
@@ -147,16 +339,64 @@ class RulesEngine:
         
         return results
     
-    def _clean_message(self, message: str) -> str:
+    def clean_message(self, message: str) -> str:
         """Clean message for analysis"""
         # Remove extra whitespace
-        message = re.sub(r'\s+', ' ', message.strip())
-        return message
+        return clean_text(message)
+    
+    def _get_matcher(self) -> CompiledRuleMatcher:
+        """Return the compiled matcher, rebuilding it if the rule set changed"""
+        matcher = self._matcher
+        if matcher is None:
+            # Costs are kept per rule name, so they survive rebuilds
+            rules = self._enabled_rules()
+            matcher = CompiledRuleMatcher(
+                rules,
+                costs=[self._costs.setdefault(rule.name, RuleCost()) for rule in rules],
+                keyword_cost=self._keyword_cost,
+                max_scan_chars=self.max_scan_chars,
+                chunk_chars=self.chunk_chars,
+                budget_seconds=self.match_budget_ms / 1000
+            )
+            self._matcher = matcher
+        return matcher
     
-    def _check_rule(self, message: str, rule: Rule) -> List[str]:
-        """Check if a rule matches the message"""
-        matches = re.findall(rule.pattern, message)
-        return matches if matches else []
+    def _enabled_rules(self) -> List[Rule]:
+        return [rule for rule in self.rules if rule.name not in self.disabled_rules]
+    
+    def _disable_overrunning(self, matcher: CompiledRuleMatcher):
+        """Disable the rules that went over budget disable_after times"""
+        matcher.overran = False
+        for rule, cost in zip(matcher.rules, matcher.costs):
+            if cost.overruns >= self.disable_after and rule.name not in self.disabled_rules:
+                print(f"Warning: disabling rule '{rule.name}': over the {self.match_budget_ms:g} ms match "
+                      f"budget {cost.overruns} times (max {cost.max_seconds * 1000:.1f} ms)")
+                self.disabled_rules.append(rule.name)
+                self._invalidate()
+    
+    def enable_rule(self, name: str) -> bool:
+        """Re-enable a rule disabled for going over budget, resetting its overrun count"""
+        if name not in self.disabled_rules:
+            return False
+        self.disabled_rules.remove(name)
+        self._costs.pop(name, None)
+        self._invalidate()
+        return True
+    
+    def _invalidate(self):
+        """Mark the compiled matcher as stale after a rule set change"""
+        self._matcher = None
+        self._fingerprint = None
+        self.rules_version += 1
+    
+    def rules_fingerprint(self) -> str:
+        """Content hash of the rule set, identical across processes with the same rules"""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for rule in self._enabled_rules():
+                digest.update(repr((rule.name, rule.pattern, rule.weight, rule.description, rule.rule_type)).encode())
+            self._fingerprint = digest.hexdigest()[:32]
+        return self._fingerprint
     
     def get_rule_by_name(self, name: str) -> Rule:
         """Get a specific rule by name"""
@@ -165,8 +405,21 @@ class RulesEngine:
                 return rule
         return None
     
-    def add_custom_rule(self, name: str, pattern: str, weight: float, description: str, rule_type: str = "custom"):
-        """Add a custom rule to the engine"""
+    def add_custom_rule(self, name: str, pattern: str, weight: float, description: str, rule_type: str = "custom",
+                        allow_risky: bool = False):
+        """Add a custom rule to the engine.
+        
+        Patterns with shapes prone to catastrophic backtracking (see
+        regex_risks) are refused unless allow_risky is set.
+        """
+        try:
+            risks = regex_risks(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern for rule '{name}': {e}")
+        if risks and not allow_risky:
+            raise ValueError(f"Risky pattern for rule '{name}': {'; '.join(risks)} "
+                             "(pass allow_risky=True to add it anyway)")
+        
         custom_rule = Rule(
             name=name,
             pattern=pattern,
@@ -175,12 +428,22 @@ class RulesEngine:
             rule_type=rule_type
         )
         self.rules.append(custom_rule)
+        self._invalidate()
+    
+    def add_keyword_rule(self, name: str, keywords: List[str], weight: float, description: str,
+                         rule_type: str = "custom"):
+        """Add a rule matching any of the given literal keywords (case-insensitive, whole words)"""
+        self.add_custom_rule(name, keyword_pattern(keywords), weight, description, rule_type)
     
     def remove_rule(self, name: str) -> bool:
         """Remove a rule by name"""
         for i, rule in enumerate(self.rules):
             if rule.name == name:
                 del self.rules[i]
+                self._costs.pop(name, None)
+                if name in self.disabled_rules:
+                    self.disabled_rules.remove(name)
+                self._invalidate()
                 return True
         return False
     
@@ -206,20 +469,20 @@ class RulesEngine:
             'category_details': {}
         }
         
-        # Group rules by type
+        # Match all rules once, then group them by type
+        matcher = self._get_matcher()
         rule_categories = {}
-        for rule in self.rules:
+        for rule, matches in zip(matcher.rules, matcher.find_matches(message)):
             if rule.rule_type not in rule_categories:
                 rule_categories[rule.rule_type] = []
-            rule_categories[rule.rule_type].append(rule)
+            rule_categories[rule.rule_type].append((rule, matches))
         
         # Analyze each category
         for category, category_rules in rule_categories.items():
             category_score = 0.0
             category_matches = []
             
-            for rule in category_rules:
-                matches = self._check_rule(message, rule)
+            for rule, matches in category_rules:
                 if matches:
                     rule_score = rule.weight * len(matches)
                     category_score += rule_score
@@ -271,6 +534,21 @@ class RulesEngine:
             else:
                 stats['weight_distribution']['high'] += 1
         
+        # Matching cost per rule (approximate); rules over the match budget are flagged.
+        # Keyword-indexed rules only count regex fallbacks here, their index
+        # lookups are in keyword_index_cost
+        costs = {rule.name: self._costs.get(rule.name, RuleCost()) for rule in self.rules}
+        stats['match_budget_ms'] = self.match_budget_ms
+        stats['rule_costs'] = {}
+        for rule in self.rules:
+            cost = costs[rule.name].as_dict()
+            if parse_keyword_pattern(rule.pattern) is not None:
+                cost['keyword_indexed'] = True
+            stats['rule_costs'][rule.name] = cost
+        stats['keyword_index_cost'] = self._keyword_cost.as_dict()
+        stats['over_budget_rules'] = [name for name, cost in costs.items() if cost.overruns]
+        stats['disabled_rules'] = list(self.disabled_rules)
+        
         return stats
 
 # Example usage
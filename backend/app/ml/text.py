@@ -0,0 +1,117 @@
+import re
+from typing import Callable, List, NamedTuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+# Spans removed from the model's view of a message, in removal order
+URL_PATTERN = re.compile(r'http\S+|www\S+')
+EMAIL_PATTERN = re.compile(r'\S+@\S+')
+PHONE_PATTERN = re.compile(r'\d{3}-\d{3}-\d{4}|\d{10}')
+EXCLAMATIONS_PATTERN = re.compile(r'[!]{2,}')
+QUESTIONS_PATTERN = re.compile(r'[?]{2,}')
+
+class NormalizedText(NamedTuple):
+    """Both normalized forms of a message, produced in one stage"""
+    cleaned: str    # whitespace collapsed, case kept: what the rules engine scans
+    processed: str  # lowercased with URLs, emails and phone numbers removed: what the model sees
+
+def clean_text(message: str) -> str:
+    """Collapse whitespace runs to single spaces and strip the ends"""
+    return ' '.join(message.split())
+
+def preprocess_cleaned(cleaned: str) -> str:
+    """The model's view of a message that already went through clean_text.
+    
+    Same result as the original chain of re.sub passes over the raw text:
+    every removal works inside a whitespace-delimited run, so collapsing
+    whitespace first changes nothing. Passes whose pattern cannot match
+    are skipped with a substring check instead of a regex scan.
+    """
+    text = cleaned.lower()
+    
+    # Remove URLs
+    if 'http' in text or 'www' in text:
+        text = URL_PATTERN.sub('', text)
+    
+    # Remove email addresses
+    if '@' in text:
+        text = EMAIL_PATTERN.sub('', text)
+    
+    # Remove phone numbers
+    text = PHONE_PATTERN.sub('', text)
+    
+    # Remove excessive punctuation
+    if '!!' in text:
+        text = EXCLAMATIONS_PATTERN.sub('!', text)
+    if '??' in text:
+        text = QUESTIONS_PATTERN.sub('?', text)
+    
+    # Removals leave whitespace runs behind
+    return ' '.join(text.split())
+
+def normalize_message(message: str) -> NormalizedText:
+    """Normalize a message once for both the rules engine and the model"""
+    cleaned = clean_text(message)
+    return NormalizedText(cleaned, preprocess_cleaned(cleaned))
+
+def build_token_analyzer(vectorizer) -> Callable[[str], List[str]]:
+    """Tokens (with n-grams) of preprocessed text, as the vectorizer's analyzer produces them.
+    
+    The lowercasing step of the analyzer is skipped: preprocessed text is
+    already lowercase and str.lower is idempotent, so only tokenization and
+    n-gram generation remain.
+    """
+    # Our vectorizers wrap a scikit-learn one holding the analyzer settings
+    template = vectorizer.analyzer_template() if hasattr(vectorizer, 'analyzer_template') else vectorizer
+    if (template.analyzer != 'word' or template.input != 'content' or
+            template.preprocessor is not None or template.strip_accents is not None):
+        return template.build_analyzer()
+    
+    tokenize = template.build_tokenizer()
+    stop_words = template.get_stop_words()
+    word_ngrams = template._word_ngrams
+    return lambda text: word_ngrams(tokenize(text), stop_words)
+
+def weight_counts(X: sparse.csr_matrix, idf: np.ndarray, binary: bool = False, sublinear_tf: bool = False,
+                  use_idf: bool = True, norm: str = 'l2') -> sparse.csr_matrix:
+    """Turn a term count matrix into TF-IDF, in place, with TfidfVectorizer's exact steps"""
+    if binary:
+        X.data.fill(1)
+    if sublinear_tf:
+        np.log(X.data, X.data)
+        X.data += 1.0
+    if use_idf:
+        X.data *= idf[X.indices]
+    if norm is not None:
+        X = normalize(X, norm=norm, copy=False)
+    return X
+
+def transform_tokens(vectorizer, token_lists: List[List[str]]) -> sparse.csr_matrix:
+    """Vectorize already-analyzed documents with a fitted vectorizer"""
+    if hasattr(vectorizer, 'transform_tokens'):
+        return vectorizer.transform_tokens(token_lists)
+    
+    # A fitted scikit-learn TfidfVectorizer: count in-vocabulary terms like CountVectorizer
+    vocabulary = vectorizer.vocabulary_
+    indices = []
+    values = []
+    indptr = [0]
+    for tokens in token_lists:
+        counter = {}
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                counter[column] = counter.get(column, 0) + 1
+        indices.extend(counter.keys())
+        values.extend(counter.values())
+        indptr.append(len(indices))
+    
+    X = sparse.csr_matrix(
+        (np.array(values, dtype=vectorizer.dtype), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+        shape=(len(token_lists), len(vocabulary))
+    )
+    X.sort_indices()
+    idf = vectorizer.idf_ if vectorizer.use_idf else None
+    return weight_counts(X, idf, vectorizer.binary, vectorizer.sublinear_tf, vectorizer.use_idf, vectorizer.norm)
@@ -0,0 +1,276 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app import config
+from app.cache import ResultCache, cache_from_config, content_key
+from app.metrics import ServingMetrics
+from app.profiler import SamplingProfiler
+from app.ml.cascade import Cascade
+from app.ml.classifier import SpamClassifier
+from app.ml.lsh import MinHashLSHIndex
+from app.ml.registry import ModelRegistry, ModelReloader
+from app.ml.rules import RulesEngine
+from app.ml.text import normalize_message
+
+# Components used by classify_messages in this process. The API process
+# registers its own instances; process pool workers load theirs once at startup.
+_classifier: Optional[SpamClassifier] = None
+_rule_engine: Optional[RulesEngine] = None
+_cache: Optional[ResultCache] = None
+_lsh: Optional[MinHashLSHIndex] = None
+_reloader: Optional[ModelReloader] = None
+_cascade: Optional[Cascade] = None
+
+# Stage timings and rule hits of the classification calls run in this process,
+# and the on-demand profiler sampling them
+_metrics = ServingMetrics()
+_profiler = SamplingProfiler()
+
+def set_components(classifier: SpamClassifier, rule_engine: RulesEngine,
+                   cache: Optional[ResultCache] = None, lsh: Optional[MinHashLSHIndex] = None,
+                   cascade: Optional[Cascade] = None):
+    """Register the classifier, rules engine, result cache, near-duplicate index and cascade of this process"""
+    global _classifier, _rule_engine, _cache, _lsh, _cascade
+    _classifier = classifier
+    _rule_engine = rule_engine
+    _cache = cache
+    _lsh = lsh
+    _cascade = cascade
+
+def set_classifier(classifier: SpamClassifier):
+    """Swap in another classifier; calls already running finish with the one they started with"""
+    global _classifier
+    _classifier = classifier
+
+def registry_from_config() -> Optional[ModelRegistry]:
+    """The model registry named by SPAMGUARD_MODEL_REGISTRY, if any"""
+    return ModelRegistry(config.MODEL_REGISTRY_DIR) if config.MODEL_REGISTRY_DIR else None
+
+def classifier_from_config() -> SpamClassifier:
+    """Load the model to serve: the registry's current version, else SPAMGUARD_MODEL_ARRAYS or the pickle.
+    
+    Never trains: serving processes must not race each other writing a model.
+    """
+    registry = registry_from_config()
+    if registry is not None and registry.current_version() is not None:
+        return registry.load_classifier()
+    
+    classifier = SpamClassifier(arrays_dir=config.MODEL_ARRAYS_DIR, featurizer=config.FEATURIZER,
+                                train_if_missing=False)
+    if not classifier.is_trained:
+        raise RuntimeError(
+            f"No trained model found (registry {config.MODEL_REGISTRY_DIR or 'off'}, pickle {config.MODEL_PATH}); "
+            "train one with python -m app.train or publish one with python -m app.ml.registry"
+        )
+    return classifier
+
+def reloader_from_config() -> Optional[ModelReloader]:
+    """Registry watcher that swaps newly activated versions into this process"""
+    registry = registry_from_config()
+    if registry is None:
+        return None
+    
+    # Loaded from the registry unless the registry has no current version yet
+    current = registry.current_version()
+    loaded = current if _classifier is not None and _classifier.model_version == current else None
+    return ModelReloader(registry, set_classifier, config.MODEL_WATCH_SECONDS, loaded_version=loaded)
+
+def rule_engine_from_config() -> RulesEngine:
+    """Build the rules engine with the SPAMGUARD_RULES_* scanning limits"""
+    return RulesEngine(
+        max_scan_chars=config.RULES_MAX_SCAN_CHARS,
+        chunk_chars=config.RULES_CHUNK_CHARS,
+        match_budget_ms=config.RULES_MATCH_BUDGET_MS,
+        disable_after=config.RULES_DISABLE_AFTER
+    )
+
+def lsh_from_config() -> Optional[MinHashLSHIndex]:
+    """Build the near-duplicate index described by the SPAMGUARD_LSH_* settings"""
+    if config.LSH_MAX_ENTRIES <= 0:
+        return None
+    return MinHashLSHIndex(
+        threshold=config.LSH_THRESHOLD,
+        max_entries=config.LSH_MAX_ENTRIES,
+        ttl_seconds=config.LSH_TTL_SECONDS
+    )
+
+def cascade_from_config(classifier: SpamClassifier) -> Optional[Cascade]:
+    """Load the calibrated cascade named by SPAMGUARD_CASCADE, if any"""
+    if not config.CASCADE_PATH:
+        return None
+    cascade = Cascade.load(config.CASCADE_PATH)
+    if cascade.model_version != classifier.model_version:
+        print(f"Warning: cascade {config.CASCADE_PATH} was calibrated for model version "
+              f"{cascade.model_version}, serving {classifier.model_version}")
+    return cascade
+
+def init_worker(watch_registry: bool = True):
+    """Process pool initializer: make sure the worker has models loaded (and follows the registry)"""
+    global _reloader
+    # Forked workers inherit the parent's already-loaded components
+    if _classifier is None or _rule_engine is None:
+        classifier = classifier_from_config()
+        set_components(classifier, rule_engine_from_config(), cache_from_config(), lsh_from_config(),
+                       cascade_from_config(classifier))
+    
+    # Threads do not survive a fork: every worker watches the registry itself
+    _reloader = reloader_from_config() if watch_registry else None
+    if _reloader is not None:
+        _reloader.start()
+
+def classify_messages(messages: List[str]) -> List[Tuple[Dict, Dict]]:
+    """Run the rules engine and ML model over a batch of messages.
+    
+    Returns one (rule_result, ml_result) pair per message, in input order.
+    """
+    if _profiler.active:
+        with _profiler.tracing():
+            return _classify_messages(messages)
+    return _classify_messages(messages)
+
+def _classify_messages(messages: List[str]) -> List[Tuple[Dict, Dict]]:
+    # One classifier for the whole call, even if another is swapped in meanwhile
+    classifier = _classifier
+    if classifier is None or _rule_engine is None:
+        raise RuntimeError("Classification components are not initialized")
+    
+    # Normalize once: rules scan the cleaned text, the model sees the processed text
+    start = time.perf_counter()
+    normalized = [normalize_message(message) for message in messages]
+    timings = {'preprocess': time.perf_counter() - start}
+    
+    # Rule-based classification
+    start = time.perf_counter()
+    rule_version = _rule_engine.rules_fingerprint()
+    rule_results = [
+        _cached(content_key('rules', rule_version, text.cleaned), _rule_engine.analyze_cleaned, text.cleaned)
+        for text in normalized
+    ]
+    timings['rules'] = time.perf_counter() - start
+    _metrics.count_rule_hits(rule_results)
+    
+    # ML classification in one vectorized pass over the texts not cached yet
+    processed_messages = [text.processed for text in normalized]
+    ml_version = _model_key(classifier)
+    ml_keys = [content_key('ml', ml_version, text) for text in processed_messages]
+    ml_results = [_cache.get(key) if _cache is not None else None for key in ml_keys]
+    
+    missing = {}
+    for i, result in enumerate(ml_results):
+        if result is None:
+            missing.setdefault(ml_keys[i], []).append(i)
+    if missing:
+        texts = [processed_messages[indexes[0]] for indexes in missing.values()]
+        for (key, indexes), result in zip(missing.items(), _predict_new(classifier, texts, timings)):
+            if _cache is not None:
+                _cache.set(key, result)
+            for i in indexes:
+                ml_results[i] = result
+    
+    _metrics.observe_stages(timings)
+    return list(zip(rule_results, ml_results))
+
+def run_instrumented(profile: Optional[Tuple[float, float, float]], func: Callable, *args) -> Tuple[Any, Dict, Dict]:
+    """Process pool entry point: func(*args) plus the metrics and profile samples it recorded.
+    
+    profile is the API process's running profiler session, if any, which
+    this worker joins. Both are returned for the API process to merge.
+    """
+    if profile is not None:
+        _profiler.join(profile)
+    return func(*args), _metrics.drain(), _profiler.drain()
+
+def final_verdict(rule_result: Dict, ml_result: Dict) -> Tuple[str, float]:
+    """Combined classification and confidence of the rule and ML results"""
+    final_confidence = (rule_result['confidence'] + ml_result['confidence']) / 2
+    
+    if final_confidence > 0.7:
+        classification = "spam"
+    elif final_confidence < 0.3:
+        classification = "ham"
+    else:
+        classification = "uncertain"
+    
+    return classification, final_confidence
+
+def _model_key(classifier: SpamClassifier) -> str:
+    """What ML results depend on: the model version and, if enabled, the cascade thresholds"""
+    if _cascade is None:
+        return classifier.model_version
+    return f"{classifier.model_version}/{_cascade.key}"
+
+def _predict(classifier: SpamClassifier, processed_messages: List[str], timings: Dict[str, float]) -> List[Dict]:
+    """Score messages with the model, counting cascade exits and adding stage timings"""
+    results = classifier.predict_preprocessed(processed_messages, _cascade, timings)
+    if _cascade is not None:
+        _cascade.record([result['stage'] for result in results])
+    return results
+
+def _predict_new(classifier: SpamClassifier, processed_messages: List[str], timings: Dict[str, float]) -> List[Dict]:
+    """Score messages with the model, reusing verdicts of near-duplicate campaign messages"""
+    if _lsh is None:
+        return _predict(classifier, processed_messages, timings)
+    
+    start = time.perf_counter()
+    _lsh.set_version(_model_key(classifier))
+    results = [None] * len(processed_messages)
+    signatures = [_lsh.signature(text) for text in processed_messages]
+    clusters = [None] * len(processed_messages)
+    to_predict = []
+    
+    for i, signature in enumerate(signatures):
+        neighbor = _lsh.query(signature)
+        if neighbor is not None:
+            result, cluster_id, similarity = neighbor
+            clusters[i] = cluster_id
+            # Only confident verdicts are reused; borderline ones go to the model
+            confidence = result['confidence']
+            if confidence >= config.LSH_MIN_CONFIDENCE or confidence <= 1 - config.LSH_MIN_CONFIDENCE:
+                results[i] = dict(result, campaign_id=cluster_id, near_duplicate=True,
+                                  similarity=round(similarity, 3))
+                _lsh.mark_reused()
+                continue
+        to_predict.append(i)
+    timings['near_duplicates'] = time.perf_counter() - start
+    
+    if to_predict:
+        predicted = _predict(classifier, [processed_messages[i] for i in to_predict], timings)
+        for i, result in zip(to_predict, predicted):
+            cluster_id = _lsh.insert(signatures[i], result, clusters[i])
+            results[i] = dict(result, campaign_id=cluster_id)
+    
+    return results
+
+def _cached(key: str, compute, *args):
+    """Return the cached result for key, computing and storing it on a miss"""
+    if _cache is None:
+        return compute(*args)
+    result = _cache.get(key)
+    if result is None:
+        result = compute(*args)
+        _cache.set(key, result)
+    return result
+
+def get_classifier() -> Optional[SpamClassifier]:
+    """The classifier of this process"""
+    return _classifier
+
+def get_cache() -> Optional[ResultCache]:
+    """The result cache of this process, if enabled"""
+    return _cache
+
+def get_lsh() -> Optional[MinHashLSHIndex]:
+    """The near-duplicate index of this process, if enabled"""
+    return _lsh
+
+def get_cascade() -> Optional[Cascade]:
+    """The early-exit cascade of this process, if enabled"""
+    return _cascade
+
+def get_metrics() -> ServingMetrics:
+    """Stage timings and rule hits of this process (and, merged in, of its pool workers)"""
+    return _metrics
+
+def get_profiler() -> SamplingProfiler:
+    """The sampling profiler of this process (its pool workers' samples are merged in)"""
+    return _profiler
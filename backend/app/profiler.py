@@ -0,0 +1,119 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+class SamplingProfiler:
+    """Statistical profiler of classification calls.
+    
+    While a session is on, classify_messages marks the thread it runs on for
+    the duration of the call (every call, or a random fraction of them), and
+    a background thread records the stacks of the marked threads every
+    interval. Only the classification path is sampled, and outside a session
+    the cost is one attribute check per call.
+    """
+    
+    def __init__(self):
+        self.active = False
+        self.fraction = 1.0
+        self.interval = 0.005
+        self.deadline = 0.0  # time.time(), so worker processes can share it
+        self._traced = set()
+        self._samples: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self, seconds: float, fraction: float = 1.0, interval: float = 0.005,
+              deadline: Optional[float] = None) -> bool:
+        """Start a session of the given length; False if one is already running"""
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Request fraction must be in (0, 1], got {fraction}")
+        if interval < 0.001:
+            raise ValueError(f"Sampling interval must be at least 1 ms, got {interval * 1000:g} ms")
+        with self._lock:
+            if self.active:
+                return False
+            self._samples.clear()
+            self.fraction = fraction
+            self.interval = interval
+            self.deadline = deadline if deadline is not None else time.time() + seconds
+            self._stop.clear()
+            self.active = True
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+    
+    def stop(self):
+        """End the session early, or wait for the sampler to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def session(self) -> Optional[Tuple[float, float, float]]:
+        """(deadline, fraction, interval) of the running session, for worker processes to join"""
+        return (self.deadline, self.fraction, self.interval) if self.active else None
+    
+    def join(self, session: Tuple[float, float, float]):
+        """Sample this process too until the session's deadline (worker processes)"""
+        deadline, fraction, interval = session
+        if not self.active and deadline > time.time():
+            self.start(0, fraction, interval, deadline)
+    
+    @contextmanager
+    def tracing(self) -> Iterator[None]:
+        """Have the sampler record this thread's stack while the block runs (if this call is sampled)"""
+        thread_id = threading.get_ident()
+        sampled = self.active and random.random() < self.fraction
+        if sampled:
+            self._traced.add(thread_id)
+        try:
+            yield
+        finally:
+            if sampled:
+                self._traced.discard(thread_id)
+    
+    def _run(self):
+        """Sampler thread: record the stacks of the traced threads until the deadline"""
+        try:
+            while time.time() < self.deadline and not self._stop.is_set():
+                traced = list(self._traced)
+                if traced:
+                    frames = sys._current_frames()
+                    stacks = [collapse_stack(frames[thread_id]) for thread_id in traced if thread_id in frames]
+                    with self._lock:
+                        self._samples.update(stacks)
+                self._stop.wait(self.interval)
+        finally:
+            self.active = False
+    
+    def drain(self) -> Dict[str, int]:
+        """Sample counts per collapsed stack recorded since the last drain"""
+        with self._lock:
+            samples = dict(self._samples)
+            self._samples.clear()
+        return samples
+    
+    def merge(self, samples: Dict[str, int]):
+        """Add samples drained in a worker process"""
+        if samples:
+            with self._lock:
+                self._samples.update(samples)
+
+def collapse_stack(frame) -> str:
+    """One stack as 'outermost;...;innermost' frames of 'function (file:line)'"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+def format_collapsed(samples: Dict[str, int]) -> str:
+    """Collapsed-stack text (flamegraph.pl, speedscope, inferno): one 'stack count' line per stack"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(samples.items(), key=lambda item: -item[1]))
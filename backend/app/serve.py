@@ -0,0 +1,201 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from app import config
+from app.metrics import process_memory
+
+# Seconds a worker must live to be restarted right away, and how long
+# stopping workers get before they are killed
+MIN_WORKER_LIFETIME = 1.0
+SHUTDOWN_TIMEOUT = 30.0
+
+class PreforkServer:
+    """Serves an ASGI app from worker processes forked off one loaded parent.
+    
+    The parent loads the app (and with it the model), binds the listening
+    socket and forks the workers, which all accept on that socket. Model
+    arrays are never written after loading, so their pages stay shared
+    copy-on-write between workers; the GC is frozen before forking so that
+    collections in the workers do not write to the inherited objects
+    either. Workers are pinned one per CPU and replaced when they die.
+    """
+    
+    def __init__(self, app, host: str = "0.0.0.0", port: int = 8000, workers: int = 1,
+                 pin_cpus: bool = True, memory_report_seconds: float = 60.0):
+        if workers < 1:
+            raise ValueError(f"Need at least one worker, got {workers}")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.memory_report_seconds = memory_report_seconds
+        self._socket: Optional[socket.socket] = None
+        self._pids: Dict[int, int] = {}  # pid -> worker index
+        self._started_at: Dict[int, float] = {}
+        self._stopping = False
+        
+        # CPUs this process may run on, handed out round robin
+        self.cpus: Optional[List[int]] = None
+        if pin_cpus and hasattr(os, 'sched_getaffinity'):
+            self.cpus = sorted(os.sched_getaffinity(0))
+    
+    def run(self):
+        """Fork the workers and supervise them until SIGINT or SIGTERM"""
+        self._socket = self._bind()
+        
+        # Everything loaded so far is left alone by the collector from now on
+        gc.collect()
+        gc.freeze()
+        
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for index in range(self.workers):
+            self._spawn(index)
+        print(f"Serving on http://{self.host}:{self.port} with {self.workers} workers (parent pid {os.getpid()})")
+        
+        next_report = time.monotonic() + min(5.0, self.memory_report_seconds)
+        while not self._stopping:
+            self._reap()
+            if self.memory_report_seconds > 0 and time.monotonic() >= next_report:
+                self.print_memory_report()
+                next_report = time.monotonic() + self.memory_report_seconds
+            time.sleep(0.2)
+        
+        self._shutdown()
+    
+    def _bind(self) -> socket.socket:
+        """Listening socket shared by every worker"""
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+    
+    def _cpu(self, index: int) -> Optional[int]:
+        return self.cpus[index % len(self.cpus)] if self.cpus else None
+    
+    def _spawn(self, index: int):
+        """Fork worker number index"""
+        pid = os.fork()
+        if pid == 0:
+            self._worker_main(index)
+        self._pids[pid] = index
+        self._started_at[pid] = time.monotonic()
+    
+    def _worker_main(self, index: int):
+        """Body of a forked worker: serve on the inherited socket, then exit"""
+        status = 0
+        try:
+            # uvicorn installs its own handlers for a graceful shutdown
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            cpu = self._cpu(index)
+            if cpu is not None:
+                os.sched_setaffinity(0, {cpu})
+            
+            server = uvicorn.Server(uvicorn.Config(self.app, lifespan="on"))
+            server.run(sockets=[self._socket])
+        except BaseException as e:
+            print(f"Worker {index} (pid {os.getpid()}) failed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+    
+    def _reap(self):
+        """Collect exited workers and start replacements"""
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self._pids.pop(pid)
+            lifetime = time.monotonic() - self._started_at.pop(pid)
+            if self._stopping:
+                continue
+            print(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            # Do not spin on a worker that dies at startup
+            if lifetime < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            self._spawn(index)
+    
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+    
+    def _shutdown(self):
+        """Stop the workers gracefully, killing those that do not exit in time"""
+        print(f"Stopping {len(self._pids)} workers")
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while self._pids and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._pids):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self._socket.close()
+    
+    def memory_report(self) -> List[Dict]:
+        """Memory of the parent and of every worker, in MB"""
+        report = [{'worker': None, 'pid': os.getpid(), 'cpu': None, **process_memory()}]
+        for pid, index in sorted(self._pids.items(), key=lambda item: item[1]):
+            report.append({'worker': index, 'pid': pid, 'cpu': self._cpu(index), **process_memory(pid)})
+        return report
+    
+    def print_memory_report(self):
+        report = self.memory_report()
+        for entry in report:
+            if 'rss_mb' not in entry:
+                continue
+            name = 'parent' if entry['worker'] is None else f"worker {entry['worker']}"
+            cpu = f" cpu {entry['cpu']}" if entry['cpu'] is not None else ""
+            print(f"{name:>10} pid {entry['pid']}{cpu}: rss {entry['rss_mb']:.1f} MB, pss {entry['pss_mb']:.1f} MB, "
+                  f"shared {entry['shared_mb']:.1f} MB, private {entry['private_mb']:.1f} MB")
+        # PSS adds up to the memory really used, shared pages counted once
+        workers = [entry for entry in report if entry['worker'] is not None and 'pss_mb' in entry]
+        if workers:
+            print(f"{len(workers)} workers: rss {sum(e['rss_mb'] for e in workers):.1f} MB summed, "
+                  f"pss {sum(e['pss_mb'] for e in workers):.1f} MB actually used")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from forked workers sharing one loaded model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=config.SERVE_WORKERS)
+    parser.add_argument("--no-pin", action="store_true", help="do not pin workers to CPUs")
+    parser.add_argument("--memory-report", type=float, default=config.SERVE_MEMORY_REPORT_SECONDS,
+                        help="seconds between per-worker memory reports (0 turns them off)")
+    args = parser.parse_args()
+    
+    # The forked workers are the processes: each classifies on its own
+    # pinned CPU instead of running a process pool of its own
+    if config.EXECUTOR_BACKEND == "process":
+        print("Prefork serving: using the thread executor in each worker instead of a process pool")
+        config.EXECUTOR_BACKEND = "thread"
+    if not os.getenv("SPAMGUARD_WORKERS"):
+        config.EXECUTOR_WORKERS = 1
+    
+    # Loaded once, here, before forking
+    from app.main import app, spam_classifier
+    spam_classifier.prepare()
+    
+    PreforkServer(app, args.host, args.port, args.workers, pin_cpus=config.SERVE_PIN_CPUS and not args.no_pin,
+                  memory_report_seconds=args.memory_report).run()
+
+if __name__ == "__main__":
+    main()
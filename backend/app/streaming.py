@@ -0,0 +1,63 @@
+import json
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+class LineTooLong(ValueError):
+    """Raised when an NDJSON line exceeds the configured maximum size"""
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """Split a streamed body into lines as its chunks arrive.
+    
+    Only the unfinished last line is buffered, and it may not grow past
+    max_line_bytes, so memory stays bounded however long the body is.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        # Earlier bytes of the buffer are known not to contain a newline
+        search_from = len(buffer)
+        buffer += chunk
+        consumed = 0
+        position = buffer.find(b'\n', search_from)
+        while position != -1:
+            if position - consumed > max_line_bytes:
+                raise LineTooLong(f"Line longer than {max_line_bytes} bytes")
+            yield bytes(buffer[consumed:position])
+            consumed = position + 1
+            position = buffer.find(b'\n', consumed)
+        del buffer[:consumed]
+        
+        if len(buffer) > max_line_bytes:
+            raise LineTooLong(f"Line longer than {max_line_bytes} bytes")
+    
+    if buffer:
+        yield bytes(buffer)
+
+def parse_stream_line(line: bytes) -> Tuple[Any, Optional[str]]:
+    """(id, message) of one NDJSON line: {"message": ..., "id": ...} or a bare JSON string"""
+    record = json.loads(line)
+    if isinstance(record, str):
+        return None, record
+    if isinstance(record, dict) and isinstance(record.get('message'), str):
+        return record.get('id'), record['message']
+    raise ValueError("Expected a JSON string or an object with a 'message' string")
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose content is produced while the request body is still being read.
+    
+    The base class watches receive() for a disconnect while it streams, which
+    would swallow the body messages the content iterator is reading. Here
+    only the iterator receives: request.stream() raises ClientDisconnect
+    itself, and a failed send does too.
+    """
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,317 @@
+import argparse
+import os
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from numbers import Integral
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.feature_extraction.text import CountVectorizer
+
+from app import config
+from app.bulk import read_csv, read_jsonl
+from app.ml.classifier import FEATURIZERS, SpamClassifier
+from app.ml.registry import ModelRegistry
+from app.ml.text import normalize_message
+
+# Labeled message: (1 for spam / 0 for ham, message text)
+Example = Tuple[int, str]
+
+_SPAM_LABELS = {'1', 'spam', 'true', 'yes'}
+_HAM_LABELS = {'0', 'ham', 'false', 'no'}
+
+# Vectorizer and classifier of this process (set by _init_worker)
+_vectorizer = None
+_classifier: Optional[SpamClassifier] = None
+
+def parse_label(value: Any) -> int:
+    """1 for spam, 0 for ham, from numeric, boolean or spam/ham labels"""
+    label = str(value).strip().lower()
+    if label in _SPAM_LABELS:
+        return 1
+    if label in _HAM_LABELS:
+        return 0
+    raise ValueError(f"Unknown label: {value!r}")
+
+def is_holdout(message: str, fraction: float) -> bool:
+    """Deterministic held-out split: the same message lands on the same side in every pass and process"""
+    return zlib.crc32(message.encode('utf-8', 'surrogatepass')) % 10000 < fraction * 10000
+
+def read_examples(path: str, field: str = 'message', label_field: str = 'label') -> Iterator[Example]:
+    """Labeled messages of a JSONL or CSV file, read lazily"""
+    if path.endswith('.csv'):
+        records = read_csv(path, field, label_field)
+    else:
+        records = read_jsonl(path, field, label_field)
+    
+    skipped = 0
+    for (label, message), _ in records:
+        try:
+            yield parse_label(label), message
+        except ValueError:
+            skipped += 1
+    if skipped:
+        print(f"Skipped {skipped} records without a spam/ham label in {path}")
+
+def _chunks(examples: Iterator[Example], chunk_size: int) -> Iterator[Tuple[List[int], List[str]]]:
+    """(labels, messages) lists of at most chunk_size examples"""
+    examples = iter(examples)
+    while True:
+        chunk = list(islice(examples, chunk_size))
+        if not chunk:
+            return
+        labels, messages = zip(*chunk)
+        yield list(labels), list(messages)
+
+def _init_worker(vectorizer):
+    """Process pool initializer: the vectorizer (and a classifier using it) of the current pass"""
+    global _vectorizer, _classifier
+    _vectorizer = vectorizer
+    _classifier = SpamClassifier(load=False)
+    _classifier.vectorizer = vectorizer
+
+def _chunk_statistics(labels: List[int], messages: List[str]) -> Tuple[int, Any, float]:
+    """Vectorizer statistics of one chunk: (documents, statistics, seconds)"""
+    start = time.perf_counter()
+    processed = [normalize_message(message).processed for message in messages]
+    
+    if hasattr(_vectorizer, 'document_frequencies'):
+        statistics = _vectorizer.document_frequencies(processed)
+    else:
+        # Every term of the chunk with its total and document counts
+        counter = CountVectorizer(**{name: value for name, value in _vectorizer.get_params().items()
+                                     if name not in ('max_df', 'min_df', 'max_features', 'vocabulary',
+                                                     'binary', 'norm', 'use_idf', 'smooth_idf', 'sublinear_tf')})
+        counter.set_params(dtype=np.int64)
+        X = counter.fit_transform(processed).tocsr()
+        df = np.bincount(X.indices, minlength=X.shape[1])
+        tf = df if _vectorizer.binary else np.asarray(X.sum(axis=0)).ravel()
+        statistics = (counter.get_feature_names_out().tolist(), tf, df)
+    
+    return len(processed), statistics, time.perf_counter() - start
+
+def _chunk_features(labels: List[int], messages: List[str]) -> Tuple[Any, List[int], float]:
+    """Feature matrix of one chunk: (X, labels, seconds)"""
+    start = time.perf_counter()
+    processed = [normalize_message(message).processed for message in messages]
+    return _classifier._build_features(processed), labels, time.perf_counter() - start
+
+def _map_chunks(func: Callable, chunks: Iterator[Tuple[List[int], List[str]]], vectorizer,
+                workers: int) -> Iterator[Any]:
+    """func over chunks in order, with at most 2 * workers chunks in flight"""
+    if workers <= 1:
+        _init_worker(vectorizer)
+        for labels, messages in chunks:
+            yield func(labels, messages)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(vectorizer,)) as pool:
+        pending = deque()
+        for labels, messages in chunks:
+            pending.append(pool.submit(func, labels, messages))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def fit_vocabulary(vectorizer, term_statistics: Dict[str, List[int]], n_documents: int):
+    """Set a TfidfVectorizer's vocabulary and IDF weights from corpus-wide term counts.
+    
+    Applies the same min_df/max_df/max_features pruning and the same IDF
+    formula as TfidfVectorizer.fit over all the documents at once, so the
+    result is identical to fitting in memory.
+    """
+    terms = sorted(term_statistics)
+    tfs = np.array([term_statistics[term][0] for term in terms], dtype=np.int64)
+    dfs = np.array([term_statistics[term][1] for term in terms], dtype=np.int64)
+    
+    max_df, min_df, limit = vectorizer.max_df, vectorizer.min_df, vectorizer.max_features
+    high = max_df if isinstance(max_df, Integral) else max_df * n_documents
+    low = min_df if isinstance(min_df, Integral) else min_df * n_documents
+    if high < low:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    
+    mask = (dfs <= high) & (dfs >= low)
+    if limit is not None and mask.sum() > limit:
+        # Same selection (and tie order) as CountVectorizer._limit_features
+        mask_inds = (-tfs[mask]).argsort()[:limit]
+        new_mask = np.zeros(len(dfs), dtype=bool)
+        new_mask[np.where(mask)[0][mask_inds]] = True
+        mask = new_mask
+    
+    kept = np.where(mask)[0]
+    if not len(kept):
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    
+    vectorizer.vocabulary_ = {terms[index]: column for column, index in enumerate(kept)}
+    if vectorizer.use_idf:
+        # TfidfTransformer.fit's smoothed IDF
+        df = dfs[kept].astype(vectorizer.dtype if vectorizer.dtype in (np.float64, np.float32) else np.float64)
+        df += float(vectorizer.smooth_idf)
+        idf = np.full_like(df, fill_value=n_documents + int(vectorizer.smooth_idf))
+        idf /= df
+        np.log(idf, out=idf)
+        idf += 1.0
+        vectorizer.idf_ = idf
+
+def _evaluate(classifier: SpamClassifier, chunks: Iterator[Tuple[List[int], List[str]]],
+              workers: int) -> Dict[str, float]:
+    """Accuracy, precision and recall of both models and their ensemble on held-out chunks"""
+    # Confusion counts per model: [true positives, false positives, false negatives, true negatives]
+    confusion = {name: np.zeros(4, dtype=np.int64) for name in ('nb', 'rf', 'ensemble')}
+    for X, labels, _ in _map_chunks(_chunk_features, chunks, classifier.vectorizer, workers):
+        y = np.asarray(labels) == 1
+        nb_probs = classifier.nb_classifier.predict_proba(X)[:, 1]
+        rf_probs = classifier.rf_classifier.predict_proba(X)[:, 1]
+        # Same decision as predict_preprocessed
+        predictions = {'nb': nb_probs > 0.5, 'rf': rf_probs > 0.5, 'ensemble': (nb_probs + rf_probs) / 2 > 0.5}
+        for name, predicted in predictions.items():
+            confusion[name] += [np.sum(predicted & y), np.sum(predicted & ~y),
+                                np.sum(~predicted & y), np.sum(~predicted & ~y)]
+    
+    metrics = {'holdout_messages': int(confusion['nb'].sum())}
+    for name, (tp, fp, fn, tn) in confusion.items():
+        total = tp + fp + fn + tn
+        metrics[f'{name}_accuracy'] = float((tp + tn) / total) if total else 0.0
+        metrics[f'{name}_precision'] = float(tp / (tp + fp)) if tp + fp else 0.0
+        metrics[f'{name}_recall'] = float(tp / (tp + fn)) if tp + fn else 0.0
+    return metrics
+
+def train_streaming(classifier: SpamClassifier, read_train: Callable[[], Iterator[Example]],
+                    read_holdout: Callable[[], Iterator[Example]], chunk_size: int = 10000,
+                    workers: int = 1) -> Dict[str, float]:
+    """Train the classifier on a labeled stream too large to hold in memory.
+    
+    read_train and read_holdout return fresh iterators over the training and
+    held-out examples; the training stream is read twice. The first pass
+    fits the vectorizer statistics, the second trains chunk by chunk:
+    Naive Bayes with partial_fit, the random forest by growing its share of
+    trees on each chunk (warm_start) with all cores. Only a few chunks are
+    in memory at a time. Featurization runs on workers processes.
+    """
+    rf_params = classifier.rf_classifier.get_params()
+    classifier.vectorizer = clone(classifier.vectorizer)
+    classifier.nb_classifier = clone(classifier.nb_classifier)
+    classifier.rf_classifier = clone(classifier.rf_classifier).set_params(n_estimators=0, warm_start=True, n_jobs=-1)
+    
+    # Pass 1: vectorizer statistics
+    start = time.perf_counter()
+    n_documents = 0
+    term_statistics: Dict[str, List[int]] = {}
+    for chunk, (count, statistics, seconds) in enumerate(
+            _map_chunks(_chunk_statistics, _chunks(read_train(), chunk_size), classifier.vectorizer, workers)):
+        n_documents += count
+        if classifier.uses_hashing:
+            classifier.vectorizer.add_document_frequencies(statistics, count)
+        else:
+            for term, tf, df in zip(*statistics):
+                entry = term_statistics.get(term)
+                if entry is None:
+                    term_statistics[term] = [int(tf), int(df)]
+                else:
+                    entry[0] += int(tf)
+                    entry[1] += int(df)
+        print(f"Statistics chunk {chunk}: {count} messages, {count / max(seconds, 1e-9):.0f} msg/s per worker")
+    
+    if not n_documents:
+        raise ValueError("No training messages")
+    if not classifier.uses_hashing:
+        fit_vocabulary(classifier.vectorizer, term_statistics, n_documents)
+        term_statistics.clear()
+    print(f"Fitted vectorizer on {n_documents} messages in {time.perf_counter() - start:.1f} s")
+    
+    # Pass 2: incremental training; forest trees are spread over the chunks in
+    # proportion to their messages, so a short last chunk gets few or none
+    n_trees = rf_params['n_estimators']
+    seen = 0
+    deferred_trees = 0
+    start = time.perf_counter()
+    for chunk, (X, labels, feature_seconds) in enumerate(
+            _map_chunks(_chunk_features, _chunks(read_train(), chunk_size), classifier.vectorizer, workers)):
+        chunk_start = time.perf_counter()
+        classifier.nb_classifier.partial_fit(X, labels, classes=[0, 1])
+        nb_seconds = time.perf_counter() - chunk_start
+        
+        # Trees need both classes in their chunk; otherwise they move to the next chunk
+        trees = deferred_trees + (seen + len(labels)) * n_trees // n_documents - seen * n_trees // n_documents
+        seen += len(labels)
+        deferred_trees = trees if len(set(labels)) < 2 else 0
+        if trees and not deferred_trees:
+            classifier.rf_classifier.n_estimators += trees
+            classifier.rf_classifier.fit(X, labels)
+        rf_seconds = time.perf_counter() - chunk_start - nb_seconds
+        
+        elapsed = feature_seconds + nb_seconds + rf_seconds
+        print(f"Training chunk {chunk}: {len(labels)} messages, {len(labels) / max(elapsed, 1e-9):.0f} msg/s "
+              f"(features {feature_seconds:.2f} s, NB {nb_seconds:.2f} s, RF {trees} trees {rf_seconds:.2f} s)")
+    
+    if not classifier.rf_classifier.n_estimators:
+        raise ValueError("Training data needs both spam and ham messages")
+    if deferred_trees:
+        print(f"Warning: the last chunks held a single class, so {deferred_trees} trees were never grown; "
+              f"the forest has {classifier.rf_classifier.n_estimators} of {n_trees} trees")
+    
+    # Serve with the original forest settings
+    classifier.rf_classifier.set_params(warm_start=rf_params['warm_start'], n_jobs=rf_params['n_jobs'])
+    print(f"Trained on {n_documents} messages in {time.perf_counter() - start:.1f} s")
+    
+    classifier.is_trained = True
+    classifier.feature_names = [] if classifier.uses_hashing else classifier.vectorizer.get_feature_names_out().tolist()
+    classifier.model_version = uuid.uuid4().hex
+    
+    # Pass 3: held-out evaluation
+    metrics = _evaluate(classifier, _chunks(read_holdout(), chunk_size), workers)
+    metrics['train_messages'] = n_documents
+    print(f"Naive Bayes Accuracy: {metrics['nb_accuracy']:.3f}")
+    print(f"Random Forest Accuracy: {metrics['rf_accuracy']:.3f}")
+    print(f"Ensemble Accuracy: {metrics['ensemble_accuracy']:.3f} "
+          f"(precision {metrics['ensemble_precision']:.3f}, recall {metrics['ensemble_recall']:.3f}, "
+          f"{metrics['holdout_messages']} held-out messages)")
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the spam classifier on a labeled corpus streamed from disk")
+    parser.add_argument('corpus', help="JSONL or CSV file of labeled messages")
+    parser.add_argument('--field', default='message', help="message field")
+    parser.add_argument('--label-field', default='label', help="label field: spam/ham, 1/0 or true/false")
+    parser.add_argument('--eval', help="separate held-out file (default: hold out --holdout of the corpus)")
+    parser.add_argument('--holdout', type=float, default=0.1, help="fraction of the corpus held out for evaluation")
+    parser.add_argument('--featurizer', choices=FEATURIZERS, default='tfidf',
+                        help="tfidf keeps a term table as large as the corpus vocabulary in memory "
+                             "while fitting; hashing uses fixed memory")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="messages per training chunk")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="featurization processes")
+    parser.add_argument('--arrays', help="save as memory-mapped arrays in this directory instead of the pickle")
+    parser.add_argument('--publish', action='store_true',
+                        help="publish to the model registry and activate it instead of saving")
+    args = parser.parse_args()
+    if args.publish and not config.MODEL_REGISTRY_DIR:
+        parser.error("--publish needs a model registry: set SPAMGUARD_MODEL_REGISTRY")
+    
+    def read_corpus():
+        return read_examples(args.corpus, args.field, args.label_field)
+    
+    if args.eval:
+        read_train = read_corpus
+        read_holdout = lambda: read_examples(args.eval, args.field, args.label_field)
+    else:
+        read_train = lambda: ((label, message) for label, message in read_corpus()
+                              if not is_holdout(message, args.holdout))
+        read_holdout = lambda: ((label, message) for label, message in read_corpus()
+                                if is_holdout(message, args.holdout))
+    
+    classifier = SpamClassifier(load=False, arrays_dir=args.arrays, featurizer=args.featurizer)
+    train_streaming(classifier, read_train, read_holdout, args.chunk_size, args.workers)
+    if args.publish:
+        version = ModelRegistry(config.MODEL_REGISTRY_DIR).publish(classifier.model_data(), activate=True)
+        print(f"Published and activated model version {version}")
+    else:
+        classifier.save_model()
+
+if __name__ == "__main__":
+    main()
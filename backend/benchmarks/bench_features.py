@@ -0,0 +1,49 @@
+"""Compare per-message and batch extraction of the handcrafted features.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_features --messages 10000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.ml.classifier import SpamClassifier
+from app.ml.features import FEATURE_COLUMNS
+from benchmarks.corpus import generate_corpus
+
+def timed(func, *args):
+    """Run func once, returning its result and the elapsed seconds"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--size", default="medium", choices=["short", "medium", "long"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    
+    messages, _ = generate_corpus(args.messages, size=args.size)
+    classifier = SpamClassifier(load=False)
+    processed_messages = [classifier.preprocess_text(msg) for msg in messages]
+    
+    # First call builds the character class table; keep it out of the comparison
+    _, warmup = timed(classifier.extract_features_batch, processed_messages[:1])
+    
+    loop_times, batch_times = [], []
+    for _ in range(args.repeat):
+        rows, elapsed = timed(lambda: [list(classifier.extract_features(msg).values()) for msg in processed_messages])
+        loop_times.append(elapsed)
+        matrix, elapsed = timed(classifier.extract_features_batch, processed_messages)
+        batch_times.append(elapsed)
+    
+    exact = np.array_equal(np.array(rows, dtype=np.float32), matrix)
+    loop_time, batch_time = min(loop_times), min(batch_times)
+    print(f"{len(messages)} {args.size} messages, {len(FEATURE_COLUMNS)} columns, table build {warmup * 1e3:.0f} ms")
+    print(f"{'per-message':>12}: {loop_time * 1e3:8.1f} ms")
+    print(f"{'batch':>12}: {batch_time * 1e3:8.1f} ms  ({loop_time / batch_time:.1f}x, exact match: {exact})")
+
+if __name__ == "__main__":
+    main()
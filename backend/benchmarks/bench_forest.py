@@ -0,0 +1,69 @@
+"""Compare sklearn's RandomForestClassifier.predict_proba with the flat forest engine.
+
+A forest is trained on a synthetic corpus (with some labels flipped so the
+trees grow deeper), then sklearn, the flat engine and
+SpamClassifier.predict_forest_proba (which picks one of the two per batch)
+score the same feature rows at several batch sizes. The probabilities must
+match bit for bit.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_forest --messages 20000 --noise 0.05
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.ml.classifier import SpamClassifier
+from app.ml.forest import FlatForest
+from benchmarks.corpus import generate_corpus
+
+BATCH_SIZES = (1, 32, 256, 1000, 5000)
+
+def best_time(predict, X, repeats: int) -> float:
+    """Fastest of several runs, in seconds"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(X)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--noise", type=float, default=0.05, help="fraction of training labels flipped")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    
+    messages, labels = generate_corpus(args.messages)
+    rng = random.Random(3)
+    labels = [1 - label if rng.random() < args.noise else label for label in labels]
+    
+    classifier = SpamClassifier(load=False)
+    classifier.fit(messages, labels)
+    forest = classifier.rf_classifier
+    
+    start = time.perf_counter()
+    flat = FlatForest.from_sklearn(forest)
+    print(f"{flat.n_trees} trees, {len(flat.feature)} nodes, mean leaf depth {flat.mean_leaf_depth:.1f}, "
+          f"flattened in {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    test_messages, _ = generate_corpus(max(BATCH_SIZES), seed=11)
+    X = classifier._build_features([classifier.preprocess_text(message) for message in test_messages])
+    
+    print(f"{'batch':>6} {'sklearn ms':>11} {'flat ms':>9} {'served ms':>10} {'speedup':>8}  exact")
+    for batch_size in BATCH_SIZES:
+        rows = X[:batch_size]
+        expected = forest.predict_proba(rows)
+        exact = (np.array_equal(expected, flat.predict_proba(rows)) and
+                 np.array_equal(expected, classifier.predict_forest_proba(rows)))
+        sklearn_time = best_time(forest.predict_proba, rows, args.repeats)
+        flat_time = best_time(flat.predict_proba, rows, args.repeats)
+        served_time = best_time(classifier.predict_forest_proba, rows, args.repeats)
+        print(f"{batch_size:>6} {sklearn_time * 1000:>11.2f} {flat_time * 1000:>9.2f} {served_time * 1000:>10.2f} "
+              f"{sklearn_time / served_time:>7.1f}x  {exact}")
+
+if __name__ == "__main__":
+    main()
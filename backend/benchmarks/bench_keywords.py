@@ -0,0 +1,46 @@
+"""Compare regex alternations with the Aho-Corasick keyword index as keyword lists grow.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_keywords --keywords 10 100 1000 5000
+"""
+import argparse
+import random
+import re
+import time
+
+from app.ml.keywords import KeywordIndex, fold_ignorecase, keyword_pattern
+from benchmarks.corpus import generate_corpus
+
+def time_per_message(func, messages) -> float:
+    """Average microseconds per message"""
+    start = time.perf_counter()
+    for message in messages:
+        func(message)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keywords", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--size", default="medium", choices=["short", "medium", "long"])
+    args = parser.parse_args()
+    
+    messages, _ = generate_corpus(args.messages, size=args.size)
+    rng = random.Random(0)
+    vocabulary = sorted({word for message in messages for word in message.lower().split()})
+    
+    print(f"{'keywords':>9} {'regex us/msg':>13} {'index us/msg':>13}")
+    for n_keywords in args.keywords:
+        keywords = rng.sample(vocabulary, min(n_keywords, len(vocabulary)))
+        
+        regex = re.compile(keyword_pattern(keywords))
+        index = KeywordIndex(fold=fold_ignorecase)
+        index.add_list("keywords", keywords)
+        index.search("")  # build the automaton outside the timing
+        
+        regex_time = time_per_message(regex.findall, messages)
+        index_time = time_per_message(lambda message: index.search(message).findall("keywords"), messages)
+        print(f"{len(keywords):>9} {regex_time:>13.1f} {index_time:>13.1f}")
+
+if __name__ == "__main__":
+    main()
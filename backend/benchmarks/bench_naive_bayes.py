@@ -0,0 +1,62 @@
+"""Compare sklearn's MultinomialNB.predict_proba with the linear log-odds scorer.
+
+sklearn scores the stacked text + handcrafted feature matrix; the linear
+scorer takes the two blocks as they are built, so the stacking is part of
+the sklearn timing. Message sizes show the scorer's cost following the
+number of non-zero terms.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_naive_bayes --messages 20000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.ml.classifier import SpamClassifier
+from app.ml.linear import LinearNB
+from benchmarks.corpus import MESSAGE_SIZES, generate_corpus
+
+BATCH_SIZES = (1, 32, 1000)
+
+def best_time(func, repeats: int) -> float:
+    """Fastest of several runs, in seconds"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    
+    messages, labels = generate_corpus(args.messages, size="medium")
+    classifier = SpamClassifier(load=False)
+    classifier.fit(messages, labels)
+    nb = classifier.nb_classifier
+    scorer = LinearNB.from_sklearn(nb)
+    print(f"{len(scorer.weights)} features")
+    
+    print(f"{'size':>7} {'batch':>6} {'nnz/msg':>8} {'sklearn ms':>11} {'linear ms':>10} {'speedup':>8} {'max diff':>9}")
+    for size in MESSAGE_SIZES:
+        test_messages, _ = generate_corpus(max(BATCH_SIZES), size=size, seed=11)
+        processed = [classifier.preprocess_text(message) for message in test_messages]
+        X_text, X_additional = classifier._build_feature_blocks(processed)
+        
+        for batch_size in BATCH_SIZES:
+            text, additional = X_text[:batch_size], X_additional[:batch_size]
+            expected = nb.predict_proba(classifier._stack_features(text, additional))
+            difference = np.abs(expected - scorer.predict_proba(text, additional)).max()
+            
+            sklearn_time = best_time(lambda: nb.predict_proba(classifier._stack_features(text, additional)),
+                                     args.repeats)
+            linear_time = best_time(lambda: scorer.predict_proba(text, additional), args.repeats)
+            print(f"{size:>7} {batch_size:>6} {text.nnz / batch_size:>8.1f} {sklearn_time * 1000:>11.3f} "
+                  f"{linear_time * 1000:>10.3f} {sklearn_time / linear_time:>7.1f}x {difference:>9.1e}")
+
+if __name__ == "__main__":
+    main()
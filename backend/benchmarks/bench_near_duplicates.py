@@ -0,0 +1,76 @@
+"""Measure how many model calls the MinHash/LSH index avoids on a replayed spam corpus.
+
+Campaign messages are replayed many times with a different recipient name
+and tracking token each time, interleaved with unique ham.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_near_duplicates --campaigns 50 --replays 40
+"""
+import argparse
+import random
+import time
+
+from app import pipeline
+from app.ml.classifier import SpamClassifier
+from app.ml.lsh import MinHashLSHIndex
+from app.ml.rules import RulesEngine
+from benchmarks.corpus import NAMES, generate_corpus, generate_message
+
+def build_replay(campaigns: int, replays: int, ham: int, seed: int = 7):
+    """Campaign bodies replayed with per-recipient variations, shuffled with ham"""
+    rng = random.Random(seed)
+    messages = []
+    for campaign in range(campaigns):
+        body = generate_message(rng, is_spam=True, filler_words=20)
+        for _ in range(replays):
+            name = rng.choice(NAMES).title()
+            token = "".join(rng.choice("abcdef0123456789") for _ in range(12))
+            messages.append(f"Hi {name}, {body} ref {token}")
+    messages += [generate_message(rng, is_spam=False, filler_words=20) for _ in range(ham)]
+    rng.shuffle(messages)
+    return messages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--campaigns", type=int, default=50)
+    parser.add_argument("--replays", type=int, default=40)
+    parser.add_argument("--ham", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+    
+    # A model trained on the synthetic corpus gives confident verdicts to reuse
+    classifier = SpamClassifier(load=False)
+    classifier.fit(*generate_corpus(4000))
+    rule_engine = RulesEngine()
+    messages = build_replay(args.campaigns, args.replays, args.ham)
+    batches = [messages[i:i + args.batch_size] for i in range(0, len(messages), args.batch_size)]
+    
+    # Baseline: every message goes to the model
+    pipeline.set_components(classifier, rule_engine)
+    start = time.perf_counter()
+    baseline = [result for batch in batches for result in pipeline.classify_messages(batch)]
+    baseline_time = time.perf_counter() - start
+    
+    # With the near-duplicate index
+    index = MinHashLSHIndex(threshold=args.threshold)
+    pipeline.set_components(classifier, rule_engine, lsh=index)
+    start = time.perf_counter()
+    with_lsh = [result for batch in batches for result in pipeline.classify_messages(batch)]
+    lsh_time = time.perf_counter() - start
+    
+    stats = index.get_stats()
+    agreement = sum(
+        (a[1]['prediction'] == b[1]['prediction']) for a, b in zip(baseline, with_lsh)
+    ) / len(messages)
+    campaigns = {result[1]['campaign_id'] for result in with_lsh}
+    
+    print(f"Messages:             {len(messages)} ({args.campaigns} campaigns x {args.replays} replays + {args.ham} ham)")
+    print(f"Model calls avoided:  {stats['reused']} ({stats['reused'] / len(messages):.1%})")
+    print(f"Clusters found:       {len(campaigns)}")
+    print(f"Verdict agreement:    {agreement:.2%}")
+    print(f"Time without index:   {baseline_time:.2f} s")
+    print(f"Time with index:      {lsh_time:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare dense vs sparse feature matrices for a retrain-sized batch.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_sparse_features --messages 100000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+from app.ml.classifier import SpamClassifier
+from benchmarks.corpus import generate_corpus
+
+def build_dense(classifier: SpamClassifier, processed_messages, X_additional):
+    """Feature construction as it was done before: densify and np.hstack"""
+    X_text = classifier.vectorizer.transform(processed_messages)
+    return np.hstack([X_text.toarray(), X_additional])
+
+def build_sparse(classifier: SpamClassifier, processed_messages, X_additional):
+    """Feature construction as done by SpamClassifier._build_features"""
+    X_text = classifier.vectorizer.transform(processed_messages)
+    return sparse.hstack([X_text, sparse.csr_matrix(X_additional)], format='csr')
+
+def run(label: str, build, classifier, processed_messages, X_additional, labels):
+    """Build features and partial_fit Naive Bayes, reporting peak memory and time"""
+    nb = MultinomialNB()
+    tracemalloc.start()
+    start = time.perf_counter()
+    
+    X = build(classifier, processed_messages, X_additional)
+    nb.partial_fit(X, labels, classes=[0, 1])
+    
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    print(f"{label:>6}: {elapsed:8.2f} s  peak {peak / 2**20:10.1f} MiB  shape {X.shape}")
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--skip-dense", action="store_true",
+                        help="Only run the sparse path (dense needs ~16 bytes per cell)")
+    args = parser.parse_args()
+    
+    messages, labels = generate_corpus(args.messages)
+    
+    # Fit a full-size vocabulary without touching the saved model
+    classifier = SpamClassifier.__new__(SpamClassifier)
+    classifier.vectorizer = TfidfVectorizer(
+        max_features=5000, stop_words='english', lowercase=True, ngram_range=(1, 2)
+    )
+    processed_messages = [classifier.preprocess_text(msg) for msg in messages]
+    classifier.vectorizer.fit(processed_messages)
+    X_additional = np.array([
+        list(classifier.extract_features(msg).values()) for msg in processed_messages
+    ], dtype=np.float64)
+    
+    print(f"Retrain of {args.messages} messages, {len(classifier.vectorizer.vocabulary_)} text features")
+    sparse_time, sparse_peak = run("sparse", build_sparse, classifier, processed_messages, X_additional, labels)
+    
+    if not args.skip_dense:
+        dense_time, dense_peak = run("dense", build_dense, classifier, processed_messages, X_additional, labels)
+        print(f"Sparse is {dense_time / sparse_time:.1f}x faster and uses "
+              f"{dense_peak / sparse_peak:.1f}x less peak memory")
+
+if __name__ == "__main__":
+    main()
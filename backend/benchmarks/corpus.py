@@ -0,0 +1,73 @@
+import random
+from typing import List, Tuple
+
+# Building blocks for synthetic messages
+SPAM_TEMPLATES = [
+    "URGENT! You've won ${amount}! Click here NOW to claim your {prize}!",
+    "CONGRATULATIONS {name}! You are our lucky winner, claim your {prize} today only",
+    "Limited time offer!!! Get {percent}% discount on {product}, act now",
+    "FREE {product}! Just pay shipping at bit.ly/{token} hurry, expires soon",
+    "Make money fast from home, earn ${amount} per week guaranteed no risk",
+    "Your account will be closed! Verify immediately at www.{token}.com",
+    "Call {phone} now to redeem your cash reward and bonus",
+]
+
+HAM_TEMPLATES = [
+    "Hi {name}, could you send me the {product} report before {day}?",
+    "Thanks for the meeting on {day}, the {product} proposal looks good",
+    "Let's schedule a call next week to discuss the {product} timeline",
+    "I attended your workshop about {product} and found it very helpful",
+    "Can you help me with a technical issue in the {product} deployment?",
+    "Please review the attached notes from {day} and share feedback with {name}",
+]
+
+NAMES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi"]
+PRODUCTS = ["iphone", "laptop", "website", "database", "invoice", "pills", "watch", "mortgage"]
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+PRIZES = ["prize", "jackpot", "gift card", "vacation", "reward"]
+
+# Message sizes expressed as the number of filler words appended
+MESSAGE_SIZES = {"short": 0, "medium": 40, "long": 400}
+
+def _random_word(rng: random.Random) -> str:
+    """Generate a pseudo-word so the vocabulary keeps growing with the corpus"""
+    length = rng.randint(3, 9)
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(length))
+
+def generate_message(rng: random.Random, is_spam: bool, filler_words: int = 0,
+                     lexicon: List[str] = None) -> str:
+    """Generate one synthetic spam or ham message"""
+    template = rng.choice(SPAM_TEMPLATES if is_spam else HAM_TEMPLATES)
+    message = template.format(
+        amount=rng.randint(100, 1000000),
+        name=rng.choice(NAMES).title(),
+        prize=rng.choice(PRIZES),
+        percent=rng.randint(10, 90),
+        product=rng.choice(PRODUCTS),
+        token=_random_word(rng),
+        phone="".join(rng.choice("0123456789") for _ in range(10)),
+        day=rng.choice(DAYS),
+    )
+    
+    # Sprinkle in words from a shared lexicon for a realistic vocabulary
+    extra = rng.randint(2, 8) + filler_words
+    if lexicon:
+        message += " " + " ".join(rng.choice(lexicon) for _ in range(extra))
+    
+    return message
+
+def generate_corpus(n_messages: int, spam_ratio: float = 0.5, size: str = "short",
+                    seed: int = 42, lexicon_size: int = 20000) -> Tuple[List[str], List[int]]:
+    """Generate a labeled synthetic corpus (1 for spam, 0 for ham)"""
+    rng = random.Random(seed)
+    lexicon = [_random_word(rng) for _ in range(lexicon_size)]
+    filler_words = MESSAGE_SIZES[size]
+    
+    messages = []
+    labels = []
+    for _ in range(n_messages):
+        is_spam = rng.random() < spam_ratio
+        messages.append(generate_message(rng, is_spam, filler_words, lexicon))
+        labels.append(1 if is_spam else 0)
+    
+    return messages, labels
@@ -0,0 +1,242 @@
+"""Benchmark suite for the classification stack, with an in-process HTTP load driver.
+
+Times RulesEngine.analyze_message, SpamClassifier.preprocess_text,
+extract_features, predict and predict_batch on synthetic corpora at several
+message and batch sizes, then drives /api/classify and /api/classify/batch
+through the ASGI app with concurrent clients. Every stage reports latency
+percentiles, throughput and peak RSS, and the results are saved as JSON so
+runs from different commits can be compared.
+
+The result cache and near-duplicate index are disabled unless --with-cache
+is given, so every run measures the same work.
+
+Usage (from the backend directory):
+    python -m benchmarks.suite --output benchmarks/results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite --compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+import sklearn
+
+from app import config
+from app.ml.rules import RulesEngine
+from app.pipeline import classifier_from_config
+from benchmarks.corpus import MESSAGE_SIZES, generate_corpus
+
+BATCH_SIZES = (1, 32, 256)
+CONCURRENCY = (1, 16)
+HTTP_BATCH_SIZES = (32, 256)
+
+# Result fields where lower is better; throughput is the one where higher is
+LATENCY_FIELDS = ('p50_ms', 'p99_ms')
+COMPARED_FIELDS = LATENCY_FIELDS + ('throughput_msg_s',)
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process's resident memory"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def summarize(latencies_ns: Sequence[int], messages: int, elapsed: float, rss_before: float) -> Dict[str, float]:
+    """Latency percentiles (ms), throughput and memory of one measured stage"""
+    latencies = np.asarray(latencies_ns, dtype=np.float64) / 1e6
+    rss = peak_rss_mb()
+    return {
+        'calls': len(latencies),
+        'messages': messages,
+        'mean_ms': round(float(latencies.mean()), 4),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 4),
+        'p90_ms': round(float(np.percentile(latencies, 90)), 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 4),
+        'max_ms': round(float(latencies.max()), 4),
+        'throughput_msg_s': round(messages / elapsed, 1),
+        'peak_rss_mb': round(rss, 1),
+        'rss_growth_mb': round(rss - rss_before, 1)
+    }
+
+def measure(func: Callable, inputs: List, batch_size: int = 1) -> Dict[str, float]:
+    """Call func on every input (or batch of inputs), timing each call"""
+    calls = inputs if batch_size == 1 else [inputs[i:i + batch_size] for i in range(0, len(inputs), batch_size)]
+    rss_before = peak_rss_mb()
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        call_start = time.perf_counter_ns()
+        func(call)
+        latencies.append(time.perf_counter_ns() - call_start)
+    return summarize(latencies, len(inputs), time.perf_counter() - start, rss_before)
+
+def run_stages(sizes: List[str], n_messages: int) -> List[Dict[str, Any]]:
+    """Benchmark the classification stages one by one"""
+    classifier = classifier_from_config()
+    rule_engine = RulesEngine()
+    results = []
+    for size in sizes:
+        messages, _ = generate_corpus(n_messages, size=size, seed=11)
+        processed = [classifier.preprocess_text(message) for message in messages]
+        # Warm up lazily built state (token analyzer, flat forest, keyword tables)
+        classifier.predict_batch(messages[:8])
+        
+        stages = [
+            ('rules', rule_engine.analyze_message, messages, 1),
+            ('preprocess', classifier.preprocess_text, messages, 1),
+            ('features', classifier.extract_features, processed, 1),
+            ('predict', classifier.predict, messages, 1),
+        ] + [('predict_batch', classifier.predict_batch, messages, batch_size) for batch_size in BATCH_SIZES[1:]]
+        
+        for stage, func, inputs, batch_size in stages:
+            result = {'stage': stage, 'size': size, 'batch_size': batch_size, 'concurrency': 1,
+                      **measure(func, inputs, batch_size)}
+            print_result(result)
+            results.append(result)
+    return results
+
+async def drive(client: httpx.AsyncClient, path: str, payloads: List[Dict], concurrency: int,
+                messages_per_request: int) -> Dict[str, Any]:
+    """Send payloads from concurrent clients, timing every request"""
+    pending = iter(payloads)
+    latencies, errors = [], 0
+    
+    async def client_loop():
+        nonlocal errors
+        for payload in pending:
+            start = time.perf_counter_ns()
+            response = await client.post(path, json=payload)
+            latencies.append(time.perf_counter_ns() - start)
+            errors += response.status_code != 200
+    
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {**summarize(latencies, len(payloads) * messages_per_request, elapsed, rss_before), 'errors': errors}
+
+async def run_http(sizes: List[str], n_requests: int) -> List[Dict[str, Any]]:
+    """Load-test the API in process: an httpx client talking ASGI to the app, lifespan included"""
+    from app.main import app
+    
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for size in sizes:
+                messages, _ = generate_corpus(max(n_requests, 4 * max(HTTP_BATCH_SIZES)), size=size, seed=13)
+                await client.post("/api/classify", json={"message": messages[0]})
+                
+                for concurrency in CONCURRENCY:
+                    payloads = [{"message": message} for message in messages[:n_requests]]
+                    result = {'stage': 'http_classify', 'size': size, 'batch_size': 1, 'concurrency': concurrency,
+                              **await drive(client, "/api/classify", payloads, concurrency, 1)}
+                    print_result(result)
+                    results.append(result)
+                
+                for batch_size in HTTP_BATCH_SIZES:
+                    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+                    payloads = [{"messages": batch} for batch in batches if len(batch) == batch_size]
+                    payloads = payloads[:max(n_requests // batch_size, 4)]
+                    result = {'stage': 'http_classify_batch', 'size': size, 'batch_size': batch_size,
+                              'concurrency': max(CONCURRENCY),
+                              **await drive(client, "/api/classify/batch", payloads, max(CONCURRENCY), batch_size)}
+                    print_result(result)
+                    results.append(result)
+    return results
+
+def environment() -> Dict[str, Any]:
+    """What the numbers depend on: code revision, interpreter, libraries and machine"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'executor': config.EXECUTOR_BACKEND,
+        'workers': config.EXECUTOR_WORKERS
+    }
+
+def print_result(result: Dict[str, Any]):
+    print(f"{result['stage']:>20} {result['size']:>6} batch {result['batch_size']:>4} x{result['concurrency']:<3} "
+          f"p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  "
+          f"{result['throughput_msg_s']:>10.1f} msg/s  peak RSS {result['peak_rss_mb']:>7.1f} MB"
+          + (f"  errors {result['errors']}" if result.get('errors') else ""))
+
+def result_key(result: Dict[str, Any]) -> tuple:
+    return result['stage'], result['size'], result['batch_size'], result['concurrency']
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print the change of every shared measurement; the number of regressions beyond threshold"""
+    with open(old_path) as f:
+        old = {result_key(result): result for result in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    
+    regressions = 0
+    for result in new:
+        before = old.get(result_key(result))
+        if before is None:
+            continue
+        changes = []
+        for field in COMPARED_FIELDS:
+            if not before[field]:
+                continue
+            change = result[field] / before[field] - 1
+            worse = change > threshold if field in LATENCY_FIELDS else change < -threshold
+            regressions += worse
+            changes.append(f"{field} {change:+7.1%}{' REGRESSION' if worse else ''}")
+        stage, size, batch_size, concurrency = result_key(result)
+        print(f"{stage:>20} {size:>6} batch {batch_size:>4} x{concurrency:<3} " + "  ".join(changes))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000, help="messages per size for the stage benchmarks")
+    parser.add_argument("--requests", type=int, default=500, help="single-message requests per HTTP load run")
+    parser.add_argument("--sizes", nargs="+", default=list(MESSAGE_SIZES), choices=list(MESSAGE_SIZES))
+    parser.add_argument("--skip-http", action="store_true", help="only benchmark the stages")
+    parser.add_argument("--with-cache", action="store_true",
+                        help="keep the result cache and near-duplicate index enabled")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as a regression by --compare")
+    args = parser.parse_args()
+    
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        print(f"{regressions} regressions beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+    
+    if not args.with_cache:
+        config.CACHE_MAX_ENTRIES = 0
+        config.LSH_MAX_ENTRIES = 0
+    
+    results = run_stages(args.sizes, args.messages)
+    if not args.skip_http:
+        results += asyncio.run(run_http(args.sizes, args.requests))
+    
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'args': vars(args), 'results': results}, f, indent=2)
+        print(f"Saved {len(results)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import os
 import subprocess
 import threading
@@ -44,7 +45,13 @@ def run_frontend():
         print(f"Error starting frontend server: {e}")
         return None
 
-def run_backend():
+def backend_command(workers):
+    """Command line of the backend: auto-reloading dev server, or forked workers sharing one model"""
+    if workers > 0:
+        return [sys.executable, "-m", "app.serve", "--host", "0.0.0.0", "--port", "8000", "--workers", str(workers)]
+    return ["uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000", "--reload"]
+
+def run_backend(workers=0):
     """Run the backend FastAPI server"""
     try:
         print("Starting backend server...")
@@ -63,7 +70,7 @@ def run_backend():
         
         # Run the FastAPI server
         backend_process = subprocess.Popen(
-            ["uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000", "--reload"],
+            backend_command(workers),
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             universal_newlines=True
@@ -87,13 +94,19 @@ def run_backend():
 
 def main():
     """Main function to run both servers"""
+    parser = argparse.ArgumentParser(description="Run the SpamDetector frontend and backend")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="serve the backend from this many forked workers sharing one model "
+                             "(production mode; default: single auto-reloading dev server)")
+    args = parser.parse_args()
+    
     print("\n===== SpamDetector Application =====\n")
     
     # Create a flag to track if servers started successfully
     servers_started = True
     
     # Start the backend server in a separate thread
-    backend_thread = threading.Thread(target=run_backend)
+    backend_thread = threading.Thread(target=run_backend, args=(args.workers,))
     backend_thread.daemon = True
     backend_thread.start()
     